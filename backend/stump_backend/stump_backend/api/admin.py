@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Sample
+from .models import Candidate, Job, Race, Sample
 
 # Register your models here.
 
@@ -8,4 +8,27 @@ class SampleAdmin(admin.ModelAdmin):
     list_display = ('title', 'description')
 
 
+class RaceAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name')
+
+
+class CandidateAdmin(admin.ModelAdmin):
+    list_display = ('last_name', 'first_name', 'race', 'modified_date')
+    list_select_related = ('race',)
+    search_fields = ('name_text', 'last_name')
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'name')
+
+
 admin.site.register(Sample, SampleAdmin)
+admin.site.register(Race, RaceAdmin)
+admin.site.register(Candidate, CandidateAdmin)
+admin.site.register(Job, JobAdmin)
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from . import signals, tasks  # noqa: F401
+        if settings.API_WARMUP_ON_START:
+            from . import warmup
+            warmup.warm_up_in_background()
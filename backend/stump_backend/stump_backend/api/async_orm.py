@@ -0,0 +1,28 @@
+"""
+Async queryset helpers.
+
+Django 4.1+ evaluates querysets natively from async code; on older versions
+the query runs in the thread that sync_to_async keeps for database access.
+"""
+import django
+from asgiref.sync import sync_to_async
+
+
+ASYNC_ORM = django.VERSION >= (4, 1)
+
+
+async def alist(queryset):
+    """
+    Evaluate ``queryset`` into a list.
+    """
+    if ASYNC_ORM:
+        return [_ async for _ in queryset]
+    return await sync_to_async(list)(queryset)
+
+
+async def afirst(queryset):
+    """
+    Return the first row of ``queryset`` (as sliced, not ordered), or None.
+    """
+    rows = await alist(queryset[:1])
+    return rows[0] if rows else None
@@ -0,0 +1,288 @@
+"""
+Async versions of the read endpoints, for the ASGI deployment.
+
+When ``API_ASYNC_VIEWS`` is on, ``api.urls`` routes the sample, candidate and
+somedata URLs here. Plain JSON reads are answered on the event loop, with
+database access through the async ORM, so a slow client does not hold a
+thread. Every other request (writes, the browsable API, exports, error
+responses) is handed to the regular DRF view, which runs in a worker thread.
+
+Cache and throttle calls can block on the network (Redis, memcached), and
+loading and rendering the candidates blocks on files and locks, so they run
+in threads, never on the event loop. Token bucket throttles run
+before the handler; the views' other throttles only apply to the requests
+handed to DRF.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import HttpResponse
+from django.urls import URLPattern
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.request import Request
+
+from . import views
+from .async_orm import afirst
+from .cache import await_entry, get_cache, in_thread, release_fill_lock, response_cache_key
+from .coalesce import AsyncSingleFlight
+from .models import Sample
+from .renderers import FastJSONRenderer
+from .serializers import ValuesSerializer
+from .throttling import TokenBucketThrottle
+
+
+negotiator = DefaultContentNegotiation()
+flight = AsyncSingleFlight()
+
+
+def negotiate_json(request):
+    """
+    Return ``request`` wrapped for DRF and the negotiated media type if the
+    client wants JSON, or (None, None) otherwise.
+    """
+    drf_request = Request(request)
+    try:
+        renderer, media_type = negotiator.select_renderer(
+            drf_request, [FastJSONRenderer(), BrowsableAPIRenderer()])
+    except APIException:
+        return None, None
+    if renderer.format != 'json':
+        return None, None
+    return drf_request, media_type
+
+
+def json_response(content, status=200):
+    response = HttpResponse(content, content_type=FastJSONRenderer.media_type, status=status)
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def not_found():
+    return json_response(FastJSONRenderer().render({'detail': 'Not found.'}), status=404)
+
+
+def throttled(request, throttle_classes):
+    """
+    Run the token bucket throttles among ``throttle_classes`` for ``request``
+    and return a 429 response if one refuses it, or None.
+
+    The throttles' scopes are recorded on the request, so that the DRF view
+    does not count it again if it ends up serving it.
+    """
+    drf_request = Request(request)
+    waits = []
+    request.counted_throttle_scopes = set()
+    for throttle_class in throttle_classes:
+        if not issubclass(throttle_class, TokenBucketThrottle):
+            continue
+        throttle = throttle_class()
+        if not throttle.allow_request(drf_request, None):
+            waits.append(throttle.wait())
+        request.counted_throttle_scopes.add(throttle.scope)
+    if not waits:
+        return None
+    exc = Throttled(max(waits))
+    response = json_response(FastJSONRenderer().render({'detail': exc.detail}), status=exc.status_code)
+    response['Retry-After'] = '%d' % exc.wait
+    return response
+
+
+def async_read_view(handler, drf_view):
+    """
+    Return an async view serving GET requests with the ``handler`` coroutine.
+
+    ``handler`` returns None for requests it leaves to ``drf_view``; those,
+    and all other methods, are served by ``drf_view`` in a thread.
+    """
+    delegate = sync_to_async(drf_view)
+    throttle = in_thread(throttled)
+    throttle_classes = getattr(getattr(drf_view, 'cls', None), 'throttle_classes', ())
+
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET':
+            response = await throttle(request, throttle_classes)
+            if response is not None:
+                return response
+            response = await handler(request, *args, **kwargs)
+            if response is not None:
+                return response
+        return await delegate(request, *args, **kwargs)
+
+    # DRF views are exempt and do their own authentication.
+    view.csrf_exempt = True
+    view.__name__ = handler.__name__
+    view.__doc__ = handler.__doc__
+    return view
+
+
+def async_urlpatterns(urlpatterns):
+    """
+    Return ``urlpatterns`` with the views named in ``HANDLERS`` replaced by
+    their async versions, keeping every route and its order.
+    """
+    patterns = []
+    for pattern in urlpatterns:
+        handler = HANDLERS.get(pattern.name)
+        if handler is not None:
+            pattern = URLPattern(pattern.pattern, async_read_view(handler, pattern.callback),
+                                 pattern.default_args, pattern.name)
+        patterns.append(pattern)
+    return patterns
+
+
+async def somedata(request):
+    drf_request, _ = negotiate_json(request)
+    if drf_request is None:
+        return None
+    return json_response(FastJSONRenderer().render(views.SomeDataView.get_data()))
+
+
+async def rendered_candidates(key, render):
+    """
+    Return ``render()``, run in a thread: loading the store and rendering
+    block, on the data file and on other threads rendering the same payload.
+    Concurrent calls for one ``key`` share a thread.
+    """
+    payload, _ = await flight.do(('candidates', key), in_thread(render))
+    return payload
+
+
+async def candidate_list(request):
+    drf_request, _ = negotiate_json(request)
+    if drf_request is None or drf_request.query_params:
+        return None
+    payload = await rendered_candidates(
+        None, lambda: views.BoulderCandidatesViewSet.load_store().rendered_list())
+    return payload.response(request)
+
+
+async def candidate_detail(request, pk):
+    drf_request, _ = negotiate_json(request)
+    if drf_request is None or drf_request.query_params:
+        return None
+    payload = await rendered_candidates(
+        pk, lambda: views.BoulderCandidatesViewSet.load_store().rendered(pk))
+    if payload is None:
+        return not_found()
+    return payload.response(request)
+
+
+SAMPLE_BASENAME = 'sample'
+
+
+def sample_view(drf_request, action, **kwargs):
+    """
+    Return a SampleViewSet set up for ``drf_request`` without dispatching it,
+    to reuse its queryset, sparse fieldset and pagination settings.
+    """
+    view = views.SampleViewSet(request=drf_request, action=action, args=(), kwargs=kwargs, format_kwarg=None)
+    view.basename = SAMPLE_BASENAME
+    return view
+
+
+async def cached_read(drf_request, media_type, compute):
+    """
+    Return the cached response for ``drf_request``, or build it with the
+    ``compute`` coroutine and cache it. Entries are shared with the sync views,
+    and so are the fill locks: concurrent misses are computed once (see
+    ``api.cache``).
+    """
+    cache = get_cache()
+
+    def lookup():
+        key = response_cache_key(SAMPLE_BASENAME, (Sample,), drf_request.build_absolute_uri(), media_type)
+        return key, cache.get(key)
+
+    def store(key, entry, locked):
+        try:
+            if entry is not None:
+                cache.set(key, entry, settings.API_CACHE_TIMEOUT)
+        finally:
+            if locked:
+                release_fill_lock(key)
+
+    key, hit = await in_thread(lookup)()
+    if hit is None:
+        async def fill():
+            entry, locked = await await_entry(key)
+            if entry is not None:
+                return entry, None
+            entry = None
+            try:
+                response = await compute()
+                if response is None or response.status_code != 200:
+                    return None, response
+                entry = (response.content, response['Content-Type'])
+                return entry, response
+            finally:
+                await in_thread(store)(key, entry, locked)
+
+        (hit, response), shared = await flight.do(key, fill, settings.API_CACHE_FILL_TIMEOUT)
+        if not shared and response is not None:
+            return response
+        if hit is None:
+            # The request this one waited for was not cacheable.
+            return await compute()
+    content, content_type = hit
+    return json_response(content)
+
+
+async def sample_list(request):
+    drf_request, media_type = negotiate_json(request)
+    if drf_request is None:
+        return None
+    view = sample_view(drf_request, 'list')
+    try:
+        fields = view.get_sparse_fields()
+    except APIException:
+        return None
+    fast = ValuesSerializer.for_serializer(view.get_serializer_class(), fields)
+    if fast is None:
+        return None
+
+    async def compute():
+        paginator = view.paginator
+        queryset = fast.values(view.filter_queryset(view.get_queryset()), *view.get_pagination_keys())
+        page = await paginator.apaginate_queryset(queryset, drf_request, view=view)
+        data = paginator.get_paginated_response(fast.to_representation(page)).data
+        return json_response(FastJSONRenderer().render(data))
+
+    return await cached_read(drf_request, media_type, compute)
+
+
+async def sample_detail(request, pk):
+    drf_request, media_type = negotiate_json(request)
+    if drf_request is None:
+        return None
+    view = sample_view(drf_request, 'retrieve', pk=pk)
+    try:
+        fields = view.get_sparse_fields()
+    except APIException:
+        return None
+    fast = ValuesSerializer.for_serializer(view.get_serializer_class(), fields)
+    if fast is None:
+        return None
+
+    async def compute():
+        try:
+            row = await afirst(fast.values(view.get_queryset().filter(pk=pk)))
+        except (TypeError, ValueError, DjangoValidationError):
+            row = None
+        if row is None:
+            return not_found()
+        return json_response(FastJSONRenderer().render(fast.to_representation([row])[0]))
+
+    return await cached_read(drf_request, media_type, compute)
+
+
+# Route name -> async handler
+HANDLERS = {
+    'somedata': somedata,
+    'candidate-list': candidate_list,
+    'candidate-detail': candidate_detail,
+    'sample-list': sample_list,
+    'sample-detail': sample_detail,
+}
@@ -0,0 +1,229 @@
+"""
+Response cache for the API.
+
+Entries live in the ``API_CACHE_ALIAS`` cache and are namespaced by a
+generation number per model. Writing a model bumps its generation (see
+``api.signals``), which makes every entry built from the old data unreachable
+at once, in every worker sharing the cache backend, without having to know
+which keys were stored.
+
+Concurrent misses for one entry are computed once: within a process the
+other requests wait for the first one (see ``api.coalesce``), and across
+processes a fill lock in the cache makes the other workers wait for the entry
+to appear, for up to API_CACHE_FILL_TIMEOUT seconds.
+"""
+import asyncio
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+from .coalesce import SingleFlight
+
+
+# How often a worker waiting for another one to fill an entry checks for it.
+FILL_POLL_INTERVAL = 0.05
+
+flight = SingleFlight()
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def is_shared():
+    """
+    Whether the API cache is shared by the processes, so that what one of
+    them stores is found by the others.
+    """
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def in_thread(func):
+    """
+    Wrap the blocking ``func``, a cache call for instance, to be awaited from
+    async code without blocking the event loop.
+    """
+    # The cache backends are safe to use from any thread.
+    return sync_to_async(func, thread_sensitive=False)
+
+
+def _generation_key(model):
+    return 'generation:{}'.format(model._meta.label_lower)
+
+
+def get_generation(model):
+    """
+    Return the current cache generation of ``model``.
+    """
+    cache = get_cache()
+    key = _generation_key(model)
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock rather than 1, so a generation evicted from the
+        # cache can never come back with a value old entries were stored under.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def invalidate(model):
+    """
+    Make every cached entry built from ``model`` unreachable.
+    """
+    cache = get_cache()
+    try:
+        cache.incr(_generation_key(model))
+    except ValueError:
+        get_generation(model)
+
+
+def response_cache_key(basename, models, uri, media_type):
+    """
+    Return the cache key of the response for ``uri`` rendered as
+    ``media_type`` by the views registered under ``basename``.
+    """
+    generations = '.'.join(str(get_generation(_)) for _ in models)
+    digest = hashlib.md5('{} {}'.format(uri, media_type).encode()).hexdigest()
+    return 'response:{}:{}:{}'.format(basename, generations, digest)
+
+
+def _fill_lock_key(key):
+    return 'fill:' + key
+
+
+def acquire_fill_lock(key):
+    """
+    Take the lock for computing entry ``key``; return (entry, locked). The
+    entry is returned instead if it is already there.
+    """
+    cache = get_cache()
+    if not cache.add(_fill_lock_key(key), 1, settings.API_CACHE_FILL_TIMEOUT):
+        return cache.get(key), False
+    # It may have been stored between the miss and taking the lock.
+    entry = cache.get(key)
+    if entry is not None:
+        release_fill_lock(key)
+    return entry, entry is None
+
+
+def release_fill_lock(key):
+    get_cache().delete(_fill_lock_key(key))
+
+
+def wait_for_entry(key):
+    """
+    Return (entry, locked): entry ``key`` once another process has stored
+    it, or (None, True) once this process holds the fill lock, e.g. because
+    the other one failed. Gives up with (None, False) after
+    API_CACHE_FILL_TIMEOUT seconds.
+    """
+    deadline = time.monotonic() + settings.API_CACHE_FILL_TIMEOUT
+    while True:
+        entry, locked = acquire_fill_lock(key)
+        if entry is not None or locked or time.monotonic() >= deadline:
+            return entry, locked
+        time.sleep(FILL_POLL_INTERVAL)
+
+
+async def await_entry(key):
+    """
+    Like ``wait_for_entry``, without blocking the event loop.
+    """
+    deadline = time.monotonic() + settings.API_CACHE_FILL_TIMEOUT
+    while True:
+        entry, locked = await in_thread(acquire_fill_lock)(key)
+        if entry is not None or locked or time.monotonic() >= deadline:
+            return entry, locked
+        await asyncio.sleep(FILL_POLL_INTERVAL)
+
+
+class CachedResponseMixin:
+    """
+    Caches the rendered responses of ``list`` and ``retrieve``.
+
+    Responses are keyed by URL and negotiated media type, and namespaced by the
+    generation of each model in ``cache_models`` (the queryset model by
+    default). Browsable API pages and streaming responses are not cached.
+
+    On a miss the response is rendered right away, so that the requests
+    coalesced with this one can be answered from it.
+    """
+    cache_actions = ('list', 'retrieve')
+    cache_models = None
+    cache_timeout = None
+
+    def get_cache_models(self):
+        if self.cache_models is not None:
+            return self.cache_models
+        return (self.get_queryset().model,)
+
+    def get_cache_timeout(self):
+        if self.cache_timeout is not None:
+            return self.cache_timeout
+        return settings.API_CACHE_TIMEOUT
+
+    def get_response_cache_key(self, request):
+        """
+        Return the cache key for ``request``, or None if it is not cacheable.
+        """
+        if request.method != 'GET' or self.action not in self.cache_actions:
+            return None
+        renderer = getattr(request, 'accepted_renderer', None)
+        if renderer is None or renderer.format == 'api' or hasattr(renderer, 'stream'):
+            return None
+        return response_cache_key(
+            self.basename, self.get_cache_models(), request.build_absolute_uri(), request.accepted_media_type)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_response_cache_key(request)
+        if key is None:
+            return handler(request, *args, **kwargs)
+
+        cache = get_cache()
+        hit = cache.get(key)
+        if hit is None:
+            (hit, response), shared = flight.do(
+                key, lambda: self.fill_cache(key, handler, request, *args, **kwargs),
+                settings.API_CACHE_FILL_TIMEOUT)
+            if not shared and response is not None:
+                return response
+        if hit is None:
+            # The request this one waited for was not cacheable.
+            return handler(request, *args, **kwargs)
+        content, content_type = hit
+        return HttpResponse(content, content_type=content_type)
+
+    def fill_cache(self, key, handler, request, *args, **kwargs):
+        """
+        Return (entry, response): compute the response for ``key`` and cache
+        it, unless another worker does it first, in which case the response
+        is None.
+        """
+        entry, locked = wait_for_entry(key)
+        if entry is not None:
+            return entry, None
+        try:
+            response = handler(request, *args, **kwargs)
+            if not isinstance(response, Response) or response.status_code != 200:
+                return None, response
+            response = self.finalize_response(request, response, *args, **kwargs)
+            response.render()
+            entry = (response.content, response['Content-Type'])
+            get_cache().set(key, entry, self.get_cache_timeout())
+            return entry, response
+        finally:
+            if locked:
+                release_fill_lock(key)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
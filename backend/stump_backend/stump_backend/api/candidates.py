@@ -0,0 +1,294 @@
+"""
+Read-only candidate store.
+
+Candidate records arrive in the shape of an Elasticsearch ``_msearch``
+response. The store normalizes them once, when it is built, so that list and
+detail requests only have to serialize what is already there.
+"""
+import datetime
+import hashlib
+import json
+from bisect import bisect_left
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .changes import MemoryChangeLog
+from .coalesce import SingleFlight
+from .prerender import RenderedPayload
+from .search import DEFAULT_LIMIT, SearchIndex
+
+
+# Millisecond epoch timestamps that get a parsed ``<attr> X`` companion field.
+DATE_ATTRS = ('Created Date', 'Modified Date')
+
+RACE_ATTR = 'race_custom_race1'
+MODIFIED_ATTR = 'Modified Date'
+PHOTO_ATTR = 'photo_image'
+
+
+class FrozenRecord(dict):
+    """
+    A dict that refuses modification once it has been built.
+
+    Subclassing dict keeps records directly serializable by the JSON renderers.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('{} is immutable'.format(type(self).__name__))
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+
+def normalize_candidate(source, photo_thumbnails=None):
+    """
+    Return a frozen copy of an Elasticsearch ``_source`` document with its
+    timestamps converted to datetimes.
+
+    ``photo_thumbnails``, if given, maps a photo URL to the URLs of its
+    thumbnails (or None), which are added as ``photo_thumbnails``.
+    """
+    record = dict(source)
+    for date_attr in DATE_ATTRS:
+        if record.get(date_attr) is not None:
+            record[date_attr + ' X'] = datetime.datetime.fromtimestamp(record[date_attr] / 1000.0)
+    if photo_thumbnails is not None and record.get(PHOTO_ATTR):
+        thumbnails = photo_thumbnails(record[PHOTO_ATTR])
+        if thumbnails:
+            record['photo_thumbnails'] = thumbnails
+    return FrozenRecord(record)
+
+
+def record_version(candidate):
+    """
+    Version string of a candidate record: its ``_version``, and a digest of
+    its thumbnails, which change without a new ``_version``.
+    """
+    version = str(candidate.get('_version'))
+    thumbnails = candidate.get('photo_thumbnails')
+    if thumbnails:
+        digest = hashlib.sha1(json.dumps(thumbnails, sort_keys=True).encode()).hexdigest()[:8]
+        version = '{}.{}'.format(version, digest)
+    return version
+
+
+def parse_timestamp(value):
+    """
+    Return a millisecond epoch timestamp given as one, or as an ISO 8601
+    datetime (naive ones are in the current time zone), or None if ``value``
+    is neither.
+    """
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        return None
+    if parsed is None:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return int(parsed.timestamp() * 1000)
+
+
+class CandidateStore:
+    """
+    Immutable collection of candidate records indexed by ``_id``.
+
+    ``keys`` holds the ids in sorted order for keyset pagination. ``columns``
+    lists every attribute that appears on at least one record, in order of
+    first appearance, and ``fields`` is the same as a set.
+
+    ``search_version`` identifies the snapshot the records were taken from and,
+    together with each record's ``record_version()``, versions the rendered
+    responses.
+
+    Two secondary indexes back ``filter()``: positions by race, and positions
+    sorted by modification time for range queries.
+
+    Rendered payloads, the search index and the change log are built on first
+    use, once even when concurrent requests need them at the same time.
+    """
+
+    def __init__(self, records, search_version=None):
+        self.candidates = tuple(records)
+        self.search_version = search_version
+        self._by_id = {candidate['_id']: candidate for candidate in self.candidates}
+        self.keys = tuple(sorted(self._by_id))
+        self.columns = tuple(dict.fromkeys(field for candidate in self.candidates for field in candidate))
+        self.fields = frozenset(self.columns)
+        self._rendered_list = None
+        self._rendered = {}
+        self._search_index = None
+        self._change_log = None
+        self._previous_log = None
+        self._by_race = {}
+        modified = []
+        for position, candidate in enumerate(self.candidates):
+            self._by_race.setdefault(candidate.get(RACE_ATTR), []).append(position)
+            if candidate.get(MODIFIED_ATTR) is not None:
+                modified.append((candidate[MODIFIED_ATTR], position))
+        modified.sort()
+        self._modified_times = [_[0] for _ in modified]
+        self._modified_positions = [_[1] for _ in modified]
+        self._races = {}
+        self._flight = SingleFlight()
+
+    @classmethod
+    def from_es_response(cls, data, photo_thumbnails=None):
+        response = data['responses'][0]
+        hits = response['hits']['hits']
+        return cls((normalize_candidate(hit['_source'], photo_thumbnails) for hit in hits),
+                   search_version=response.get('search_version'))
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def __iter__(self):
+        return iter(self.candidates)
+
+    def get(self, candidate_id):
+        """
+        Return the candidate with the given ``_id``, or None.
+        """
+        return self._by_id.get(candidate_id)
+
+    @property
+    def races(self):
+        """
+        The race ids of the candidates.
+        """
+        return frozenset(_ for _ in self._by_race if _ is not None)
+
+    def for_race(self, race):
+        """
+        Return the store of the candidates in ``race``.
+
+        The stores of known races are kept, along with their rendered responses.
+        """
+        if race not in self._by_race:
+            return self._subset(())
+        store = self._races.get(race)
+        if store is None:
+            store = self._subset(self._by_race[race])
+            self._races[race] = store
+        return store
+
+    def modified_since(self, timestamp):
+        """
+        Return the store of the candidates modified at or after ``timestamp``,
+        in milliseconds since the epoch.
+        """
+        start = bisect_left(self._modified_times, timestamp)
+        return self._subset(sorted(self._modified_positions[start:]))
+
+    def filter(self, race=None, modified_since=None):
+        """
+        Return the store of the candidates in ``race`` and modified at or
+        after ``modified_since``; either may be None.
+        """
+        store = self if race is None else self.for_race(race)
+        if modified_since is not None:
+            store = store.modified_since(modified_since)
+        return store
+
+    def _build_once(self, key, get, build):
+        """
+        Return ``get()``, or the result of ``build()`` if that is None.
+        Concurrent callers for the same ``key`` share one build.
+        """
+        def fill():
+            value = get()
+            return build() if value is None else value
+
+        value = get()
+        if value is None:
+            value, _ = self._flight.do(key, fill)
+        return value
+
+    def _subset(self, positions):
+        return type(self)((self.candidates[_] for _ in positions), search_version=self.search_version)
+
+    @property
+    def version(self):
+        """
+        Version string covering every record in the store.
+        """
+        digest = hashlib.sha1()
+        for candidate in self.candidates:
+            digest.update('{}:{};'.format(candidate['_id'], record_version(candidate)).encode())
+        return '{}-{}'.format(self.search_version, digest.hexdigest()[:16])
+
+    @property
+    def search_index(self):
+        """
+        Name search index over the store, built on first use.
+        """
+        def build():
+            self._search_index = SearchIndex(self.candidates)
+            return self._search_index
+        return self._build_once('search_index', lambda: self._search_index, build)
+
+    def search(self, query, limit=DEFAULT_LIMIT, modified_since=None):
+        """
+        Return up to ``limit`` candidates matching ``query``, only those
+        modified at or after ``modified_since`` if given.
+
+        The results of this store's index are filtered rather than searched
+        in ``modified_since()``'s store, whose index would be built for
+        every timestamp.
+        """
+        where = None
+        if modified_since is not None:
+            def where(candidate):
+                modified = candidate.get(MODIFIED_ATTR)
+                return modified is not None and modified >= modified_since
+        return self.search_index.search(query, limit, where=where)
+
+    def follow(self, previous):
+        """
+        Continue the change log of ``previous``, the store this one replaces.
+        """
+        self._previous_log = previous.change_log
+
+    @property
+    def change_log(self):
+        """
+        Change log creating every candidate, in order of modification, whose
+        snapshot is the store's version; or, for a store that follows
+        another, that store's log continued with the changes between the two.
+        """
+        def build():
+            if self._previous_log is None:
+                self._change_log = MemoryChangeLog.from_records(self.candidates, self.version)
+            else:
+                self._change_log = self._previous_log.updated(self.candidates, self.version)
+                self._previous_log = None
+            return self._change_log
+        return self._build_once('change_log', lambda: self._change_log, build)
+
+    def rendered_list(self):
+        """
+        Return the pre-rendered payload of every candidate.
+        """
+        def build():
+            self._rendered_list = RenderedPayload(self.candidates, self.version)
+            return self._rendered_list
+        return self._build_once('rendered_list', lambda: self._rendered_list, build)
+
+    def rendered(self, candidate_id):
+        """
+        Return the pre-rendered payload of one candidate, or None.
+        """
+        candidate = self.get(candidate_id)
+        if candidate is None:
+            return None
+
+        def build():
+            payload = RenderedPayload(candidate, '{}-{}'.format(candidate_id, record_version(candidate)))
+            self._rendered[candidate_id] = payload
+            return payload
+        return self._build_once(('rendered', candidate_id), lambda: self._rendered.get(candidate_id), build)
+
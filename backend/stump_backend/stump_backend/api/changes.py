@@ -0,0 +1,189 @@
+"""
+Append-only change logs for incremental sync.
+
+Every candidate write is logged as an entry with a sequence number that only
+grows. A client keeps the ``version`` of its last sync and asks for the
+entries after it, so polling costs in proportion to what changed rather than
+to the size of the data.
+
+A log built from snapshots of the data names them in its versions too
+(``<snapshot>:<seq>``). When the data is replaced, the log is continued with
+the difference between the two snapshots, so clients get the records that
+changed and the ones that were dropped, and versions handed out before stay
+valid. Versions of a log that was built differently, e.g. by a process that
+started with other data, are refused, and the client reloads the whole list.
+"""
+import hashlib
+import json
+import threading
+from bisect import bisect_right
+
+from .models import CandidateChange
+
+
+UPSERT = CandidateChange.UPSERT
+DELETE = CandidateChange.DELETE
+
+
+def entry(seq, op, candidate_id, version, record=None):
+    return {'seq': seq, 'op': op, 'id': candidate_id, '_version': version, 'record': record}
+
+
+class ChangeLog:
+    """
+    Base class for change logs.
+
+    ``latest`` is the sequence number of the newest entry, 0 for an empty log,
+    and ``after(seq, limit)`` returns up to ``limit`` entries following ``seq``
+    in order.
+
+    ``snapshot`` identifies the data the log was built from, None for a log
+    that is never rebuilt.
+    """
+    snapshot = None
+
+    @property
+    def latest(self):
+        raise NotImplementedError('ChangeLog class requires .latest to be implemented')
+
+    def after(self, seq, limit):
+        raise NotImplementedError('ChangeLog class requires .after() to be implemented')
+
+    def format_version(self, seq):
+        """
+        Return the version handed to clients for ``seq``.
+        """
+        if self.snapshot is None:
+            return str(seq)
+        return '{}:{}'.format(self.snapshot, seq)
+
+    def parse_version(self, version):
+        """
+        Return the sequence number of ``version``, or None if it is not a
+        version of this log. ``'0'`` starts any log. Raise ValueError if
+        ``version`` is not a version at all.
+        """
+        snapshot, _, seq = version.rpartition(':')
+        seq = int(seq)
+        if seq < 0:
+            raise ValueError('Negative sequence number')
+        if seq and seq > self.latest_of(snapshot or None):
+            return None
+        return seq
+
+    def latest_of(self, snapshot):
+        """
+        Return the sequence number of the newest entry written while the log
+        was at ``snapshot``, or -1 if it never was.
+        """
+        return self.latest if snapshot == self.snapshot else -1
+
+
+def by_modification(records):
+    return sorted(records, key=lambda _: (_.get('Modified Date') or 0, _['_id']))
+
+
+class MemoryChangeLog(ChangeLog):
+    """
+    Change log held in memory, numbered from 1.
+
+    ``records`` maps the id of every record the log has not deleted to the
+    record as it was last logged.
+    """
+
+    def __init__(self, snapshot=None):
+        self.snapshot = snapshot
+        self.records = {}
+        self._entries = []
+        self._seqs = []
+        # Snapshot -> latest sequence number, for the snapshots the log left
+        self._previous = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_records(cls, records, snapshot=None):
+        """
+        Return a log of ``snapshot`` that creates ``records`` in order of
+        modification.
+        """
+        log = cls(snapshot)
+        for record in by_modification(records):
+            log.append(UPSERT, record['_id'], record.get('_version'), record)
+        return log
+
+    def updated(self, records, snapshot):
+        """
+        Return a copy of the log continued to ``records``, a new snapshot of
+        the data: an upsert for every record that is new or differs from the
+        one in the log, in order of modification, then a delete for every
+        record missing from ``records``.
+
+        The new log's snapshot is derived from this one's and ``snapshot``, so
+        that logs continued through the same snapshots agree on their
+        versions. It stays the same if nothing changed.
+        """
+        with self._lock:
+            log = type(self)(self.snapshot)
+            log.records = dict(self.records)
+            log._entries = list(self._entries)
+            log._seqs = list(self._seqs)
+            log._previous = dict(self._previous)
+        latest = log.latest
+        ids = set()
+        for record in by_modification(records):
+            ids.add(record['_id'])
+            if log.records.get(record['_id']) != record:
+                log.append(UPSERT, record['_id'], record.get('_version'), record)
+        for candidate_id in sorted(set(log.records) - ids):
+            log.append(DELETE, candidate_id, (log.records[candidate_id] or {}).get('_version'))
+        if log.latest != latest:
+            log._previous[log.snapshot] = latest
+            digest = hashlib.sha1('{}>{}'.format(log.snapshot, snapshot).encode()).hexdigest()[:16]
+            log.snapshot = digest
+        return log
+
+    @property
+    def latest(self):
+        return self._seqs[-1] if self._seqs else 0
+
+    def latest_of(self, snapshot):
+        if snapshot == self.snapshot:
+            return self.latest
+        return self._previous.get(snapshot, -1)
+
+    def append(self, op, candidate_id, version, record=None):
+        with self._lock:
+            seq = self.latest + 1
+            self._entries.append(entry(seq, op, candidate_id, version, record if op == UPSERT else None))
+            self._seqs.append(seq)
+            if op == UPSERT:
+                self.records[candidate_id] = record
+            else:
+                self.records.pop(candidate_id, None)
+        return seq
+
+    def after(self, seq, limit):
+        start = bisect_right(self._seqs, seq)
+        return self._entries[start:start + limit]
+
+
+class ModelChangeLog(ChangeLog):
+    """
+    Change log read from the CandidateChange table, where sequence numbers are
+    row ids.
+
+    Ids are handed out at insert time, so a transaction that commits after a
+    later one can add an entry below a version a client has already seen;
+    writes to candidates should stay short.
+    """
+
+    @property
+    def latest(self):
+        return CandidateChange.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+    def after(self, seq, limit):
+        rows = CandidateChange.objects.filter(pk__gt=seq).order_by('pk')[:limit]
+        return [
+            entry(row.pk, row.op, row.candidate_id, row.version, json.loads(row.data) if row.data else None)
+            for row in rows
+        ]
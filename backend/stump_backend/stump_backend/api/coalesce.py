@@ -0,0 +1,106 @@
+"""
+Request coalescing ("single flight").
+
+When a cached response expires under load, every request for it would
+recompute it at once. ``SingleFlight.do(key, func)`` lets the first caller
+for a key run ``func`` while concurrent callers for the same key wait for its
+result instead of repeating the work. ``AsyncSingleFlight`` does the same for
+coroutines on one event loop.
+
+Both only coalesce within a process; ``api.cache`` adds a lock in the shared
+cache to extend this to every worker.
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls by key, across threads.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, timeout=None):
+        """
+        Return (result, shared): the result of ``func()``, and whether it came
+        from a call made by another thread.
+
+        A caller that finds a call for ``key`` in flight waits for it and gets
+        its result, or its exception. If the call takes more than ``timeout``
+        seconds the caller stops waiting and runs ``func`` itself.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if call.done.wait(timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.result, True
+            return func(), False
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class AsyncSingleFlight:
+    """
+    Coalesce concurrent coroutine calls by key, on one event loop.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func, timeout=None):
+        """
+        Return (result, shared) for ``await func()``, like ``SingleFlight.do``.
+        """
+        loop = asyncio.get_event_loop()
+        call_key = (id(loop), key)
+        future = self._calls.get(call_key)
+        if future is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout), True
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            return await func(), False
+        future = self._calls[call_key] = loop.create_future()
+        try:
+            result = await func()
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the exception; don't warn when there are none.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._calls[call_key]
+            if not future.done():
+                # Cancelled: let the waiters compute it themselves.
+                future.cancel()
+        return result, False
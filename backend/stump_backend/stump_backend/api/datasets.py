@@ -0,0 +1,186 @@
+"""
+Registry of the jurisdiction datasets served by the API.
+
+Datasets are data files (JSON, or msgpack when it is installed) in
+``api/sample_data``, registered by file name. Nothing is read until a dataset
+is first used, so importing the API costs the same however many jurisdictions
+ship with it. Files are memory-mapped and handed to the parser without an
+extra copy.
+
+Under ``gunicorn --preload`` the master loads every dataset before forking
+(see ``gunicorn.conf.py``), and the workers share the parsed data
+copy-on-write.
+
+A loaded dataset whose file is replaced is read again, at most
+``RELOAD_INTERVAL`` seconds later, while requests keep being served from the
+previous data. A new candidate store continues the change log of the one it
+replaces.
+"""
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+
+from . import thumbnails
+from .candidates import CandidateStore
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; .msgpack files need it
+    msgpack = None
+
+
+DATASETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_data')
+
+# Seconds between checks of a loaded dataset's file for changes
+RELOAD_INTERVAL = 10
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_json(buffer):
+    if orjson is not None:
+        return orjson.loads(buffer)
+    return json.loads(bytes(buffer).decode('utf-8'))
+
+
+def _parse_msgpack(buffer):
+    return msgpack.unpackb(buffer, raw=False)
+
+
+PARSERS = {'.json': _parse_json}
+if msgpack is not None:
+    PARSERS['.msgpack'] = _parse_msgpack
+
+
+def read_data_file(path):
+    """
+    Parse a JSON or msgpack data file.
+    """
+    parse = PARSERS[os.path.splitext(path)[1]]
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return parse(b'')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                return parse(view)
+            finally:
+                view.release()
+
+
+def build_candidate_store(data):
+    """
+    Return the CandidateStore of an Elasticsearch ``_msearch`` response, with
+    the photo thumbnails generated so far.
+    """
+    return CandidateStore.from_es_response(data, photo_thumbnails=thumbnails.photo_thumbnails())
+
+
+class Dataset:
+    """
+    A data file and the object built from it on first access.
+
+    ``build`` turns the parsed file into the served object; by default the
+    file holds an Elasticsearch ``_msearch`` response of candidates.
+    """
+
+    def __init__(self, name, path, build=build_candidate_store):
+        self.name = name
+        self.path = path
+        self.build = build
+        self._value = None
+        self._mtime = None
+        self._next_check = 0
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._value is not None
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._load()
+        elif time.monotonic() >= self._next_check and self._lock.acquire(blocking=False):
+            # Other threads keep the current value meanwhile.
+            try:
+                if time.monotonic() >= self._next_check:
+                    self._reload()
+            finally:
+                self._lock.release()
+        return self._value
+
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        value = self.build(read_data_file(self.path))
+        if self._value is not None and hasattr(value, 'follow'):
+            value.follow(self._value)
+        self._value, self._mtime = value, mtime
+        self._next_check = time.monotonic() + RELOAD_INTERVAL
+
+    def _reload(self):
+        try:
+            if os.stat(self.path).st_mtime_ns != self._mtime:
+                self._load()
+        except Exception:
+            logger.exception('Reloading dataset %s failed; keeping the previous data', self.name)
+        self._next_check = time.monotonic() + RELOAD_INTERVAL
+
+
+class DatasetRegistry:
+
+    def __init__(self):
+        self._datasets = {}
+
+    def register(self, dataset):
+        if dataset.name in self._datasets:
+            raise ValueError('Duplicate dataset {}'.format(dataset.name))
+        self._datasets[dataset.name] = dataset
+        return dataset
+
+    def unregister(self, name):
+        return self._datasets.pop(name)
+
+    def discover(self, directory):
+        """
+        Register every data file in ``directory`` under its base name.
+        """
+        for filename in sorted(os.listdir(directory)):
+            name, extension = os.path.splitext(filename)
+            if extension in PARSERS:
+                self.register(Dataset(name, os.path.join(directory, filename)))
+
+    def names(self):
+        return sorted(self._datasets)
+
+    def __contains__(self, name):
+        return name in self._datasets
+
+    def __getitem__(self, name):
+        return self._datasets[name]
+
+    def get(self, name):
+        """
+        Return the loaded object of dataset ``name``.
+        """
+        return self._datasets[name].get()
+
+    def preload(self):
+        """
+        Load every dataset now, e.g. before forking workers.
+        """
+        for name in self.names():
+            self.get(name)
+
+
+registry = DatasetRegistry()
+registry.discover(DATASETS_DIR)
@@ -0,0 +1,236 @@
+"""
+Electoral districts and the point lookups behind the ballot endpoint.
+
+Districts are the features of a GeoJSON FeatureCollection (API_DISTRICTS_FILE)
+whose properties give their ``id``, ``name`` and the ids of the ``races`` on
+their ballot. Geometries are Polygons or MultiPolygons in longitude and
+latitude, holes included.
+
+``DistrictIndex`` keeps the districts in memory behind a uniform grid: each
+cell lists the districts whose bounding box overlaps it, so a lookup only
+tests the point against the few polygons near it. ``lookup_many`` handles
+many points at once, vectorized over the points with numpy when it is
+installed.
+"""
+import math
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .datasets import Dataset
+
+try:
+    import numpy
+except ImportError:  # numpy is optional; batch lookups then test one point at a time
+    numpy = None
+
+
+# Points tested per numpy operation in batch lookups, bounding memory use.
+BATCH_CHUNK_SIZE = 4096
+
+
+def contains(rings, x, y):
+    """
+    Whether (x, y) is inside the polygon made of ``rings``, holes included
+    (even-odd rule).
+    """
+    inside = False
+    for ring in rings:
+        x1, y1 = ring[-1]
+        for x2, y2 in ring:
+            if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+                inside = not inside
+            x1, y1 = x2, y2
+    return inside
+
+
+def contains_many(rings, xy):
+    """
+    Vectorized ``contains``: a boolean array telling which of the points in
+    the (n, 2) array ``xy`` are inside the polygon.
+    """
+    x = xy[:, 0:1]
+    y = xy[:, 1:2]
+    crossings = numpy.zeros(len(xy), dtype=numpy.int64)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        for ring in rings:
+            x1, y1 = numpy.roll(ring, 1, axis=0).T
+            x2, y2 = ring.T
+            # One row per point, one column per edge
+            crossing = ((y1 > y) != (y2 > y)) & (x < (x2 - x1) * (y - y1) / (y2 - y1) + x1)
+            crossings += crossing.sum(axis=1)
+    return crossings % 2 == 1
+
+
+class District:
+    """
+    A district's id, name, races and polygons, each a list of rings of
+    (x, y) points.
+    """
+    __slots__ = ('id', 'name', 'races', 'polygons', 'bbox', '_arrays')
+
+    def __init__(self, id, name, races, polygons):
+        self.id = id
+        self.name = name
+        self.races = tuple(races)
+        self.polygons = polygons
+        points = [point for polygon in polygons for ring in polygon for point in ring]
+        self.bbox = (
+            min(_[0] for _ in points), min(_[1] for _ in points),
+            max(_[0] for _ in points), max(_[1] for _ in points),
+        )
+        self._arrays = None
+        if numpy is not None:
+            self._arrays = [[numpy.array(ring, dtype=float) for ring in polygon] for polygon in polygons]
+
+    @classmethod
+    def from_feature(cls, feature):
+        properties = feature.get('properties') or {}
+        geometry = feature['geometry']
+        if geometry['type'] == 'Polygon':
+            coordinates = [geometry['coordinates']]
+        elif geometry['type'] == 'MultiPolygon':
+            coordinates = geometry['coordinates']
+        else:
+            raise ValueError('Unsupported geometry type {}'.format(geometry['type']))
+        polygons = [
+            # GeoJSON rings repeat their first point last; contains() closes them.
+            [tuple((float(_[0]), float(_[1])) for _ in ring[:-1]) for ring in polygon]
+            for polygon in coordinates
+        ]
+        return cls(properties['id'], properties.get('name', ''), properties.get('races', ()), polygons)
+
+    def in_bbox(self, x, y):
+        min_x, min_y, max_x, max_y = self.bbox
+        return min_x <= x <= max_x and min_y <= y <= max_y
+
+    def contains(self, x, y):
+        return self.in_bbox(x, y) and any(contains(polygon, x, y) for polygon in self.polygons)
+
+    def contains_many(self, xy):
+        min_x, min_y, max_x, max_y = self.bbox
+        inside = (xy[:, 0] >= min_x) & (xy[:, 0] <= max_x) & (xy[:, 1] >= min_y) & (xy[:, 1] <= max_y)
+        candidates = numpy.flatnonzero(inside)
+        inside[:] = False
+        for polygon in self._arrays:
+            inside[candidates] |= contains_many(polygon, xy[candidates])
+        return inside
+
+
+class DistrictIndex:
+    """
+    Grid index over districts.
+
+    The grid covers the bounding box of every district with ``size`` cells
+    per side (by default about two per district along each axis, up to 256).
+    """
+
+    def __init__(self, districts, size=None):
+        self.districts = tuple(districts)
+        self._by_id = {_.id: _ for _ in self.districts}
+        if not self.districts:
+            self.bounds = None
+            return
+        self.bounds = (
+            min(_.bbox[0] for _ in self.districts), min(_.bbox[1] for _ in self.districts),
+            max(_.bbox[2] for _ in self.districts), max(_.bbox[3] for _ in self.districts),
+        )
+        if size is None:
+            size = min(256, 2 * math.ceil(math.sqrt(len(self.districts))))
+        self.size = size
+        min_x, min_y, max_x, max_y = self.bounds
+        # Degenerate (zero-width) bounds still get a usable cell size.
+        self.cell_width = (max_x - min_x) / size or 1.0
+        self.cell_height = (max_y - min_y) / size or 1.0
+        cells = {}
+        for position, district in enumerate(self.districts):
+            first_i, first_j = self._cell(district.bbox[0], district.bbox[1])
+            last_i, last_j = self._cell(district.bbox[2], district.bbox[3])
+            for i in range(first_i, last_i + 1):
+                for j in range(first_j, last_j + 1):
+                    cells.setdefault(i * size + j, []).append(position)
+        self._cells = {cell: tuple(positions) for cell, positions in cells.items()}
+
+    @classmethod
+    def from_geojson(cls, data):
+        return cls(District.from_feature(_) for _ in data['features'])
+
+    def __len__(self):
+        return len(self.districts)
+
+    def get(self, district_id):
+        return self._by_id.get(district_id)
+
+    def _cell(self, x, y):
+        min_x, min_y = self.bounds[:2]
+        i = min(self.size - 1, int((x - min_x) / self.cell_width))
+        j = min(self.size - 1, int((y - min_y) / self.cell_height))
+        return i, j
+
+    def lookup(self, x, y):
+        """
+        Return the districts containing the point at longitude ``x`` and
+        latitude ``y``.
+        """
+        if self.bounds is None:
+            return []
+        min_x, min_y, max_x, max_y = self.bounds
+        if not (min_x <= x <= max_x and min_y <= y <= max_y):
+            return []
+        i, j = self._cell(x, y)
+        return [
+            self.districts[_] for _ in self._cells.get(i * self.size + j, ())
+            if self.districts[_].contains(x, y)
+        ]
+
+    def lookup_many(self, points):
+        """
+        Return, for each (x, y) point in ``points``, the districts
+        containing it, like ``lookup``.
+        """
+        if numpy is None or self.bounds is None:
+            return [self.lookup(x, y) for x, y in points]
+        results = [[] for _ in points]
+        if not results:
+            return results
+        xy = numpy.asarray(points, dtype=float).reshape(-1, 2)
+        min_x, min_y, max_x, max_y = self.bounds
+        inside = (xy[:, 0] >= min_x) & (xy[:, 0] <= max_x) & (xy[:, 1] >= min_y) & (xy[:, 1] <= max_y)
+        indexes = numpy.flatnonzero(inside)
+        if not len(indexes):
+            return results
+        i = numpy.minimum(self.size - 1, ((xy[indexes, 0] - min_x) / self.cell_width).astype(numpy.int64))
+        j = numpy.minimum(self.size - 1, ((xy[indexes, 1] - min_y) / self.cell_height).astype(numpy.int64))
+        cells = i * self.size + j
+        # Test the points of each cell against the districts of that cell.
+        order = numpy.argsort(cells, kind='stable')
+        indexes, cells = indexes[order], cells[order]
+        starts = numpy.flatnonzero(numpy.r_[True, cells[1:] != cells[:-1]])
+        for start, end in zip(starts, numpy.r_[starts[1:], len(cells)]):
+            positions = self._cells.get(int(cells[start]), ())
+            for chunk in range(start, end, BATCH_CHUNK_SIZE):
+                group = indexes[chunk:min(end, chunk + BATCH_CHUNK_SIZE)]
+                for position in positions:
+                    district = self.districts[position]
+                    for index in group[district.contains_many(xy[group])]:
+                        results[index].append(district)
+        return results
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Return the DistrictIndex of API_DISTRICTS_FILE, loading it on first use.
+    """
+    path = settings.API_DISTRICTS_FILE
+    if not path:
+        raise ImproperlyConfigured('API_DISTRICTS_FILE is not set')
+    dataset = _files.get(path)
+    if dataset is None:
+        with _files_lock:
+            dataset = _files.setdefault(path, Dataset('districts', path, build=DistrictIndex.from_geojson))
+    return dataset.get()
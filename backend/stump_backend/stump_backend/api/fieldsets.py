@@ -0,0 +1,66 @@
+"""
+Sparse fieldsets: ``?fields=a,b`` limits a read to the named fields.
+"""
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+FIELDS_QUERY_PARAM = 'fields'
+
+
+def requested_fields(request, allowed, param=FIELDS_QUERY_PARAM):
+    """
+    Return the fields named in the ``fields`` query parameter, in request
+    order, or None when the parameter is absent or empty.
+
+    Raises ValidationError if a name is not in ``allowed``.
+    """
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    # dict.fromkeys drops duplicates while keeping the requested order
+    fields = tuple(dict.fromkeys(_.strip() for _ in value.split(',') if _.strip()))
+    unknown = [_ for _ in fields if _ not in allowed]
+    if unknown:
+        raise ValidationError({param: ['Unknown field(s): {}'.format(', '.join(unknown))]})
+    return fields or None
+
+
+def project(record, fields):
+    """
+    Return a dict holding only ``fields`` of ``record``.
+    """
+    return {field: record[field] for field in fields if field in record}
+
+
+class SparseFieldsetMixin:
+    """
+    GenericAPIView mixin honouring ``?fields=`` on reads.
+
+    The serializer only renders the named fields and the queryset only loads
+    their columns. The serializer must accept a ``fields`` argument (see
+    ``api.serializers.SparseFieldsMixin``).
+    """
+    fields_query_param = FIELDS_QUERY_PARAM
+
+    def get_sparse_fields(self):
+        if self.request.method not in SAFE_METHODS:
+            return None
+        if not hasattr(self, '_sparse_fields'):
+            allowed = self.get_serializer_class().Meta.fields
+            self._sparse_fields = requested_fields(self.request, allowed, self.fields_query_param)
+        return self._sparse_fields
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_sparse_fields()
+        if fields:
+            columns = {_.name for _ in queryset.model._meta.concrete_fields}
+            queryset = queryset.only(*[_ for _ in fields if _ in columns])
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
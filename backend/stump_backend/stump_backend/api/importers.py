@@ -0,0 +1,136 @@
+"""
+Bulk import of Elasticsearch-format candidate data into the database.
+
+Input files are read one document at a time and written in batches, so an
+import costs one round trip per batch rather than one per row.
+"""
+import datetime
+import json
+
+import django
+from django.db import transaction
+
+from .models import Candidate, CandidateChange, Race
+from .signals import invalidate_on_write
+
+
+DEFAULT_BATCH_SIZE = 1000
+
+# bulk_create(update_conflicts=...) is only available from Django 4.1 on.
+SUPPORTS_UPDATE_CONFLICTS = django.VERSION >= (4, 1)
+
+CANDIDATE_UPDATE_FIELDS = (
+    'race', 'first_name', 'middle_name', 'last_name', 'name_text', 'photo_image',
+    'created_by', 'created_date', 'modified_date', 'version',
+)
+
+
+def es_sources(document):
+    """
+    Yield the candidate ``_source`` documents contained in an Elasticsearch
+    ``_msearch`` response, a search response, a single hit or a bare source.
+    """
+    if 'responses' in document:
+        for response in document['responses']:
+            yield from es_sources(response)
+    elif 'hits' in document:
+        for hit in document['hits']['hits']:
+            yield from es_sources(hit)
+    elif '_source' in document:
+        yield document['_source']
+    else:
+        yield document
+
+
+def read_es_file(path):
+    """
+    Yield candidate sources from a JSON or JSON lines file.
+
+    JSON lines files (``.jsonl``, ``.ndjson``) are streamed line by line; plain
+    JSON files are parsed as a single document.
+    """
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.jsonl', '.ndjson')):
+            for line in f:
+                if line.strip():
+                    yield from es_sources(json.loads(line))
+        else:
+            yield from es_sources(json.load(f))
+
+
+def from_timestamp(milliseconds):
+    if milliseconds is None:
+        return None
+    return datetime.datetime.fromtimestamp(milliseconds / 1000.0, tz=datetime.timezone.utc)
+
+
+def candidate_from_source(source):
+    """
+    Build an unsaved Candidate from an Elasticsearch ``_source`` document.
+    """
+    return Candidate(
+        id=source['_id'],
+        race_id=source.get('race_custom_race1') or None,
+        first_name=source.get('first_name_text', ''),
+        middle_name=source.get('middle_name_text', ''),
+        last_name=source.get('last_name_text', ''),
+        name_text=source.get('_name_text', ''),
+        photo_image=source.get('photo_image', ''),
+        created_by=source.get('Created By', ''),
+        created_date=from_timestamp(source.get('Created Date')),
+        modified_date=from_timestamp(source.get('Modified Date')),
+        version=source.get('_version') or 0,
+    )
+
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def upsert_candidates(candidates):
+    """
+    Insert or update a batch of candidates and the races they refer to.
+    """
+    # The last occurrence of an id wins, as it would with one save() per row.
+    candidates = list({candidate.id: candidate for candidate in candidates}.values())
+    race_ids = {candidate.race_id for candidate in candidates if candidate.race_id}
+    with transaction.atomic():
+        existing = dict(Candidate.objects.filter(
+            pk__in=[_.id for _ in candidates]).values_list('pk', 'version'))
+        Race.objects.bulk_create([Race(id=_) for _ in race_ids], ignore_conflicts=True)
+        if SUPPORTS_UPDATE_CONFLICTS:
+            Candidate.objects.bulk_create(
+                candidates,
+                update_conflicts=True,
+                unique_fields=['id'],
+                update_fields=CANDIDATE_UPDATE_FIELDS,
+            )
+        else:
+            Candidate.objects.bulk_update([_ for _ in candidates if _.id in existing], CANDIDATE_UPDATE_FIELDS)
+            Candidate.objects.bulk_create([_ for _ in candidates if _.id not in existing])
+        # Bulk queries send no model signals. Rows whose version did not
+        # change are left out of the change log.
+        CandidateChange.objects.bulk_create([
+            CandidateChange.for_candidate(_) for _ in candidates if existing.get(_.id) != _.version])
+        invalidate_on_write(Race)
+        invalidate_on_write(Candidate)
+    return len(candidates)
+
+
+def import_candidates(sources, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Upsert candidates from an iterable of ``_source`` documents.
+
+    Returns the number of candidates written.
+    """
+    count = 0
+    for batch in batches((candidate_from_source(_) for _ in sources), batch_size):
+        count += upsert_candidates(batch)
+    return count
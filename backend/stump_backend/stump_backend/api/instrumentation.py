@@ -0,0 +1,222 @@
+"""
+Per-route request metrics.
+
+``InstrumentationMiddleware`` records, for every request routed to a named
+URL pattern: its latency, the number of database queries it ran and the time
+they took, the time spent serializing and rendering the response, and the
+response size. The numbers are exposed with the rest of ``api.metrics`` at
+``/metrics``.
+
+A request running more than API_QUERY_COUNT_WARNING queries is logged as a
+warning, which is usually an N+1 query pattern.
+"""
+import asyncio
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import connections
+
+from .metrics import REGISTRY, Counter, Histogram
+
+try:
+    from asgiref.sync import markcoroutinefunction
+except ImportError:  # asgiref < 3.6
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
+
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+requests_total = Counter(
+    'stump_http_requests',
+    'Requests handled, by route, method and status code.',
+    labelnames=('route', 'method', 'status'),
+)
+request_duration_seconds = Histogram(
+    'stump_http_request_duration_seconds',
+    'Time spent handling a request.',
+    labelnames=('route', 'method'),
+)
+request_db_queries = Histogram(
+    'stump_http_request_db_queries',
+    'Database queries run by a request.',
+    labelnames=('route',),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+request_db_duration_seconds = Histogram(
+    'stump_http_request_db_duration_seconds',
+    'Time a request spent running database queries.',
+    labelnames=('route',),
+)
+response_serialize_seconds = Histogram(
+    'stump_http_response_serialize_seconds',
+    'Time spent in serializers building the response data.',
+    labelnames=('route',),
+)
+response_render_seconds = Histogram(
+    'stump_http_response_render_seconds',
+    'Time spent rendering the response data to bytes.',
+    labelnames=('route',),
+)
+response_size_bytes = Histogram(
+    'stump_http_response_size_bytes',
+    'Size of the response body; streaming responses are not counted.',
+    labelnames=('route',),
+    buckets=SIZE_BUCKETS,
+)
+
+
+class RequestStats:
+    """
+    What one request spent its time on.
+    """
+    __slots__ = ('queries', 'query_time', 'serialize_time', 'render_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper counting and timing the queries.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - start
+            self.queries += 1
+
+
+# Works for both threads and asyncio tasks.
+_current = Local()
+
+
+def current_stats():
+    """
+    Return the RequestStats of the request being handled, if it is instrumented.
+    """
+    return getattr(_current, 'stats', None)
+
+
+@contextmanager
+def timing(attr):
+    """
+    Add the time spent in the block to ``attr`` of the current RequestStats,
+    leaving out database queries (e.g. a lazy queryset evaluated there).
+    """
+    stats = current_stats()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    query_time = stats.query_time
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start - (stats.query_time - query_time)
+        setattr(stats, attr, getattr(stats, attr) + elapsed)
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.url_name if match is not None else None
+
+
+def response_size(response):
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+def observe(request, response, stats, duration):
+    """
+    Record the metrics of a handled request.
+    """
+    route = route_name(request)
+    if route is None:
+        # Unrouted requests (404s, static files) would only add noise.
+        return
+    requests_total.inc(route=route, method=request.method, status=response.status_code)
+    request_duration_seconds.observe(duration, route=route, method=request.method)
+    response_serialize_seconds.observe(stats.serialize_time, route=route)
+    response_render_seconds.observe(stats.render_time, route=route)
+    size = response_size(response)
+    if size is not None:
+        response_size_bytes.observe(size, route=route)
+    if stats.queries is not None:
+        request_db_queries.observe(stats.queries, route=route)
+        request_db_duration_seconds.observe(stats.query_time, route=route)
+        threshold = settings.API_QUERY_COUNT_WARNING
+        if threshold and stats.queries > threshold:
+            logger.warning(
+                '%s %s (%s) ran %d database queries in %.1fms, more than API_QUERY_COUNT_WARNING=%d',
+                request.method, request.get_full_path(), route, stats.queries, stats.query_time * 1000, threshold,
+            )
+    if settings.API_METRICS_DIR:
+        REGISTRY.publish(settings.API_METRICS_DIR)
+
+
+class InstrumentationMiddleware:
+    """
+    Record the metrics of every request to a named route.
+
+    Under ASGI, async views run their queries in worker threads, out of reach
+    of the execute wrappers installed here, so their query metrics are not
+    recorded.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = _current.stats = RequestStats()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats.record_query))
+                response = self.get_response(request)
+        finally:
+            del _current.stats
+        observe(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = _current.stats = RequestStats()
+        stats.queries = None
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            del _current.stats
+        observe(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before the response is rendered; DRF responses are
+        # template responses.
+        stats = current_stats()
+        if stats is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                stats.render_time += time.perf_counter() - start
+            response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,190 @@
+"""
+A database-backed job queue for work that should not hold up a request.
+
+Functions registered with ``@job`` are queued with ``enqueue()`` and run by
+``manage.py run_worker`` in a pool of processes. A job that raises is retried
+with exponential backoff until it has been tried ``max_attempts`` times; a
+job left running by a worker that died is picked up again once its lease
+expires, so jobs run at least once and should be safe to repeat. Finished
+jobs are deleted API_JOB_RETENTION seconds later.
+
+Workers claim jobs with a conditional UPDATE, which lets several of them poll
+the same table on Postgres or SQLite without row locks.
+"""
+import datetime
+import json
+import random
+import traceback
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Job
+
+
+# Registered name -> function
+registry = {}
+
+
+def job(func=None, name=None, max_attempts=None):
+    """
+    Register ``func`` as a job, under its dotted path unless ``name`` is
+    given. Usable with or without arguments.
+    """
+    def register(func):
+        func.job_name = name or '{}.{}'.format(func.__module__, func.__name__)
+        func.max_attempts = max_attempts or settings.API_JOB_MAX_ATTEMPTS
+        if registry.get(func.job_name, func) is not func:
+            raise ValueError('Duplicate job {}'.format(func.job_name))
+        registry[func.job_name] = func
+        return func
+    return register(func) if func is not None else register
+
+
+def enqueue(func, idempotency_key=None, delay=0, **kwargs):
+    """
+    Queue a run of the job ``func`` (or its registered name) with ``kwargs``,
+    which must be JSON serializable, ``delay`` seconds from now.
+
+    If a job with the same ``idempotency_key`` is waiting to run, no new one
+    is queued and that one is returned instead.
+    """
+    name = getattr(func, 'job_name', func)
+    if name not in registry:
+        raise ValueError('Unknown job {}'.format(name))
+    new = Job(
+        name=name,
+        kwargs=json.dumps(kwargs, sort_keys=True),
+        idempotency_key=idempotency_key,
+        max_attempts=registry[name].max_attempts,
+        run_at=timezone.now() + datetime.timedelta(seconds=delay),
+    )
+    if idempotency_key is None:
+        new.save()
+        return new
+    while True:
+        existing = Job.objects.filter(idempotency_key=idempotency_key, status=Job.QUEUED).first()
+        if existing is not None:
+            return existing
+        try:
+            with transaction.atomic():
+                new.save()
+            return new
+        except IntegrityError:
+            # Queued by someone else meanwhile
+            pass
+
+
+def enqueue_on_commit(func, idempotency_key=None, delay=0, **kwargs):
+    """
+    Queue the job once the current transaction commits, e.g. work following
+    up on a write that must see its data.
+    """
+    transaction.on_commit(lambda: enqueue(func, idempotency_key, delay, **kwargs))
+
+
+def backoff(attempts):
+    """
+    Seconds to wait before retrying a job that failed ``attempts`` times:
+    exponential, capped, with jitter so failures do not retry in lockstep.
+    """
+    delay = min(settings.API_JOB_BACKOFF_MAX, settings.API_JOB_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def lease_expiry():
+    return timezone.now() + datetime.timedelta(seconds=settings.API_JOB_LEASE)
+
+
+def claim(limit):
+    """
+    Mark up to ``limit`` due jobs as running, oldest first, and return them.
+    """
+    now = timezone.now()
+    ids = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'pk') \
+        .values_list('pk', flat=True)[:limit]
+    claimed = []
+    for pk in ids:
+        # Only one worker can win the update for a given job. The key is
+        # released, so the job can be queued again while this run goes on.
+        won = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_until=lease_expiry(), idempotency_key=None)
+        if won:
+            claimed.append(pk)
+    return list(Job.objects.filter(pk__in=claimed).order_by('run_at', 'pk'))
+
+
+def renew(pks):
+    """
+    Extend the leases of the running jobs ``pks``.
+    """
+    Job.objects.filter(pk__in=pks, status=Job.RUNNING).update(locked_until=lease_expiry())
+
+
+def recover_abandoned():
+    """
+    Requeue (or fail) the jobs whose worker died while running them; return
+    how many there were.
+    """
+    abandoned = list(Job.objects.filter(status=Job.RUNNING, locked_until__lt=timezone.now()))
+    for abandoned_job in abandoned:
+        finish(abandoned_job, 'Abandoned by its worker')
+    return len(abandoned)
+
+
+def prune():
+    """
+    Delete the jobs that finished (done or failed for good) more than
+    API_JOB_RETENTION seconds ago; return how many there were.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.API_JOB_RETENTION)
+    deleted, _ = Job.objects.filter(status__in=(Job.DONE, Job.FAILED), finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def run(row):
+    """
+    Run the job ``row``; return None, or the traceback if it raised.
+    """
+    try:
+        registry[row.name](**json.loads(row.kwargs))
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def execute(pk):
+    """
+    Run job ``pk`` in a worker process, like ``run``.
+    """
+    close_old_connections()
+    try:
+        return run(Job.objects.get(pk=pk))
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        close_old_connections()
+
+
+def finish(row, error=None):
+    """
+    Record the outcome of an attempt at the running job ``row``: done, queued
+    again after a backoff, or failed for good once it has run out of
+    attempts. Returns False if the job was no longer running, e.g. because
+    its lease expired and another worker took it over.
+    """
+    now = timezone.now()
+    fields = {'attempts': row.attempts + 1, 'locked_until': None}
+    if error is None:
+        fields.update(status=Job.DONE, finished_at=now)
+    elif fields['attempts'] < row.max_attempts:
+        fields.update(status=Job.QUEUED, last_error=error,
+                      run_at=now + datetime.timedelta(seconds=backoff(fields['attempts'])))
+    else:
+        fields.update(status=Job.FAILED, last_error=error, finished_at=now)
+    if not Job.objects.filter(pk=row.pk, status=Job.RUNNING).update(**fields):
+        return False
+    for attr, value in fields.items():
+        setattr(row, attr, value)
+    return True
@@ -0,0 +1,395 @@
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import setup_databases, teardown_databases
+from django.urls import reverse
+
+from api import candidates, datasets
+from api.management.commands.benchmark_slow_clients import percentile
+from api.models import Sample
+from api.views import BoulderCandidatesViewSet
+
+
+BENCHMARK_DATASET = 'benchmark'
+FIRST_NAMES = (
+    'Alice', 'Bob', 'Carmen', 'Dmitri', 'Elena', 'Farid', 'Grace', 'Hiro', 'Ines', 'Jamal',
+    'Kirsten', 'Luis', 'Maya', 'Nikhil', 'Olga', 'Pedro', 'Quinn', 'Rosa', 'Samir', 'Tessa',
+)
+LAST_NAMES = (
+    'Anderson', 'Brooks', 'Castillo', 'Dubois', 'Eriksen', 'Fischer', 'Garcia', 'Hoffman', 'Ivanova', 'Jensen',
+    'Kowalski', 'Lindqvist', 'Moreau', 'Nakamura', 'Okafor', 'Petrov', 'Quintero', 'Romano', 'Schmidt', 'Tanaka',
+)
+RACES = 20
+
+
+def synthetic_candidates(count, seed=0):
+    """
+    Return an Elasticsearch ``_msearch`` response holding ``count`` made-up
+    candidates spread over RACES races.
+    """
+    rng = random.Random(seed)
+    hits = []
+    for index in range(count):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        created = 1560000000000 + index * 1000
+        source = {
+            'first_name_text': first_name,
+            'last_name_text': last_name,
+            '_name_text': (first_name + last_name).lower(),
+            candidates.RACE_ATTR: 'race{}'.format(index % RACES),
+            'Created Date': created,
+            'Modified Date': created + rng.randrange(10 ** 8),
+            '_id': '{}x{:018d}'.format(created, index),
+            '_version': 1,
+            '_type': 'custom.candidate1',
+        }
+        hits.append({'_id': source['_id'], '_type': source['_type'], '_version': 1, 'found': True, '_source': source})
+    return {'responses': [{'hits': {'total': count, 'hits': hits}}]}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL,
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Endpoint:
+    """
+    A kind of request to benchmark: ``request(rng)`` returns the method, path
+    and JSON body of the next one.
+    """
+
+    def __init__(self, name, method, path, body=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+
+    def request(self, rng):
+        path = self.path(rng) if callable(self.path) else self.path
+        body = json.dumps(self.body(rng)) if self.body is not None else None
+        return self.method, path, body
+
+
+def endpoints(sample_ids, candidate_ids, names):
+    """
+    Return the Endpoints to benchmark, reads first: creating a sample
+    invalidates the cached sample reads.
+    """
+    return [
+        Endpoint('sample-list', 'GET', reverse('sample-list')),
+        Endpoint('sample-detail', 'GET', lambda rng: reverse('sample-detail', kwargs={'pk': rng.choice(sample_ids)})),
+        Endpoint('candidate-list', 'GET', reverse('candidate-list')),
+        Endpoint('candidate-page', 'GET', reverse('candidate-list') + '?page_size=100'),
+        Endpoint('candidate-detail', 'GET',
+                 lambda rng: reverse('candidate-detail', kwargs={'pk': rng.choice(candidate_ids)})),
+        Endpoint('candidate-search', 'GET',
+                 lambda rng: reverse('candidate-search') + '?q=' + rng.choice(names)[:rng.randint(3, 6)]),
+        Endpoint('sample-create', 'POST', reverse('sample-list'),
+                 lambda rng: {'title': 'Benchmark', 'description': str(rng.random())}),
+    ]
+
+
+def summarize(name, latencies, errors, elapsed):
+    return {
+        'endpoint': name,
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def without_throttling():
+    """
+    Return settings overrides turning every throttle rate off.
+    """
+    rates = settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})
+    return override_settings(REST_FRAMEWORK=dict(
+        settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=dict.fromkeys(rates)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure p50/p99 latency and requests per second of the API endpoints. '
+        'By default requests go through the Django stack in process, without '
+        'throttling, against synthetic samples in a throwaway test database and '
+        'candidates at each --scale. With --url they are made by --concurrency '
+        'clients to a running server instead, against the data it serves; '
+        'writes are left out unless --allow-writes is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', type=int, nargs='+', default=[1000, 10000],
+            help='Numbers of samples and candidates to seed (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Requests per endpoint in process (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Unmeasured requests per endpoint first, to fill caches (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--endpoints', nargs='+',
+            help='Only benchmark these endpoints, e.g. sample-list candidate-detail',
+        )
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:8000')
+        parser.add_argument(
+            '--concurrency', type=int, default=16,
+            help='Concurrent clients with --url (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=10.0,
+            help='Seconds per endpoint with --url (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--allow-writes', action='store_true',
+            help='With --url, also benchmark sample-create, which adds samples to the server\'s database',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: %(default)s)')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1 or options['duration'] <= 0 \
+                or options['warmup'] < 0 or any(_ < 1 for _ in options['scale']):
+            raise CommandError('--scale, --requests, --concurrency and --duration must be positive')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        report = {
+            'revision': git_revision(),
+            'started': datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        }
+        if options['url']:
+            report.update(mode='server', url=options['url'], concurrency=options['concurrency'],
+                          duration=options['duration'])
+            report['results'] = self.run_server(options)
+        else:
+            report.update(mode='in-process', database=connection.vendor, requests=options['requests'])
+            report['results'] = []
+            self.stderr.write('Creating a test database...')
+            old_config = setup_databases(verbosity=0, interactive=False, aliases={DEFAULT_DB_ALIAS})
+            try:
+                with without_throttling():
+                    for scale in sorted(options['scale']):
+                        report['results'].extend(self.run_in_process(scale, options))
+            finally:
+                teardown_databases(old_config, verbosity=0)
+
+        self.write_table(report['results'], baseline)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write('Results written to {}'.format(options['output']))
+
+    def selected(self, all_endpoints, options, writes=True):
+        known = {_.name for _ in all_endpoints}
+        unknown = set(options['endpoints'] or ()) - known
+        if unknown:
+            raise CommandError('Unknown endpoints: {}; choose from {}'.format(
+                ', '.join(sorted(unknown)), ', '.join(sorted(known))))
+        if not writes:
+            refused = {_.name for _ in all_endpoints if _.method != 'GET'} & set(options['endpoints'] or ())
+            if refused:
+                raise CommandError('{} write(s) to the server; pass --allow-writes to benchmark them'.format(
+                    ', '.join(sorted(refused))))
+            all_endpoints = [_ for _ in all_endpoints if _.method == 'GET']
+        if not options['endpoints']:
+            return all_endpoints
+        return [_ for _ in all_endpoints if _.name in options['endpoints']]
+
+    def run_in_process(self, scale, options):
+        rng = random.Random(options['seed'])
+        self.stderr.write('Seeding {} samples and candidates...'.format(scale))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, BENCHMARK_DATASET + '.json')
+            data = synthetic_candidates(scale, options['seed'])
+            with open(path, 'w') as f:
+                json.dump(data, f)
+            names = [_['_source']['_name_text'] for _ in data['responses'][0]['hits']['hits']]
+            candidate_ids = [_['_id'] for _ in data['responses'][0]['hits']['hits']]
+            del data
+
+            datasets.registry.register(datasets.Dataset(BENCHMARK_DATASET, path))
+            dataset, BoulderCandidatesViewSet.dataset = BoulderCandidatesViewSet.dataset, BENCHMARK_DATASET
+            try:
+                with transaction.atomic():
+                    Sample.objects.bulk_create(
+                        (Sample(title='Title {}'.format(i), description='Description {}'.format(i))
+                         for i in range(scale)),
+                        batch_size=5000,
+                    )
+                    sample_ids = list(Sample.objects.values_list('pk', flat=True))
+                    # Load the dataset before timing anything.
+                    BoulderCandidatesViewSet.load_store()
+                    results = []
+                    for endpoint in self.selected(endpoints(sample_ids, candidate_ids, names), options):
+                        result = self.measure_in_process(endpoint, options['requests'], options['warmup'], rng)
+                        result['scale'] = scale
+                        results.append(result)
+                    transaction.set_rollback(True)
+            finally:
+                BoulderCandidatesViewSet.dataset = dataset
+                datasets.registry.unregister(BENCHMARK_DATASET)
+        return results
+
+    def measure_in_process(self, endpoint, requests, warmup, rng):
+        hosts = [_.lstrip('.') for _ in settings.ALLOWED_HOSTS if _ != '*']
+        client = Client(SERVER_NAME=hosts[0] if hosts else 'localhost', HTTP_ACCEPT='application/json')
+
+        def send():
+            method, path, body = endpoint.request(rng)
+            response = client.generic(method, path, body or '', content_type='application/json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response.status_code
+
+        for _ in range(warmup):
+            send()
+        latencies = []
+        errors = 0
+        begin = time.perf_counter()
+        for _ in range(requests):
+            start = time.perf_counter()
+            status = send()
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors += 1
+        return summarize(endpoint.name, latencies, errors, time.perf_counter() - begin)
+
+    def run_server(self, options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Only http:// URLs are supported')
+        address = (url.hostname, url.port or 80)
+        prefix = url.path.rstrip('/')
+        headers = {'Accept': 'application/json', 'Content-Type': 'application/json', 'Host': url.netloc}
+        # Check the endpoints before any request.
+        self.selected(endpoints((), (), ()), options, options['allow_writes'])
+
+        def get(path):
+            conn = http.client.HTTPConnection(*address, timeout=60)
+            try:
+                conn.request('GET', prefix + path, headers=headers)
+                response = conn.getresponse()
+                if response.status != 200:
+                    raise CommandError('GET {} returned {}'.format(path, response.status))
+                return json.loads(response.read().decode('utf-8'))
+            finally:
+                conn.close()
+
+        # Requests go to the records the server already has.
+        sample_ids = [_['id'] for _ in get(reverse('sample-list') + '?page_size=1000')['results']]
+        records = get(reverse('candidate-list') + '?page_size=1000')['results']
+        if not sample_ids or not records:
+            raise CommandError('The server needs at least one sample and one candidate')
+        candidate_ids = [_['_id'] for _ in records]
+        names = [_.get('_name_text') or _['_id'] for _ in records]
+
+        results = []
+        selected = self.selected(endpoints(sample_ids, candidate_ids, names), options, options['allow_writes'])
+        for endpoint in selected:
+            result = self.measure_server(endpoint, address, prefix, headers, options)
+            result['scale'] = 'server'
+            results.append(result)
+        return results
+
+    def measure_server(self, endpoint, address, prefix, headers, options):
+        latencies = []
+        errors = [0]
+        throttled = [0]
+        lock = threading.Lock()
+
+        rng = random.Random(options['seed'])
+        conn = http.client.HTTPConnection(*address, timeout=60)
+        try:
+            for _ in range(options['warmup']):
+                method, path, body = endpoint.request(rng)
+                conn.request(method, prefix + path, body=body, headers=headers)
+                conn.getresponse().read()
+        finally:
+            conn.close()
+
+        deadline = time.perf_counter() + options['duration']
+
+        def client(seed):
+            rng = random.Random(seed)
+            conn = http.client.HTTPConnection(*address, timeout=60)
+            try:
+                while time.perf_counter() < deadline:
+                    method, path, body = endpoint.request(rng)
+                    start = time.perf_counter()
+                    try:
+                        conn.request(method, prefix + path, body=body, headers=headers)
+                        response = conn.getresponse()
+                        response.read()
+                        status = response.status
+                    except (OSError, http.client.HTTPException):
+                        # Reconnect, e.g. after the server closed an idle connection.
+                        conn.close()
+                        status = 0
+                    seconds = time.perf_counter() - start
+                    with lock:
+                        if 200 <= status < 400:
+                            latencies.append(seconds)
+                        else:
+                            errors[0] += 1
+                            if status == 429:
+                                throttled[0] += 1
+            finally:
+                conn.close()
+
+        begin = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(options['seed'] + _,)) for _ in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if throttled[0]:
+            self.stderr.write(
+                '{} requests to {} were throttled; turn throttling off on the server '
+                '(unset API_THROTTLE_RATE) to measure the endpoint'.format(throttled[0], endpoint.name))
+        return summarize(endpoint.name, latencies, errors[0], time.perf_counter() - begin)
+
+    def write_table(self, results, baseline=None):
+        previous = {}
+        if baseline is not None:
+            previous = {(_['scale'], _['endpoint']): _ for _ in baseline.get('results', ())}
+        header = '{:>8}  {:<18}  {:>8}  {:>6}  {:>10}  {:>10}  {:>10}'.format(
+            'scale', 'endpoint', 'requests', 'errors', 'p50 ms', 'p99 ms', 'req/s')
+        if baseline is not None:
+            header += '  {:>10}'.format('p50 change')
+        self.stdout.write(header)
+        for result in results:
+            line = '{scale:>8}  {endpoint:<18}  {requests:>8}  {errors:>6}  {p50_ms:>10.2f}  {p99_ms:>10.2f}  ' \
+                   '{requests_per_second:>10.1f}'.format(**result)
+            before = previous.get((result['scale'], result['endpoint']))
+            if before is not None and before['p50_ms']:
+                line += '  {:>+9.1f}%'.format((result['p50_ms'] / before['p50_ms'] - 1) * 100)
+            self.stdout.write(line)
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.models import Sample
+from api.renderers import FastJSONRenderer
+from api.serializers import SampleSerializer, ValuesSerializer
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the ModelSerializer + JSONRenderer list path with the '
+        'ValuesSerializer + FastJSONRenderer fast path. Rows are created inside '
+        'a transaction that is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+            help='Table sizes to benchmark (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Runs per measurement; the fastest one is reported (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or any(_ < 1 for _ in options['rows']):
+            raise CommandError('--rows and --repeat must be positive integers')
+
+        fast = ValuesSerializer.for_serializer(SampleSerializer)
+        self.stdout.write('{:>8}  {:>12}  {:>12}  {:>8}'.format('rows', 'serializer', 'fast path', 'speedup'))
+        for rows in sorted(options['rows']):
+            with transaction.atomic():
+                Sample.objects.bulk_create(
+                    (Sample(title='Title {}'.format(i), description='Description {}'.format(i)) for i in range(rows)),
+                    batch_size=5000,
+                )
+                queryset = Sample.objects.order_by('id')[:rows]
+                slow_time = best_of(options['repeat'], lambda: JSONRenderer().render(
+                    SampleSerializer(queryset, many=True).data))
+                fast_time = best_of(options['repeat'], lambda: FastJSONRenderer().render(
+                    fast.to_representation(fast.values_list(queryset))))
+                transaction.set_rollback(True)
+            self.stdout.write('{:>8}  {:>11.1f}ms  {:>11.1f}ms  {:>7.1f}x'.format(
+                rows, slow_time * 1000, fast_time * 1000, slow_time / fast_time))
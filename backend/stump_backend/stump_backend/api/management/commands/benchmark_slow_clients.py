@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class SlowClient:
+    """
+    A client on a poor connection: the request is sent a few bytes at a time
+    and the response is read in small pieces with a pause between them.
+    """
+
+    def __init__(self, host, port, path, write_delay, read_delay, read_size):
+        self.host = host
+        self.port = port
+        self.request = 'GET {} HTTP/1.1\r\nHost: {}\r\nAccept: application/json\r\nConnection: close\r\n\r\n'.format(
+            path, host).encode('ascii')
+        self.write_delay = write_delay
+        self.read_delay = read_delay
+        self.read_size = read_size
+
+    async def fetch(self):
+        """
+        Make one request and return (status, seconds taken).
+        """
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            for index in range(0, len(self.request), 16):
+                writer.write(self.request[index:index + 16])
+                await writer.drain()
+                await asyncio.sleep(self.write_delay)
+            status_line = await reader.readline()
+            while True:
+                chunk = await reader.read(self.read_size)
+                if not chunk:
+                    break
+                await asyncio.sleep(self.read_delay)
+        finally:
+            writer.close()
+        status = int(status_line.split()[1]) if status_line else 0
+        return status, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the throughput of a running server under many concurrent slow '
+        'clients. Run it once against the WSGI (sync workers) deployment and once '
+        'against the ASGI (uvicorn workers) one with the same worker count.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='URL to request, e.g. http://localhost:8000/api/v0/candidates/')
+        parser.add_argument(
+            '--clients', type=int, default=200,
+            help='Concurrent clients (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30.0,
+            help='Seconds to run for (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--write-delay', type=float, default=0.05,
+            help='Pause between 16 byte pieces of the request, in seconds (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--read-delay', type=float, default=0.05,
+            help='Pause between reads of the response, in seconds (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--read-size', type=int, default=1024,
+            help='Bytes read from the response at a time (default: %(default)s)',
+        )
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Only http:// URLs are supported')
+        if options['clients'] < 1 or options['duration'] <= 0 or options['read_size'] < 1:
+            raise CommandError('--clients, --duration and --read-size must be positive')
+
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        client = SlowClient(
+            url.hostname, url.port or 80, path,
+            options['write_delay'], options['read_delay'], options['read_size'],
+        )
+        loop = asyncio.new_event_loop()
+        try:
+            latencies, errors = loop.run_until_complete(self.run(client, options['clients'], options['duration']))
+        finally:
+            loop.close()
+
+        results = {
+            'url': options['url'],
+            'clients': options['clients'],
+            'duration': options['duration'],
+            'requests': len(latencies),
+            'errors': errors,
+            'requests_per_second': len(latencies) / options['duration'],
+            'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+        for name, value in results.items():
+            if isinstance(value, float):
+                value = '{:.1f}'.format(value)
+            self.stdout.write('{:>20}  {}'.format(name, value))
+
+    async def run(self, client, clients, duration):
+        deadline = time.perf_counter() + duration
+        latencies = []
+        errors = [0]
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                try:
+                    status, seconds = await client.fetch()
+                except OSError:
+                    status, seconds = 0, None
+                if status == 200:
+                    latencies.append(seconds)
+                else:
+                    errors[0] += 1
+
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        return latencies, errors[0]
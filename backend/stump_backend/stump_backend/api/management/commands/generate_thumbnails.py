@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import thumbnails
+from api.datasets import read_data_file, registry
+from api.importers import es_sources
+from api.models import Candidate
+
+
+class Command(BaseCommand):
+    help = (
+        'Resize the photos of every candidate, in the datasets and in the database, '
+        'into the thumbnail storage. Photos already in its manifest are skipped. '
+        'Restart the app afterwards so that responses list the new thumbnails.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--datasets', nargs='+', metavar='NAME',
+            help='Datasets to read photos from (default: all of them)',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Worker processes (default: one per CPU)',
+        )
+        parser.add_argument('--force', action='store_true', help='Regenerate existing thumbnails')
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError('--workers must be a positive integer')
+        names = options['datasets'] or registry.names()
+        unknown = [_ for _ in names if _ not in registry]
+        if unknown:
+            raise CommandError('Unknown dataset(s): {}'.format(', '.join(unknown)))
+
+        urls = set(Candidate.objects.exclude(photo_image='').values_list('photo_image', flat=True))
+        for name in names:
+            # The raw file, so the dataset is not kept in memory here
+            urls.update(_.get('photo_image') for _ in es_sources(read_data_file(registry[name].path)))
+        urls.discard(None)
+        urls.discard('')
+
+        try:
+            errors = thumbnails.generate(urls, workers=options['workers'], force=options['force'])
+        except ImportError as e:
+            raise CommandError(str(e))
+        for url, error in sorted(errors.items()):
+            self.stderr.write('{}: {}'.format(url, error))
+        self.stdout.write(self.style.SUCCESS('Thumbnails of {} photos are up to date, {} failed'.format(
+            len(urls) - len(errors), len(errors))))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importers import DEFAULT_BATCH_SIZE, import_candidates, read_es_file
+
+
+class Command(BaseCommand):
+    help = 'Upsert candidates and races from Elasticsearch-format JSON or JSON lines files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='JSON (.json) or JSON lines (.jsonl, .ndjson) files')
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Number of candidates written per bulk query (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive integer')
+        for path in options['paths']:
+            try:
+                count = import_candidates(read_es_file(path), batch_size=options['batch_size'])
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError('Could not import {}: {}'.format(path, e))
+            self.stdout.write(self.style.SUCCESS('Imported {} candidates from {}'.format(count, path)))
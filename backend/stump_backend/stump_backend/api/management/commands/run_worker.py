@@ -0,0 +1,154 @@
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api import jobs
+
+
+# Seconds between two deletions of old finished jobs
+PRUNE_INTERVAL = 3600
+
+
+def init_process():
+    # Interrupting the worker lets the running jobs finish; terminating the
+    # pool does not wait for them.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def process_pool(processes):
+    try:
+        # Forked processes start with the app already set up. Python 3.14
+        # defaults to forkserver, which would have to set it up again.
+        return ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context('fork'), initializer=init_process)
+    except TypeError:  # Python < 3.7, which forks on Linux
+        return ProcessPoolExecutor(processes)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the queued background jobs (see api.jobs) in a pool of worker processes, '
+        'until interrupted. Several workers can share the queue.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='Jobs run at once, each in its own process (default: one per CPU); '
+                 '0 runs them one at a time in this process',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds between checks for due jobs when idle (default: %(default)s)',
+        )
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if processes < 0:
+            raise CommandError('--processes must not be negative')
+        if options['poll_interval'] <= 0:
+            raise CommandError('--poll-interval must be positive')
+        self.verbosity = options['verbosity']
+        self.stopping = False
+        self.pruned = None
+
+        def stop(signum, frame):
+            self.log('Finishing the running jobs, then stopping')
+            self.stopping = True
+        handlers = {_: signal.signal(_, stop) for _ in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            if processes:
+                self.work(processes, options['poll_interval'], options['burst'])
+            else:
+                self.work_inline(options['poll_interval'], options['burst'])
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def log(self, message):
+        if self.verbosity >= 1:
+            self.stdout.write(message)
+
+    def report(self, row, error, duration):
+        if not jobs.finish(row, error):
+            self.stderr.write('{} was taken over by another worker'.format(row))
+        elif error is None:
+            self.log('{} in {:.2f}s'.format(row, duration))
+        elif row.status == jobs.Job.QUEUED:
+            self.stderr.write('{} failed, retrying at {}:\n{}'.format(row, row.run_at.isoformat(), error))
+        else:
+            self.stderr.write('{} failed for good after {} attempts:\n{}'.format(row, row.attempts, error))
+
+    def recover(self):
+        abandoned = jobs.recover_abandoned()
+        if abandoned:
+            self.stderr.write('Recovered {} abandoned job(s)'.format(abandoned))
+        if self.pruned is None or time.monotonic() - self.pruned > PRUNE_INTERVAL:
+            pruned = jobs.prune()
+            if pruned:
+                self.log('Deleted {} finished job(s)'.format(pruned))
+            self.pruned = time.monotonic()
+
+    def work_inline(self, poll_interval, burst):
+        while not self.stopping:
+            self.recover()
+            claimed = jobs.claim(1)
+            if not claimed:
+                if burst:
+                    return
+                time.sleep(poll_interval)
+                continue
+            row = claimed[0]
+            start = time.monotonic()
+            self.report(row, jobs.run(row), time.monotonic() - start)
+
+    def work(self, processes, poll_interval, burst):
+        pool = process_pool(processes)
+        # Future -> (job, start time)
+        running = {}
+        renewed = time.monotonic()
+        try:
+            while running or not self.stopping:
+                if not self.stopping and len(running) < processes:
+                    self.recover()
+                    claimed = jobs.claim(processes - len(running))
+                    if claimed:
+                        # Forked workers must not share this process' connections.
+                        connections.close_all()
+                    for row in claimed:
+                        running[pool.submit(jobs.execute, row.pk)] = (row, time.monotonic())
+                    if burst and not running:
+                        return
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    row, start = running.pop(future)
+                    try:
+                        error = future.result()
+                    except BrokenProcessPool:
+                        error = 'The worker process running the job died'
+                        broken = True
+                    self.report(row, error, time.monotonic() - start)
+                if broken:
+                    # Every job still running was lost with the pool.
+                    for row, start in running.values():
+                        self.report(row, 'The worker process running the job died', time.monotonic() - start)
+                    running.clear()
+                    pool.shutdown(wait=False)
+                    pool = process_pool(processes)
+                if running and time.monotonic() - renewed > settings.API_JOB_LEASE / 3:
+                    jobs.renew([row.pk for row, _ in running.values()])
+                    renewed = time.monotonic()
+        finally:
+            pool.shutdown(wait=True)
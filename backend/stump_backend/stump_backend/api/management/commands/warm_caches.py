@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import NoReverseMatch, reverse
+
+from api import warmup
+
+
+class Command(BaseCommand):
+    help = (
+        'Load the datasets, build the candidate indexes, open the database connections and '
+        'cache the responses of the warm-up routes, as web processes do when they start. '
+        'Run it after a deploy to fill a shared API cache before traffic arrives.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--routes', nargs='+', metavar='NAME',
+            help='Names of the routes whose responses are cached (default: API_WARMUP_ROUTES)',
+        )
+
+    def handle(self, *args, **options):
+        for name in options['routes'] or ():
+            try:
+                reverse(name)
+            except NoReverseMatch:
+                raise CommandError('Unknown route {} (it must take no arguments)'.format(name))
+
+        timings = warmup.warm_up(route_names=options['routes'])
+        for step, seconds in timings.items():
+            self.stdout.write('{}: {:.3f}s'.format(step, seconds))
+        self.stdout.write(self.style.SUCCESS('Warmed up in {:.3f}s'.format(sum(timings.values()))))
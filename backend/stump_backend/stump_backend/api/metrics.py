@@ -0,0 +1,290 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Metrics are kept per process. When several processes serve requests, e.g.
+gunicorn workers, each one ``publish()``es its numbers to a file in a shared
+directory (API_METRICS_DIR), and ``expose()`` adds up those of every process,
+so that a scrape sees the same totals whichever worker answers it. The
+numbers of processes that exited are ``retire()``d into a single file, so that
+counters never go down and the directory does not grow with every restart.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+# Seconds between two writes of a process' metrics to the shared directory.
+PUBLISH_INTERVAL = 1.0
+
+# File holding the added-up metrics of the processes that exited
+RETIRED_NAME = 'retired.json'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _merge(value, other):
+    """
+    Add up two published values: numbers, or lists of them (histograms).
+    """
+    if isinstance(value, list):
+        return [_merge(a, b) for a, b in zip(value, other)]
+    return value + other
+
+
+def _write_json(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def retire(directory, pid):
+    """
+    Add the metrics process ``pid`` published to ``directory`` to those of
+    the processes that exited before it, and remove its file. Call it once
+    the process is gone, e.g. from gunicorn's ``child_exit`` hook.
+    """
+    path = os.path.join(directory, '{}.json'.format(pid))
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError):
+        data = {}
+    retired_path = os.path.join(directory, RETIRED_NAME)
+    try:
+        with open(retired_path) as f:
+            retired = json.load(f)
+    except (OSError, ValueError):
+        retired = {}
+    for name, snapshot in data.items():
+        values = OrderedDict((tuple(key), value) for key, value in retired.get(name, ()))
+        for key, value in snapshot:
+            key = tuple(key)
+            values[key] = _merge(values[key], value) if key in values else value
+        retired[name] = [[list(key), value] for key, value in values.items()]
+    _write_json(retired_path, retired)
+    os.remove(path)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels) + '}'
+
+
+class Registry:
+    """
+    The set of metrics exposed together.
+    """
+
+    def __init__(self):
+        self._metrics = OrderedDict()
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._published = None
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError('Duplicate metric {}'.format(metric.name))
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def snapshot(self):
+        """
+        Return the values of every metric, in a JSON-serializable form.
+        """
+        return {
+            metric.name: [[list(key), value] for key, value in metric.collect().items()]
+            for metric in list(self._metrics.values())
+        }
+
+    def publish(self, directory, interval=PUBLISH_INTERVAL):
+        """
+        Write the metrics of this process to ``directory``, unless they were
+        written less than ``interval`` seconds ago.
+        """
+        now = time.monotonic()
+        if self._published is not None and now - self._published < interval:
+            return
+        if not self._publish_lock.acquire(blocking=False):
+            return  # Another thread is at it
+        try:
+            _write_json(os.path.join(directory, '{}.json'.format(os.getpid())), self.snapshot())
+            self._published = now
+        finally:
+            self._publish_lock.release()
+
+    def read_published(self, directory):
+        """
+        Return {metric name: [snapshot]} from the files the other processes,
+        running or retired, wrote to ``directory``.
+        """
+        own = '{}.json'.format(os.getpid())
+        snapshots = {}
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.json') or filename == own:
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, snapshot in data.items():
+                snapshots.setdefault(name, []).append(snapshot)
+        return snapshots
+
+    def expose(self, directory=None):
+        """
+        Return every metric in the Prometheus text format, added up with the
+        metrics other processes published to ``directory``, if given.
+        """
+        published = self.read_published(directory) if directory else {}
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            for name, labels, value in metric.samples(metric.collect(published.get(metric.name, ()))):
+                lines.append('{}{} {}'.format(name, _format_labels(labels), _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    """
+    Base class for metrics with an optional fixed set of label names.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('{} expects labels {}, got {}'.format(self.name, self.labelnames, tuple(labels)))
+        return tuple(str(labels[_]) for _ in self.labelnames)
+
+    def _labels(self, key):
+        return list(zip(self.labelnames, key))
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def collect(self, snapshots=()):
+        """
+        Return {label values: value} for this process, added up with
+        ``snapshots`` of other processes.
+        """
+        with self._lock:
+            values = OrderedDict((key, self._copy(value)) for key, value in self._values.items())
+        for snapshot in snapshots:
+            for key, value in snapshot:
+                key = tuple(key)
+                values[key] = self._add(values[key], value) if key in values else self._copy(value)
+        return values
+
+
+class Counter(Metric):
+    """
+    A value that only goes up.
+    """
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _copy(self, value):
+        return value
+
+    def _add(self, value, other):
+        return value + other
+
+    def samples(self, values=None):
+        values = self._values if values is None else values
+        for key, value in list(values.items()):
+            yield self.name + '_total', self._labels(key), value
+
+
+class Histogram(Metric):
+    """
+    Observations counted in cumulative buckets, with their sum and count.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(float(_) for _ in sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self._key(labels)) or ((), 0.0)
+        return sum(counts)
+
+    def sum(self, **labels):
+        _, total = self._values.get(self._key(labels)) or ((), 0.0)
+        return total
+
+    def _copy(self, value):
+        counts, total = value
+        return [list(counts), total]
+
+    def _add(self, value, other):
+        (counts, total), (other_counts, other_total) = value, other
+        if len(counts) != len(other_counts):
+            return value  # Published with other buckets
+        return [[_ + other_counts[i] for i, _ in enumerate(counts)], total + other_total]
+
+    def samples(self, values=None):
+        values = self._values if values is None else values
+        for key, (counts, total) in list(values.items()):
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield self.name + '_bucket', labels + [('le', _format_value(bound))], cumulative
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, cumulative
+
+
+db_connection_setup_seconds = Histogram(
+    'stump_db_connection_setup_seconds',
+    'Time spent opening (or, when pooled, checking out) a database connection.',
+    labelnames=('alias', 'vendor'),
+)
@@ -0,0 +1,37 @@
+# Generated by Django 3.0.4 on 2026-10-18 00:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Race',
+            fields=[
+                ('id', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Candidate',
+            fields=[
+                ('id', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('first_name', models.CharField(blank=True, max_length=120)),
+                ('middle_name', models.CharField(blank=True, max_length=120)),
+                ('last_name', models.CharField(blank=True, max_length=120)),
+                ('name_text', models.CharField(blank=True, max_length=255)),
+                ('photo_image', models.CharField(blank=True, max_length=500)),
+                ('created_by', models.CharField(blank=True, max_length=255)),
+                ('created_date', models.DateTimeField(blank=True, null=True)),
+                ('modified_date', models.DateTimeField(blank=True, null=True)),
+                ('version', models.BigIntegerField(default=0)),
+                ('race', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='candidates', to='api.Race')),
+            ],
+        ),
+    ]
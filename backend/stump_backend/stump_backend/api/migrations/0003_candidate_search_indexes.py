@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+class PostgresRunSQL(migrations.RunSQL):
+    """
+    RunSQL that only runs on Postgres: other databases fall back to
+    unindexed prefix matching.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_candidate_race'),
+    ]
+
+    # Indexes behind CandidateQuerySet.search(); the expressions must match the
+    # ones it queries. The extension is left in place on the way back, as other
+    # schemas may use it.
+    operations = [
+        PostgresRunSQL('CREATE EXTENSION IF NOT EXISTS pg_trgm', migrations.RunSQL.noop),
+        PostgresRunSQL(
+            'CREATE INDEX IF NOT EXISTS api_candidate_name_trgm ON api_candidate USING gin (name_text gin_trgm_ops)',
+            'DROP INDEX IF EXISTS api_candidate_name_trgm',
+        ),
+        PostgresRunSQL(
+            "CREATE INDEX IF NOT EXISTS api_candidate_document ON api_candidate USING gin "
+            "(to_tsvector('simple', first_name || ' ' || middle_name || ' ' || last_name))",
+            'DROP INDEX IF EXISTS api_candidate_document',
+        ),
+    ]
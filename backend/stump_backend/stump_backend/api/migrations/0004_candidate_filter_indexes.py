@@ -0,0 +1,22 @@
+# Generated by Django 3.0.4 on 2026-10-18 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_candidate_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='candidate',
+            name='modified_date',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='candidate',
+            index=models.Index(fields=['race', 'modified_date'], name='api_candidate_race_modified'),
+        ),
+    ]
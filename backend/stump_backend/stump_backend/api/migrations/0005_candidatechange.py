@@ -0,0 +1,24 @@
+# Generated by Django 3.0.4 on 2026-10-18 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_candidate_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandidateChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('candidate_id', models.CharField(max_length=255)),
+                ('op', models.CharField(choices=[('upsert', 'Created or updated'), ('delete', 'Deleted')], max_length=10)),
+                ('version', models.BigIntegerField(default=0)),
+                ('data', models.TextField(blank=True)),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
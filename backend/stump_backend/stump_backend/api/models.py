@@ -1,4 +1,12 @@
-from django.db import models
+import json
+from functools import reduce
+from operator import and_, or_
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+
+from .search import tokenize
 
 # Create your models here.
 
@@ -9,3 +17,182 @@ class Sample(models.Model):
 
     def _str_(self):
         return self.title
+
+
+class Race(models.Model):
+    """
+    A contest on the ballot, keyed by its id in the source data.
+    """
+    id = models.CharField(max_length=255, primary_key=True)
+    name = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return self.name or self.id
+
+
+# Postgres expressions backed by the indexes created in migration 0003.
+CANDIDATE_DOCUMENT_SQL = (
+    "to_tsvector('simple', \"api_candidate\".\"first_name\" || ' ' || "
+    "\"api_candidate\".\"middle_name\" || ' ' || \"api_candidate\".\"last_name\")"
+)
+CANDIDATE_NAME_SQL = '"api_candidate"."name_text"'
+
+
+class CandidateQuerySet(models.QuerySet):
+
+    def in_race(self, race):
+        return self.filter(race_id=race)
+
+    def modified_since(self, when):
+        """
+        Return the candidates modified at or after the datetime ``when``.
+        """
+        return self.filter(modified_date__gte=when)
+
+    def search(self, query):
+        """
+        Return the candidates whose names start with every term of ``query``,
+        best matches first.
+
+        On Postgres, terms are matched as prefixes in a full-text index and,
+        to tolerate typos, by trigram word similarity with ``name_text``.
+        Other databases match prefixes only.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return self.none()
+        if connections[self.db].vendor == 'postgresql':
+            prefixes = ' & '.join('{}:*'.format(_) for _ in terms)
+            joined = ''.join(terms)
+            match = RawSQL(
+                "{} @@ to_tsquery('simple', %s) OR %s <%% {}".format(CANDIDATE_DOCUMENT_SQL, CANDIDATE_NAME_SQL),
+                (prefixes, joined), output_field=models.BooleanField())
+            similarity = RawSQL(
+                'word_similarity(%s, {})'.format(CANDIDATE_NAME_SQL), (joined,), output_field=models.FloatField())
+            return self.filter(match).annotate(search_similarity=similarity).order_by(
+                '-search_similarity', 'last_name', 'first_name')
+        fields = ('first_name', 'middle_name', 'last_name', 'name_text')
+        return self.filter(reduce(and_, (
+            reduce(or_, (models.Q(**{field + '__istartswith': term}) for field in fields))
+            for term in terms))).order_by('last_name', 'first_name')
+
+
+class Candidate(models.Model):
+    """
+    A candidate running in a race, keyed by its Elasticsearch ``_id``.
+
+    Filled by ``manage.py import_candidates`` and edited in the admin; the
+    candidate API serves the datasets of ``api.datasets``, not this table.
+    """
+    id = models.CharField(max_length=255, primary_key=True)
+    race = models.ForeignKey(Race, related_name='candidates', null=True, blank=True, on_delete=models.SET_NULL)
+    first_name = models.CharField(max_length=120, blank=True)
+    middle_name = models.CharField(max_length=120, blank=True)
+    last_name = models.CharField(max_length=120, blank=True)
+    name_text = models.CharField(max_length=255, blank=True)
+    photo_image = models.CharField(max_length=500, blank=True)
+    created_by = models.CharField(max_length=255, blank=True)
+    created_date = models.DateTimeField(null=True, blank=True)
+    modified_date = models.DateTimeField(null=True, blank=True, db_index=True)
+    version = models.BigIntegerField(default=0)
+
+    objects = CandidateQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # ?race= together with ?modified_since=
+            models.Index(fields=['race', 'modified_date'], name='api_candidate_race_modified'),
+        ]
+
+    def __str__(self):
+        return ' '.join(_ for _ in (self.first_name, self.middle_name, self.last_name) if _)
+
+    def to_source(self):
+        """
+        Return the candidate as an Elasticsearch ``_source`` document, the
+        shape the candidate API serves.
+        """
+        def milliseconds(value):
+            return None if value is None else int(value.timestamp() * 1000)
+
+        return {
+            '_id': self.id,
+            'race_custom_race1': self.race_id,
+            'first_name_text': self.first_name,
+            'middle_name_text': self.middle_name,
+            'last_name_text': self.last_name,
+            '_name_text': self.name_text,
+            'photo_image': self.photo_image,
+            'Created By': self.created_by,
+            'Created Date': milliseconds(self.created_date),
+            'Modified Date': milliseconds(self.modified_date),
+            '_version': self.version,
+        }
+
+
+class CandidateChange(models.Model):
+    """
+    Append-only log of candidate writes. The id is the sequence number
+    clients sync from.
+    """
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    OPS = ((UPSERT, 'Created or updated'), (DELETE, 'Deleted'))
+
+    candidate_id = models.CharField(max_length=255)
+    op = models.CharField(max_length=10, choices=OPS)
+    version = models.BigIntegerField(default=0)
+    # JSON of Candidate.to_source() after an upsert
+    data = models.TextField(blank=True)
+    recorded_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def for_candidate(cls, candidate, op=UPSERT):
+        """
+        Return an unsaved log entry for a write to ``candidate``.
+        """
+        data = json.dumps(candidate.to_source(), cls=DjangoJSONEncoder) if op == cls.UPSERT else ''
+        return cls(candidate_id=candidate.id, op=op, version=candidate.version, data=data)
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by ``manage.py run_worker`` (see
+    ``api.jobs``).
+
+    A job with an ``idempotency_key`` is only queued once: enqueueing it again
+    while an earlier one with the same key is still waiting to run returns
+    that one.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = ((QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed'))
+
+    name = models.CharField(max_length=200)
+    # JSON of the keyword arguments
+    kwargs = models.TextField(default='{}')
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()
+    # While running, the worker renews this; past it the job was abandoned.
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's poll for due jobs
+            models.Index(fields=['status', 'run_at'], name='api_job_status_run_at'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['idempotency_key'], condition=models.Q(status='queued'), name='api_job_queued_key'),
+        ]
+
+    def __str__(self):
+        return '{} #{} ({})'.format(self.name, self.pk, self.status)
@@ -0,0 +1,149 @@
+"""
+Keyset (cursor) pagination for the API.
+
+Pages are addressed by the last key seen rather than by an offset, so fetching
+a deep page costs the same as fetching the first one.
+"""
+import base64
+import binascii
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .async_orm import alist
+
+
+class PageQuery:
+    """
+    Stands in for the queryset given to ``CursorPagination.paginate_queryset()``:
+    the ordering and filtering it applies go to ``queryset``, and the slice
+    it takes for the page returns ``rows``, fetched beforehand.
+    """
+
+    def __init__(self, queryset, rows=()):
+        self.queryset = queryset
+        self.rows = list(rows)
+
+    def order_by(self, *fields):
+        self.queryset = self.queryset.order_by(*fields)
+        return self
+
+    def filter(self, *args, **kwargs):
+        self.queryset = self.queryset.filter(*args, **kwargs)
+        return self
+
+    def __getitem__(self, key):
+        self.queryset = self.queryset[key]
+        return self.rows
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Cursor pagination over the primary key, which is always indexed and unique.
+
+    ``apaginate_queryset()`` is the same from async code: a first pass of
+    ``paginate_queryset()`` works out the page query, which runs on the async
+    ORM, and a second one builds the page from its rows.
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        query = PageQuery(queryset)
+        if self.paginate_queryset(query, request, view) is None:
+            return None
+        rows = await alist(query.queryset)
+        return self.paginate_queryset(PageQuery(queryset, rows), request, view)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over an in-memory sequence sorted by a unique key.
+
+    The paginated object must provide ``keys``, the sorted keys, and
+    ``get(key)``, returning the row for a key.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_requested(self, request):
+        """
+        Return True if the request asks for a page rather than the whole list.
+        """
+        return (self.cursor_query_param in request.query_params or
+                self.page_size_query_param in request.query_params)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            direction, _, key = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8').partition(':')
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if direction not in ('a', 'b'):
+            raise NotFound(self.invalid_cursor_message)
+        return direction, key
+
+    def encode_cursor(self, direction, key):
+        encoded = base64.urlsafe_b64encode('{}:{}'.format(direction, key).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def paginate_keyset(self, keyset, request):
+        """
+        Return the rows of the requested page.
+
+        A cursor ``a:<key>`` selects the rows after ``key`` and ``b:<key>`` the
+        rows before it.
+        """
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        keys = keyset.keys
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            start, end = 0, page_size
+        elif cursor[0] == 'a':
+            start = bisect_right(keys, cursor[1])
+            end = start + page_size
+        else:
+            end = bisect_left(keys, cursor[1])
+            start = max(end - page_size, 0)
+        page_keys = keys[start:end]
+        self.next_key = page_keys[-1] if page_keys and end < len(keys) else None
+        self.previous_key = page_keys[0] if page_keys and start > 0 else None
+        return [keyset.get(_) for _ in page_keys]
+
+    def get_next_link(self):
+        if self.next_key is None:
+            return None
+        return self.encode_cursor('a', self.next_key)
+
+    def get_previous_link(self):
+        if self.previous_key is None:
+            return None
+        return self.encode_cursor('b', self.previous_key)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
@@ -0,0 +1,127 @@
+"""
+Pre-rendered responses for payloads that only change with the data, or with
+a deploy.
+
+A ``RenderedPayload`` renders its data once, keeps gzip and brotli variants of
+the bytes next to it and answers conditional requests from a strong ETag, so
+serving it costs a header check and a memory copy.
+"""
+import gzip
+import hashlib
+import io
+import re
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+
+from .renderers import FastJSONRenderer
+
+try:
+    import brotli
+except ImportError:  # brotli ships with whitenoise[brotli] but stays optional
+    brotli = None
+
+
+# Preferred order when a client accepts several encodings equally.
+ENCODING_PREFERENCE = ('br', 'gzip')
+
+accept_encoding_re = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+def accepted_encodings(header):
+    """
+    Return the content codings an Accept-Encoding header allows.
+    """
+    encodings = set()
+    for token in header.split(','):
+        match = accept_encoding_re.match(token)
+        if not match:
+            continue
+        coding, quality = match.groups()
+        try:
+            if quality is not None and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        encodings.add(coding.lower())
+    return encodings
+
+
+def gzip_compress(content):
+    # A fixed mtime keeps the compressed bytes identical across workers.
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(content)
+    return buffer.getvalue()
+
+
+def compress(content):
+    """
+    Return the compressed variants of ``content`` that are worth sending.
+    """
+    variants = {'gzip': gzip_compress(content)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(content)
+    return {
+        encoding: body
+        for encoding, body in variants.items()
+        if len(body) < len(content)
+    }
+
+
+class RenderedPayload:
+    """
+    JSON bytes for a fixed payload, with precompressed variants and an ETag.
+    """
+    content_type = 'application/json'
+
+    def __init__(self, data, etag):
+        self.etag = quote_etag(etag)
+        self.content = self.render(data)
+        self.variants = compress(self.content)
+
+    def render(self, data):
+        return FastJSONRenderer().render(data)
+
+    def is_not_modified(self, request):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if not if_none_match:
+            return False
+        etags = parse_etags(if_none_match)
+        # If-None-Match uses the weak comparison function.
+        return '*' in etags or any(
+            _.replace('W/', '', 1) == self.etag for _ in etags)
+
+    def response(self, request):
+        """
+        Build the HttpResponse for ``request``, honouring If-None-Match and
+        Accept-Encoding.
+        """
+        if self.is_not_modified(request):
+            response = HttpResponseNotModified()
+        else:
+            encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            encoding = next((_ for _ in ENCODING_PREFERENCE if _ in encodings and _ in self.variants), None)
+            response = HttpResponse(self.variants.get(encoding, self.content), content_type=self.content_type)
+            if encoding is not None:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = self.etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class RenderedTemplate(RenderedPayload):
+    """
+    A template rendered once, for pages that do not depend on the request.
+    The ETag is the hash of the page.
+    """
+    content_type = 'text/html; charset=utf-8'
+
+    def __init__(self, template_name, context=None):
+        content = render_to_string(template_name, context)
+        super().__init__(content, hashlib.sha1(content.encode('utf-8')).hexdigest())
+
+    def render(self, data):
+        return data.encode('utf-8')
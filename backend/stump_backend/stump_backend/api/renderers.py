@@ -0,0 +1,151 @@
+"""
+Renderers for the API.
+"""
+import csv
+import json
+
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+
+def has_floats(data):
+    """
+    Whether ``data`` holds a float in its dicts, lists and tuples.
+    """
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            return True
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    The output matches JSONRenderer's compact, UTF-8 form: datetimes, decimals
+    and other types orjson would format differently are handed to DRF's
+    encoder. Data orjson cannot encode the same way, i.e. floats (formatted
+    differently, and non-finite ones not refused) and integers wider than 64
+    bits, is rendered by JSONRenderer, as are indented and ASCII-only output.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if has_floats(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=encoders.JSONEncoder().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except TypeError:  # orjson.JSONEncodeError, e.g. for big integers
+            return super().render(data, accepted_media_type, renderer_context)
+        # Keep JSONRenderer's escaping of \u2028 and \u2029, which are not
+        # valid inside javascript string literals.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+def _rows_of(data):
+    """
+    Return ``data`` as a list of dicts for the line-oriented renderers.
+    """
+    if data is None:
+        return []
+    if isinstance(data, dict):
+        return [data]
+    return list(data)
+
+
+class StreamingRenderer(renderers.BaseRenderer):
+    """
+    Base class for line-oriented renderers that can also stream.
+
+    ``render()`` handles regular responses (single objects, errors); ``stream()``
+    turns an iterator of row tuples into an iterator of byte chunks, so an
+    export never holds more than ``chunk_size`` rows in memory.
+    """
+    charset = 'utf-8'
+    chunk_size = 1000
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = _rows_of(data)
+        fields = tuple(dict.fromkeys(field for row in rows for field in row))
+        return b''.join(self.stream(fields, ([row.get(_) for _ in fields] for row in rows)))
+
+    def stream(self, fields, rows):
+        raise NotImplementedError('StreamingRenderer class requires .stream() to be implemented')
+
+    def chunked(self, lines):
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= self.chunk_size:
+                yield b''.join(chunk)
+                chunk = []
+        if chunk:
+            yield b''.join(chunk)
+
+
+class NDJSONRenderer(StreamingRenderer):
+    """
+    Newline-delimited JSON: one object per line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def stream(self, fields, rows):
+        encoder = FastJSONRenderer()
+        return self.chunked(encoder.render(dict(zip(fields, row))) + b'\n' for row in rows)
+
+
+class _Echo:
+    """
+    File-like object whose write() returns the value, for csv.writer.
+    """
+
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(StreamingRenderer):
+    """
+    Comma-separated values with a header row.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, fields, rows):
+        writer = csv.writer(_Echo())
+        default = encoders.JSONEncoder().default
+
+        def cell(value):
+            if value is None or isinstance(value, (str, int, float)):
+                return value
+            if isinstance(value, (dict, list, tuple)):
+                return json.dumps(value, default=default, separators=(',', ':'))
+            return default(value)
+
+        def lines():
+            yield writer.writerow(fields).encode(self.charset)
+            for row in rows:
+                yield writer.writerow([cell(_) for _ in row]).encode(self.charset)
+
+        return self.chunked(lines())
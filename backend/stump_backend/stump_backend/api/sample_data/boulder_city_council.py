@@ -1,113 +0,0 @@
-data = {"responses": [
-    {"hits":
-     {"total": 15, "hits": [
-         {"_version": 33489, "found": True, "_source":
-          {"first_name_text": "Corina", "last_name_text": "Julca",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1567833509981, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567834245061,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1567833505377x108162512166489760/CorinaJulca1.jpg",
-           "_name_text": "corinajulca", "_id": "1567833509981x812645170968146600", "_version": 33489, "_type": "custom.candidate1"
-           },
-          "_type": "custom.candidate1", "_id": "1567833509981x812645170968146600"
-          },
-         {"_version": 33227, "found": True, "_source":
-          {"first_name_text": "NIkki", "last_name_text": "McCord",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1566413779886, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567833624055,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1566414034629x846757250922443000/NikkiMcCord.jpg",
-           "_name_text": "nikkimccord", "_id": "1566413779886x932966331265669800", "_version": 33227, "_type": "custom.candidate1"
-           },
-          "_type": "custom.candidate1", "_id": "1566413779886x932966331265669800"
-          },
-         {"_version": 33223, "found": True, "_source":
-          {"first_name_text": "Bob", "last_name_text": "Yates",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1566413778924, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567890533252,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1566414074492x106969823749339280/BobYates.jpeg",
-           "_name_text": "bobyates", "_id": "1566413778924x664987345228391000", "_version": 33223, "_type": "custom.candidate1"},
-          "+type": "custom.candidate1", "_id": "1566413778924x664987345228391000"},
-         {"_version": 33230, "found": True, "_source":
-          {"first_name_text": "Mark", "last_name_text": "Wallach",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1566413780908, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567833233392,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1566413968476x162362208285407040/MarkWallach.png",
-           "_name_text": "markwallach", "_id": "1566413780908x958670237695702800", "_version": 33230, "_type": "custom.candidate1"},
-          "_type": "custom.candidate1", "_id": "1566413780908x958670237695702800"},
-         {"_version": 33222, "found": True, "_source":
-          {"first_name_text": "Benita", "last_name_text": "Duran",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1566413778677, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567890537346,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1566414083272x161413637031974750/BenitaDuran.jpeg",
-           "_name_text": "benitaduran", "_id": "1566413778677x932888906347215500", "_version": 33222, "_type": "custom.candidate1"},
-          "_type": "custom.candidate1", "_id": "1566413778677x932888906347215500"},
-         {"_version": 33491, "found": True, "_source":
-          {"first_name_text": "Paul", "last_name_text": "Cure",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1567833565087, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567834232956,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1567833562849x769091631286358700/PaulCure1.jpg",
-           "_name_text": "paulcure", "_id": "1567833565087x747960924960963000", "_version": 33491, "_type": "custom.candidate1"},
-          "_type": "custom.candidate1", "_id": "1567833565087x747960924960963000"},
-         {"_version": 33229, "found": True, "_source":
-          {"first_name_text": "Gala", "last_name_text": "Orba", "middle_name_text": "Wilhelmina",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1566413780636, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567864108176,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1566413978496x465413139590871800/GalaOrba.jpg",
-           "_name_text": "galaorba", "_id": "1566413780636x691004575202686700", "_version": 33229, "_type": "custom.candidate1"},
-          "_type": "custom.candidate1", "_id": "1566413780636x691004575202686700"},
-         {"_version": 33225, "found": True, "_source":
-          {"first_name_text": "Rachel", "last_name_text": "Friend",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1566413779395, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567890521979,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1566414055908x390218361810565000/RachelFriend.jpg",
-           "_name_text": "rachelfriend", "_id": "1566413779395x738369176423443200", "_version": 33225, "_type": "custom.candidate1"},
-          "_type": "custom.candidate1", "_id": "1566413779395x738369176423443200"},
-         {"_version": 33490, "found": True, "_source":
-          {"first_name_text": "Andy", "last_name_text": "Celani",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1567833539465, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567834239073,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1567833537093x913607933683309400/AndyCelani1.jpg",
-           "_name_text": "andycelani", "_id": "1567833539465x826970714895931500", "_version": 33490, "_type": "custom.candidate1"},
-          "_type": "custom.candidate1", "_id": "1567833539465x826970714895931500"},
-         {"_version": 33228, "found": True, "_source":
-          {"first_name_text": "Susan", "last_name_text": "Peterson",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1566413780444, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567833710242,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1566413989336x839332869946852400/SusanPeterson.jpg",
-           "_name_text": "susanpeterson", "_id": "1566413780444x836701825014107100", "_version": 33228, "_type": "custom.candidate1"},
-          "_type": "custom.candidate1", "_id": "1566413780444x836701825014107100"},
-         {"_version": 33224, "found": True, "_source":
-          {"first_name_text": "Brian", "last_name_text": "Dolan",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1566413779160, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567833173297,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1566414063076x169396777571751100/BrianDolan.jpg",
-           "_name_text": "briandolan", "_id": "1566413779160x872976996200513400", "_version": 33224, "_type": "custom.candidate1"},
-          "_type": "custom.candidate1", "_id": "1566413779160x872976996200513400"},
-         {"_version": 33220, "found": True, "_source":
-          {"first_name_text": "Junie", "last_name_text": "Joseph", "phone_number_text": "321-274-5485",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1566358043434, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1571076058576,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1566358164019x906430848261430300/JunieJoseph.jpg",
-           "_name_text": "juniejoseph", "_id": "1566358043434x581767805302220800", "_version": 33220, "_type": "custom.candidate1"},
-          "_type": "custom.candidate1", "_id": "1566358043434x581767805302220800"},
-         {"_version": 34288, "found": True, "_source":
-          {"first_name_text": "Aaron", "last_name_text": "Brockett",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1571188245270, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1571188245270,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1571188234748x606472957526041900/aaronbrockett.jpg",
-           "_name_text": "aaronbrockett", "_id": "1571188245270x622972512547684000", "_version": 34288, "_type": "custom.candidate1"},
-          "_type": "custom.candidate1", "_id": "1571188245270x622972512547684000"},
-         {"_version": 33226, "found": True, "_source":
-          {"first_name_text": "Mark", "last_name_text": "McIntyre",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1566413779642, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567890529417,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1566414046024x764587013829957100/MarkMcIntyre2.png",
-           "_name_text": "markmcintyre", "_id": "1566413779642x845206914179105200", "_version": 33226, "_type": "custom.candidate1"},
-          "_type": "custom.candidate1", "_id": "1566413779642x845206914179105200"},
-         {"_version": 33221, "found": True, "_source":
-          {"first_name_text": "Adam", "last_name_text": "Swetlik",
-           "race_custom_race1": "1348695171700984260__LOOKUP__1566357485075x999935322821441400",
-           "Created Date": 1566413778439, "Created By": "1348695171700984260__LOOKUP__1548626722301x203599609492054900", "Modified Date": 1567833253765,
-           "photo_image": "//s3.amazonaws.com/appforest_uf/f1566414094862x122082004739618720/AdamSwetlik.jpg",
-           "_name_text": "adamswetlik", "_id": "1566413778439x750557760146244500", "_version": 33221, "_type": "custom.candidate1"},
-          "_type": "custom.candidate1", "_id": "1566413778439x750557760146244500"}
-     ]}, "at_end": True, "search_version": 1584245584918, "extras": []}]}
@@ -0,0 +1,172 @@
+"""
+Typo-tolerant prefix search over candidate names.
+
+The index is built once per store. Every prefix of every name token maps to
+the records holding that token, so an exact prefix lookup is one dict access.
+Misspelled terms are looked up in a second index: terms short enough to allow
+one typo through the one-deletion variants of every token prefix, longer ones
+through the tokens' trigrams. Only the tokens found there are compared with
+the term, never the whole list.
+"""
+import heapq
+import unicodedata
+
+
+SEARCH_FIELDS = ('first_name_text', 'middle_name_text', 'last_name_text', '_name_text')
+DEFAULT_LIMIT = 10
+
+
+def normalize(text):
+    """
+    Lowercase ``text`` and strip accents and punctuation.
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if c.isalnum() or c.isspace()).lower()
+
+
+def tokenize(text):
+    return normalize(text).split()
+
+
+def max_typos(term):
+    """
+    Number of edits tolerated in a query term of this length.
+    """
+    if len(term) < 4:
+        return 0
+    if len(term) < 8:
+        return 1
+    return 2
+
+
+def deletions(text):
+    """
+    The strings one character deletion away from ``text``.
+    """
+    return {text[:i] + text[i + 1:] for i in range(len(text))}
+
+
+def trigrams(token):
+    """
+    Yield (position, trigram) for ``token`` padded at the start, so that the
+    leading trigrams anchor prefixes.
+    """
+    padded = '  ' + token
+    for position in range(len(token)):
+        yield position, padded[position:position + 3]
+
+
+def prefix_distance(term, token, limit):
+    """
+    Return the edit distance between ``term`` and the closest prefix of
+    ``token``, or None if it is more than ``limit``.
+    """
+    # Prefixes longer than this are more than ``limit`` edits away.
+    token = token[:len(term) + limit]
+    previous = list(range(len(token) + 1))
+    for i, char in enumerate(term, 1):
+        current = [i]
+        for j, other in enumerate(token, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        if min(current) > limit:
+            return None
+        previous = current
+    distance = min(previous)
+    return distance if distance <= limit else None
+
+
+class SearchIndex:
+    """
+    Prefix and trigram index over the name fields of a sequence of records.
+
+    ``search()`` returns the records matching every query term, best first:
+    fewest typos, then by name.
+    """
+
+    def __init__(self, records, fields=SEARCH_FIELDS):
+        self.records = tuple(records)
+        self._prefixes = {}
+        self._postings = {}
+        self._variants = {}
+        self._trigrams = {}
+        self._names = []
+        for position, record in enumerate(self.records):
+            tokens = set()
+            for field in fields:
+                tokens.update(tokenize(record.get(field)))
+            for token in tokens:
+                self._postings.setdefault(token, set()).add(position)
+                for end in range(1, len(token) + 1):
+                    self._prefixes.setdefault(token[:end], set()).add(position)
+            self._names.append(normalize(' '.join(str(record.get(_) or '') for _ in fields)))
+        for token in self._postings:
+            # One-typo terms are 4 to 7 characters long, so the prefixes they
+            # can match are 3 to 8 characters long.
+            for end in range(3, min(len(token), 8) + 1):
+                prefix = token[:end]
+                for variant in deletions(prefix) | {prefix}:
+                    self._variants.setdefault(variant, set()).add(token)
+            for position, gram in trigrams(token):
+                self._trigrams.setdefault(gram, []).append((token, position))
+
+    def __len__(self):
+        return len(self.records)
+
+    def match_term(self, term):
+        """
+        Return {position: typos} for the records with a token starting with
+        ``term``, allowing ``max_typos(term)`` edits.
+        """
+        matches = dict.fromkeys(self._prefixes.get(term, ()), 0)
+        limit = max_typos(term)
+        if not limit:
+            return matches
+        for token in self.fuzzy_candidates(term, limit):
+            typos = prefix_distance(term, token, limit)
+            if not typos:
+                continue
+            for position in self._postings[token]:
+                if typos < matches.get(position, typos + 1):
+                    matches[position] = typos
+        return matches
+
+    def fuzzy_candidates(self, term, limit):
+        """
+        Return the tokens that may have a prefix within ``limit`` edits of ``term``.
+        """
+        if limit == 1:
+            # A substitution, insertion or deletion leaves the term and some
+            # prefix of the token with a one-deletion variant in common.
+            tokens = set()
+            for variant in deletions(term) | {term}:
+                tokens.update(self._variants.get(variant, ()))
+            return tokens
+        # Count the trigrams each token shares with the term at about the same
+        # position; each edit changes at most three of the term's trigrams.
+        shared = {}
+        for position, gram in trigrams(term):
+            for token, token_position in self._trigrams.get(gram, ()):
+                if abs(token_position - position) <= limit:
+                    shared[token] = shared.get(token, 0) + 1
+        threshold = max(len(term) - 3 * limit, 1)
+        return [token for token, count in shared.items() if count >= threshold]
+
+    def search(self, query, limit=DEFAULT_LIMIT, where=None):
+        """
+        Return up to ``limit`` records matching every term of ``query`` and,
+        if given, the ``where(record)`` predicate.
+        """
+        scores = None
+        for term in tokenize(query):
+            matches = self.match_term(term)
+            if scores is not None:
+                matches = {_: scores[_] + typos for _, typos in matches.items() if _ in scores}
+            scores = matches
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        if where is not None:
+            scores = {_: typos for _, typos in scores.items() if where(self.records[_])}
+        ranked = heapq.nsmallest(limit, scores, key=lambda _: (scores[_], self._names[_], _))
+        return [self.records[_] for _ in ranked]
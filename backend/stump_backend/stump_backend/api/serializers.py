@@ -1,8 +1,164 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
 from rest_framework import serializers
+from .instrumentation import timing
 from .models import Sample
 
 
-class SampleSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Serializer mixin that keeps only the fields named in the ``fields``
+    argument, if one is given.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class TimedDataMixin:
+    """
+    Serializer mixin counting the time spent building ``data`` as the
+    request's serialize time (see ``api.instrumentation``).
+    """
+
+    @property
+    def data(self):
+        with timing('serialize_time'):
+            return super().data
+
+
+class BulkListSerializer(TimedDataMixin, serializers.ListSerializer):
+    """
+    ListSerializer that writes with one bulk query instead of one per item.
+
+    ``update()`` expects ``instance`` to be the list of model instances in the
+    same order as the validated items. bulk_create() and bulk_update() do not
+    send model signals.
+    """
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        return model.objects.bulk_create([model(**attrs) for attrs in validated_data])
+
+    def update(self, instance, validated_data):
+        model = self.child.Meta.model
+        fields = set()
+        for obj, attrs in zip(instance, validated_data):
+            for attr, value in attrs.items():
+                setattr(obj, attr, value)
+            fields.update(attrs)
+        if fields:
+            model.objects.bulk_update(instance, sorted(fields))
+        return instance
+
+
+class SampleSerializer(TimedDataMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Sample
         fields = ('id', 'title', 'description')
+        list_serializer_class = BulkListSerializer
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path for list endpoints.
+
+    Rows come straight from ``values()``/``values_list()`` and are returned as
+    they are, skipping the per-instance, per-field work of a ModelSerializer.
+    It is only offered for serializers whose fields all map one-to-one onto
+    columns that already hold their JSON representation; anything else, and
+    every write, goes through the regular serializer.
+    """
+    # Serializer fields whose to_representation() returns a column value as is.
+    passthrough_serializer_fields = (
+        serializers.BooleanField,
+        serializers.CharField,
+        serializers.IntegerField,
+    )
+    # Model fields whose Python values are plain str, int or bool.
+    passthrough_model_fields = (
+        models.AutoField,
+        models.BooleanField,
+        models.CharField,
+        models.IntegerField,
+        models.TextField,
+    )
+    _compiled = {}
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = tuple(fields)
+
+    @classmethod
+    def compile(cls, serializer_class):
+        """
+        Return the column names ``serializer_class`` renders, or None if it
+        cannot take the fast path. The answer is computed once per class.
+        """
+        if serializer_class not in cls._compiled:
+            cls._compiled[serializer_class] = cls._compile(serializer_class)
+        return cls._compiled[serializer_class]
+
+    @classmethod
+    def _compile(cls, serializer_class):
+        model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+        if model is None:
+            return None
+        columns = []
+        for field_name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if field.source != field_name or not isinstance(field, cls.passthrough_serializer_fields):
+                return None
+            try:
+                model_field = model._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                return None
+            if not isinstance(model_field, cls.passthrough_model_fields) or model_field.attname != field_name:
+                return None
+            columns.append(field_name)
+        return tuple(columns)
+
+    @classmethod
+    def for_serializer(cls, serializer_class, fields=None):
+        """
+        Return a ValuesSerializer for ``serializer_class`` limited to
+        ``fields``, or None if the serializer needs the regular path.
+        """
+        columns = cls.compile(serializer_class)
+        if columns is None:
+            return None
+        if fields is not None:
+            columns = tuple(_ for _ in fields if _ in columns)
+        return cls(serializer_class.Meta.model, columns)
+
+    def values(self, queryset, *extra):
+        """
+        Return ``queryset`` as dicts holding the serialized fields, plus any
+        ``extra`` columns needed by the caller (e.g. a pagination key).
+        """
+        return queryset.values(*(self.fields + tuple(_ for _ in extra if _ not in self.fields)))
+
+    def values_list(self, queryset):
+        """
+        Return ``queryset`` as tuples in the order of ``fields``.
+        """
+        return queryset.values_list(*self.fields)
+
+    def to_representation(self, rows):
+        """
+        Turn ``values()`` dicts or ``values_list()`` tuples into response dicts.
+        """
+        fields = self.fields
+        result = []
+        with timing('serialize_time'):
+            for row in rows:
+                if isinstance(row, dict):
+                    result.append(row if len(row) == len(fields) else {_: row[_] for _ in fields})
+                else:
+                    result.append(dict(zip(fields, row)))
+        return result
@@ -0,0 +1,41 @@
+"""
+Signal handlers for the api app.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .models import Candidate, CandidateChange, Race, Sample
+
+
+@receiver([post_save, post_delete], sender=Sample)
+@receiver([post_save, post_delete], sender=Candidate)
+@receiver([post_save, post_delete], sender=Race)
+def invalidate_cached_responses(sender, **kwargs):
+    invalidate_on_write(sender)
+
+
+@receiver(post_save, sender=Candidate)
+def log_candidate_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        CandidateChange.for_candidate(instance).save()
+
+
+@receiver(post_delete, sender=Candidate)
+def log_candidate_delete(sender, instance, **kwargs):
+    CandidateChange.for_candidate(instance, CandidateChange.DELETE).save()
+
+
+def invalidate_on_write(model):
+    """
+    Invalidate cached responses built from ``model`` after a write.
+
+    The generation is bumped right away, so the writer's next read is fresh,
+    and again on commit, so an entry cached by a concurrent request from the
+    pre-commit data does not survive the transaction.
+    """
+    invalidate(model)
+    transaction.on_commit(partial(invalidate, model))
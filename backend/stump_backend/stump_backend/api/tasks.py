@@ -0,0 +1,15 @@
+"""
+Background jobs of the api app, run by ``manage.py run_worker``.
+"""
+from . import warmup
+from .jobs import job
+
+
+@job
+def warm_responses(paths):
+    """
+    Fetch ``paths`` so that their responses are cached again after a write.
+    """
+    failed = {path: code for path, code in warmup.warm(paths).items() if code >= 500}
+    if failed:
+        raise RuntimeError('Warming failed: {}'.format(failed))
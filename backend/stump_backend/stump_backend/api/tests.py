@@ -1,17 +1,51 @@
-from django.test import TestCase
-from django.urls import reverse
+import asyncio
+import csv
+import datetime
+import gzip
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import Http404, HttpResponse
+from django.urls import resolve, reverse
+from django.utils import timezone
 from django.test import TransactionTestCase
-from rest_framework import status
-from json import loads
-from .models import Sample
+from rest_framework import serializers, status
+from rest_framework.renderers import JSONRenderer
+from json import dumps, loads
+from .models import Candidate, Job, Race, Sample
+from . import candidates, changes, datasets, districts, importers, instrumentation, jobs, metrics, search, tasks, thumbnails, urls, views, warmup
+from .async_views import async_urlpatterns
+from .cache import acquire_fill_lock, get_cache, release_fill_lock, response_cache_key
+from .coalesce import AsyncSingleFlight, SingleFlight
+from .management.commands import benchmark_api
+from .renderers import FastJSONRenderer
+from .search import SearchIndex
+from .serializers import SampleSerializer, ValuesSerializer
+from .thumbnails import Image
+from .throttling import TokenBucketThrottle
 
 # Create your tests here.
 
 
 class SampleApiTestCase(TransactionTestCase):
+    reset_sequences = True
 
     def setUp(self):
         super().setUp()
+        get_cache().clear()
 
     def test_sample_view_success(self):
         s1 = Sample.objects.create(title='Title 1', description='Description 1')
@@ -22,7 +56,8 @@ class SampleApiTestCase(TransactionTestCase):
         response = self.client.get(url)
         self.assertEquals(response.status_code, status.HTTP_200_OK)
         response_json = loads(response.content)
-        self.assertEquals(response_json, [{'id': 1, 'title': 'Title 1', 'description': 'Description 1'}, {'id': 2, 'title': 'Title 2', 'description': 'Description 2'}])
+        self.assertEquals(response_json['results'], [{'id': 1, 'title': 'Title 1', 'description': 'Description 1'}, {'id': 2, 'title': 'Title 2', 'description': 'Description 2'}])
+        self.assertIsNone(response_json['next'])
 
         # detail view
         url = reverse('sample-detail', kwargs={'pk': s1.pk})
@@ -42,3 +77,1346 @@ class SampleApiTestCase(TransactionTestCase):
         s3 = Sample.objects.last()
         self.assertEquals(s3.title, data['title'])
         self.assertEquals(s3.description, data['description'])
+
+    def test_sample_view_pagination(self):
+        for i in range(5):
+            Sample.objects.create(title='Title {}'.format(i), description='Description {}'.format(i))
+
+        url = reverse('sample-list')
+        titles = []
+        response = self.client.get(url, {'page_size': 2})
+        while True:
+            self.assertEquals(response.status_code, status.HTTP_200_OK)
+            response_json = loads(response.content)
+            titles.extend(_['title'] for _ in response_json['results'])
+            if response_json['next'] is None:
+                break
+            response = self.client.get(response_json['next'])
+        self.assertEquals(titles, ['Title {}'.format(i) for i in range(5)])
+
+        # cursors walk back as well
+        response = self.client.get(response_json['previous'])
+        self.assertEquals([_['title'] for _ in loads(response.content)['results']], ['Title 2', 'Title 3'])
+
+    def test_sample_view_sparse_fields(self):
+        s1 = Sample.objects.create(title='Title 1', description='Description 1')
+
+        url = reverse('sample-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'title'})
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(loads(response.content)['results'], [{'title': 'Title 1'}])
+        self.assertNotIn('description', queries.captured_queries[-1]['sql'])
+
+        url = reverse('sample-detail', kwargs={'pk': s1.pk})
+        response = self.client.get(url, {'fields': 'id,description'})
+        self.assertEquals(loads(response.content), {'id': s1.pk, 'description': 'Description 1'})
+
+        response = self.client.get(url, {'fields': 'id,password'})
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CandidateApiTestCase(TestCase):
+
+    def test_candidate_view_success(self):
+        store = datasets.registry.get('boulder_city_council')
+
+        # list view
+        url = reverse('candidate-list')
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        response_json = loads(response.content)
+        self.assertEquals(len(response_json), len(store))
+        self.assertEquals([_['_id'] for _ in response_json], [_['_id'] for _ in store])
+        self.assertIn('Created Date X', response_json[0])
+        self.assertIn('Modified Date X', response_json[0])
+
+        # detail view
+        candidate = store.candidates[3]
+        url = reverse('candidate-detail', kwargs={'pk': candidate['_id']})
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        response_json = loads(response.content)
+        self.assertEquals(response_json['_id'], candidate['_id'])
+        self.assertEquals(response_json['last_name_text'], candidate['last_name_text'])
+
+        # unknown candidate
+        url = reverse('candidate-detail', kwargs={'pk': 'missing'})
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_candidate_view_pagination_and_fields(self):
+        store = datasets.registry.get('boulder_city_council')
+
+        url = reverse('candidate-list')
+        ids = []
+        response = self.client.get(url, {'page_size': 4, 'fields': '_id,photo_image'})
+        while True:
+            self.assertEquals(response.status_code, status.HTTP_200_OK)
+            response_json = loads(response.content)
+            self.assertTrue(all(set(_) == {'_id', 'photo_image'} for _ in response_json['results']))
+            ids.extend(_['_id'] for _ in response_json['results'])
+            if response_json['next'] is None:
+                break
+            response = self.client.get(response_json['next'])
+        self.assertEquals(ids, sorted(_['_id'] for _ in store))
+
+        response = self.client.get(response_json['previous'])
+        self.assertEquals([_['_id'] for _ in loads(response.content)['results']], ids[8:12])
+
+        response = self.client.get(url, {'cursor': 'not a cursor'})
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # sparse fields without pagination
+        response = self.client.get(url, {'fields': 'first_name_text,last_name_text'})
+        response_json = loads(response.content)
+        self.assertEquals(response_json[0], {
+            'first_name_text': store.candidates[0]['first_name_text'],
+            'last_name_text': store.candidates[0]['last_name_text'],
+        })
+        response = self.client.get(url, {'fields': 'first_name_text,ssn'})
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_candidate_store_is_immutable(self):
+        store = datasets.registry.get('boulder_city_council')
+        candidate = store.candidates[0]
+        self.assertIs(store.get(candidate['_id']), candidate)
+        self.assertIsNone(store.get('missing'))
+        self.assertEquals(candidate['Created Date X'], datetime.datetime.fromtimestamp(candidate['Created Date'] / 1000.0))
+        with self.assertRaises(TypeError):
+            candidate['first_name_text'] = 'Someone Else'
+        with self.assertRaises(TypeError):
+            candidate.update({'first_name_text': 'Someone Else'})
+
+    def test_candidate_view_conditional_get(self):
+        store = datasets.registry.get('boulder_city_council')
+
+        # list view
+        url = reverse('candidate-list')
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertIn(str(store.search_version), etag)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEquals(response['ETag'], etag)
+        self.assertEquals(response.content, b'')
+
+        # compressed variants carry the same document
+        identity = self.client.get(url).content
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEquals(response['Content-Encoding'], 'gzip')
+        self.assertEquals(gzip.decompress(response.content), identity)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        # detail view
+        candidate = store.candidates[0]
+        url = reverse('candidate-detail', kwargs={'pk': candidate['_id']})
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn(str(candidate['_version']), etag)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"stale", ' + etag)
+        self.assertEquals(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+
+    def test_candidate_search(self):
+        url = reverse('candidate-search')
+        response = self.client.get(url, {'q': 'mark'})
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(sorted(_['last_name_text'] for _ in loads(response.content)), ['McIntyre', 'Wallach'])
+
+        # several terms, prefixes, the joined name and typos
+        for query in ('Mark Wal', 'wallach mark', 'markwa', 'Marc Walach'):
+            response = self.client.get(url, {'q': query, 'fields': '_id,last_name_text'})
+            self.assertEquals(loads(response.content)[0], {
+                '_id': datasets.registry.get('boulder_city_council').search_index.search('mark wallach')[0]['_id'],
+                'last_name_text': 'Wallach'})
+        self.assertEquals(loads(self.client.get(url, {'q': 'mark', 'limit': 1}).content)[0]['first_name_text'], 'Mark')
+        self.assertEquals(loads(self.client.get(url, {'q': 'zzzz'}).content), [])
+        self.assertEquals(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(self.client.get(url, {'q': 'mark', 'limit': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        # modified_since filters the results of the whole store's index
+        store = datasets.registry.get('boulder_city_council')
+        since = max(_['Modified Date'] for _ in store.search_index.search('mark'))
+        with mock.patch('api.candidates.SearchIndex') as index:
+            response = self.client.get(url, {'q': 'mark', 'modified_since': since, 'fields': 'Modified Date'})
+        index.assert_not_called()
+        self.assertEquals(loads(response.content), [{'Modified Date': since}])
+
+    def test_candidate_view_filters(self):
+        store = datasets.registry.get('boulder_city_council')
+        race = store.candidates[0]['race_custom_race1']
+        url = reverse('candidate-list')
+        response_json = loads(self.client.get(url, {'race': race}).content)
+        self.assertEquals([_['_id'] for _ in response_json],
+                          [_['_id'] for _ in store if _['race_custom_race1'] == race])
+        self.assertIs(store.for_race(race).rendered_list(), store.for_race(race).rendered_list())
+        self.assertEquals(loads(self.client.get(url, {'race': 'missing', 'fields': '_id'}).content), [])
+
+        # modified_since is inclusive and accepts milliseconds or ISO 8601
+        times = sorted(_['Modified Date'] for _ in store)
+        since = times[-3]
+        expected = [_['_id'] for _ in store if _['Modified Date'] >= since]
+        iso = datetime.datetime.fromtimestamp(since / 1000.0, tz=datetime.timezone.utc).isoformat()
+        for value in (str(since), iso):
+            response = self.client.get(url, {'modified_since': value, 'race': race, 'fields': '_id'})
+            self.assertEquals([_['_id'] for _ in loads(response.content)],
+                              [_ for _ in expected if store.get(_)['race_custom_race1'] == race])
+        response = self.client.get(url, {'modified_since': since, 'page_size': 100})
+        self.assertEquals(sorted(_['_id'] for _ in loads(response.content)['results']), sorted(expected))
+        self.assertEquals(self.client.get(url, {'modified_since': 'yesterday'}).status_code,
+                          status.HTTP_400_BAD_REQUEST)
+
+    def test_candidate_changes(self):
+        store = datasets.registry.get('boulder_city_council')
+        url = reverse('candidate-changes')
+
+        def version(seq):
+            return '{}:{}'.format(store.version, seq)
+        response_json = loads(self.client.get(url).content)
+        self.assertEquals(response_json['version'], version(len(store)))
+        self.assertFalse(response_json['more'])
+        self.assertEquals(sorted(_['id'] for _ in response_json['changes']), sorted(store.keys))
+        self.assertEquals({_['op'] for _ in response_json['changes']}, {'upsert'})
+
+        # paging through the log with limit
+        response_json = loads(self.client.get(url, {'since': 0, 'limit': 10}).content)
+        self.assertEquals((response_json['version'], response_json['more']), (version(10), True))
+        response_json = loads(self.client.get(url, {'since': version(10), 'limit': 10}).content)
+        self.assertEquals((response_json['version'], response_json['more']), (version(len(store)), False))
+        self.assertEquals(len(response_json['changes']), len(store) - 10)
+
+        # nothing new
+        response_json = loads(self.client.get(url, {'since': version(len(store))}).content)
+        self.assertEquals((response_json['version'], response_json['changes']), (version(len(store)), []))
+
+        self.assertEquals(self.client.get(url, {'since': version(len(store) + 1)}).status_code, status.HTTP_410_GONE)
+        self.assertEquals(self.client.get(url, {'since': 10}).status_code, status.HTTP_410_GONE)
+        self.assertEquals(self.client.get(url, {'since': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(self.client.get(url, {'limit': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        # new data continues the log: clients get what changed since their version
+        old = version(len(store))
+        changed = dict(store.candidates[1], _version=store.candidates[1].get('_version', 0) + 1)
+        updated = candidates.CandidateStore([changed] + list(store.candidates[2:]), store.search_version)
+        updated.follow(store)
+        with mock.patch.object(views.BoulderCandidatesViewSet, 'load_store', return_value=updated):
+            response_json = loads(self.client.get(url, {'since': old}).content)
+            self.assertEquals([(_['seq'], _['op'], _['id']) for _ in response_json['changes']], [
+                (len(store) + 1, 'upsert', changed['_id']), (len(store) + 2, 'delete', store.candidates[0]['_id'])])
+            self.assertEquals(response_json['changes'][0]['record']['_version'], changed['_version'])
+            self.assertFalse(response_json['more'])
+            self.assertEquals(response_json['version'], '{}:{}'.format(updated.change_log.snapshot, len(store) + 2))
+            response_json = loads(self.client.get(url, {'since': version(10), 'limit': 5}).content)
+            self.assertEquals([_['seq'] for _ in response_json['changes']], list(range(11, 16)))
+            self.assertEquals(self.client.get(url, {'since': version(len(store) + 1)}).status_code,
+                              status.HTTP_410_GONE)
+
+        # a log built from other data does not know these versions
+        rebuilt = candidates.CandidateStore(updated.candidates, store.search_version)
+        with mock.patch.object(views.BoulderCandidatesViewSet, 'load_store', return_value=rebuilt):
+            self.assertEquals(self.client.get(url, {'since': old}).status_code, status.HTTP_410_GONE)
+            response_json = loads(self.client.get(url, {'since': 0}).content)
+            self.assertEquals(response_json['version'], '{}:{}'.format(rebuilt.version, len(rebuilt)))
+
+    def test_search_index(self):
+        index = search.SearchIndex([
+            {'first_name_text': 'José', 'last_name_text': 'Álvarez'},
+            {'first_name_text': 'Joseph', 'last_name_text': 'Alvarado'},
+            {'first_name_text': 'Jo', 'last_name_text': 'Smith'},
+        ])
+
+        def names(query):
+            return [_['first_name_text'] for _ in index.search(query)]
+        self.assertEquals(names('jo'), ['Jo', 'José', 'Joseph'])
+        self.assertEquals(names('jose alv'), ['José', 'Joseph'])
+        # exact matches rank before typos; short terms allow none
+        self.assertEquals(names('josep'), ['Joseph', 'José'])
+        self.assertEquals(names('alvarex'), ['José'])
+        self.assertEquals(names('js'), [])
+        self.assertEquals(names(''), [])
+
+
+class DatasetRegistryTestCase(TestCase):
+
+    def test_datasets_load_lazily(self):
+        source = datasets.read_data_file(datasets.registry['boulder_city_council'].path)
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'springfield.json'), 'w') as f:
+                f.write(dumps(source))
+            with open(os.path.join(directory, 'README'), 'w') as f:
+                f.write('not a dataset')
+            registry = datasets.DatasetRegistry()
+            registry.discover(directory)
+            self.assertEquals(registry.names(), ['springfield'])
+            self.assertFalse(registry['springfield'].loaded)
+
+            store = registry.get('springfield')
+            self.assertTrue(registry['springfield'].loaded)
+            self.assertIs(registry.get('springfield'), store)
+            self.assertEquals(store.keys, datasets.registry.get('boulder_city_council').keys)
+            with self.assertRaises(ValueError):
+                registry.discover(directory)
+
+            # a replaced file is read again, and the new store continues the log
+            old_version = store.change_log.format_version(store.change_log.latest)
+            source['responses'][0]['hits']['hits'].pop()
+            with open(os.path.join(directory, 'springfield.json'), 'w') as f:
+                f.write(dumps(source))
+            os.utime(os.path.join(directory, 'springfield.json'), ns=(0, 0))
+            self.assertIs(registry.get('springfield'), store)
+            with mock.patch('time.monotonic', return_value=time.monotonic() + datasets.RELOAD_INTERVAL):
+                updated = registry.get('springfield')
+            self.assertEquals(len(updated), len(store) - 1)
+            log = updated.change_log
+            self.assertEquals([_['op'] for _ in log.after(log.parse_version(old_version), 10)], ['delete'])
+
+
+@skipUnless(Image, 'Pillow is not installed')
+class ThumbnailsTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.root = os.path.join(tmpdir.name, 'thumbnails')
+        settings_override = override_settings(API_THUMBNAIL_ROOT=self.root, API_THUMBNAIL_SIZES=(96, 384))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Fixture photos: a large one, one smaller than every size, and a missing one,
+        # fetched from the temporary directory by self.fetch
+        self.photos = {}
+        for name, size, image_format in (('large.jpg', (800, 600), 'JPEG'), ('small.png', (50, 40), 'PNG')):
+            Image.new('RGB', size, (200, 30, 30)).save(os.path.join(tmpdir.name, name), image_format)
+        for name in ('large.jpg', 'small.png', 'missing.jpg'):
+            self.photos[name] = 'https://photos.example.com/' + name
+
+        def fetch(url):
+            with open(os.path.join(tmpdir.name, url.rpartition('/')[2]), 'rb') as f:
+                return f.read()
+        self.fetch = fetch
+        self.datasets = datasets.DatasetRegistry()
+        with open(os.path.join(tmpdir.name, 'springfield.json'), 'w') as f:
+            f.write(dumps({'responses': [{'hits': {'hits': [
+                {'_source': {'_id': 'c1', 'photo_image': self.photos['large.jpg']}},
+                {'_source': {'_id': 'c2', 'photo_image': self.photos['missing.jpg']}},
+                {'_source': {'_id': 'c3'}},
+            ]}}]}))
+        self.datasets.discover(tmpdir.name)
+
+    def test_generate_thumbnails(self):
+        Candidate.objects.create(id='db1', photo_image=self.photos['small.png'])
+        stderr = StringIO()
+        with mock.patch('api.management.commands.generate_thumbnails.registry', self.datasets), \
+                mock.patch.object(thumbnails, 'fetch', self.fetch):
+            call_command('generate_thumbnails', workers=2, stdout=StringIO(), stderr=stderr)
+        self.assertIn('missing.jpg', stderr.getvalue())
+
+        manifest = thumbnails.Manifest.load()
+        self.assertNotIn(self.photos['missing.jpg'], manifest)
+        for photo, expected in (('large.jpg', {96: (96, 72), 384: (384, 288)}), ('small.png', {96: (50, 40)})):
+            for size, dimensions in expected.items():
+                for image_format in ('webp', 'jpeg'):
+                    name = manifest.entries[self.photos[photo]][str(size)][image_format]
+                    with Image.open(os.path.join(self.root, name)) as image:
+                        self.assertEquals((image.format.lower(), image.size), (image_format, dimensions))
+
+        # records list their thumbnails, which are served with immutable cache headers
+        store = self.datasets.get('springfield')
+        thumbnail_urls = store.get('c1')['photo_thumbnails']
+        self.assertEquals(sorted(thumbnail_urls), ['384', '96'])
+        self.assertNotIn('photo_thumbnails', store.get('c2'))
+        self.assertNotIn('photo_thumbnails', store.get('c3'))
+        # and their thumbnails are part of the ETags
+        bare = candidates.CandidateStore(
+            [{k: v for k, v in _.items() if k != 'photo_thumbnails'} for _ in store], store.search_version)
+        self.assertNotEqual(bare.version, store.version)
+        self.assertNotEqual(bare.rendered('c1').etag, store.rendered('c1').etag)
+        self.assertEquals(bare.rendered('c2').etag, store.rendered('c2').etag)
+        response = views.serve_thumbnail(RequestFactory().get(thumbnail_urls['96']['webp']),
+                                         thumbnail_urls['96']['webp'][len(settings.API_THUMBNAIL_URL):])
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        with self.assertRaises((Http404, SuspiciousFileOperation)):
+            views.serve_thumbnail(RequestFactory().get('/thumbnails/../settings.py'), '../settings.py')
+        # only served by nginx in production
+        self.assertEquals(self.client.get(thumbnail_urls['96']['webp']).status_code, status.HTTP_404_NOT_FOUND)
+
+        # photos in the manifest are not processed again
+        with mock.patch.object(thumbnails, 'render_photo') as render_photo:
+            self.assertEquals(thumbnails.generate([self.photos['large.jpg']]), {})
+        render_photo.assert_not_called()
+
+    def test_fetch_only_http(self):
+        for url in ('file:///etc/passwd', '/etc/passwd', 'ftp://photos.example.com/a.jpg', 'https:///a.jpg'):
+            with self.assertRaises(ValueError):
+                thumbnails.fetch(url)
+        with override_settings(API_THUMBNAIL_SOURCE_HOSTS=['photos.example.com']):
+            with self.assertRaises(ValueError):
+                thumbnails.fetch('//elsewhere.example.com/a.jpg')
+
+
+class ImportCandidatesTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_import_candidates(self):
+        data = datasets.read_data_file(datasets.registry['boulder_city_council'].path)
+        hits = data['responses'][0]['hits']['hits']
+
+        # _msearch JSON document
+        path = self.write('boulder.json', dumps(data))
+        call_command('import_candidates', path, batch_size=4, stdout=StringIO())
+        self.assertEquals(Candidate.objects.count(), len(hits))
+        self.assertEquals(Race.objects.count(), 1)
+        source = hits[0]['_source']
+        candidate = Candidate.objects.get(pk=source['_id'])
+        self.assertEquals(candidate.race_id, source['race_custom_race1'])
+        self.assertEquals(candidate.last_name, source['last_name_text'])
+        self.assertEquals(candidate.version, source['_version'])
+        self.assertEquals(candidate.modified_date.timestamp(), source['Modified Date'] / 1000.0)
+
+        # JSON lines of hits update existing rows in place
+        updated = dict(source, last_name_text='Updated', _version=source['_version'] + 1)
+        lines = [dumps(dict(hits[1], _source=dict(hits[1]['_source']))), dumps({'_source': updated})]
+        path = self.write('boulder.jsonl', '\n'.join(lines) + '\n')
+        call_command('import_candidates', path, stdout=StringIO())
+        self.assertEquals(Candidate.objects.count(), len(hits))
+        candidate.refresh_from_db()
+        self.assertEquals(candidate.last_name, 'Updated')
+        self.assertEquals(candidate.version, source['_version'] + 1)
+
+    def test_import_candidates_bad_input(self):
+        with self.assertRaises(CommandError):
+            call_command('import_candidates', os.path.join(self.tmpdir.name, 'missing.json'), stdout=StringIO())
+        path = self.write('empty.json', '{}')
+        with self.assertRaises(CommandError):
+            call_command('import_candidates', path, batch_size=0, stdout=StringIO())
+
+    def test_import_candidates_without_update_conflicts(self):
+        source = {'_id': 'c1', 'race_custom_race1': 'r1', 'last_name_text': 'Before', '_version': 1}
+        with mock.patch.object(importers, 'SUPPORTS_UPDATE_CONFLICTS', False):
+            importers.import_candidates([source])
+            importers.import_candidates([dict(source, last_name_text='After', _version=2), dict(source, _id='c2')])
+        self.assertEquals(sorted(Candidate.objects.values_list('pk', 'last_name')), [('c1', 'After'), ('c2', 'Before')])
+
+    def test_candidate_change_log(self):
+        log = changes.ModelChangeLog()
+        source = {'_id': 'c1', 'race_custom_race1': 'r1', 'last_name_text': 'Before', '_version': 1}
+        importers.import_candidates([source, dict(source, _id='c2')])
+        # re-importing unchanged versions logs nothing
+        importers.import_candidates([source])
+        self.assertEquals([(_['op'], _['id']) for _ in log.after(0, 10)], [('upsert', 'c1'), ('upsert', 'c2')])
+        since = log.latest
+
+        candidate = Candidate.objects.get(pk='c1')
+        candidate.last_name = 'After'
+        candidate.version = 2
+        candidate.save()
+        Candidate.objects.filter(pk='c2').delete()
+        entries = log.after(since, 10)
+        self.assertEquals([(_['op'], _['id'], _['_version']) for _ in entries],
+                          [('upsert', 'c1', 2), ('delete', 'c2', 1)])
+        self.assertEquals(entries[0]['record']['last_name_text'], 'After')
+        self.assertIsNone(entries[1]['record'])
+        self.assertEquals(log.after(log.latest, 10), [])
+
+    def test_candidate_queryset_filters(self):
+        importers.import_candidates([
+            {'_id': 'c1', 'race_custom_race1': 'r1', 'Modified Date': 1000},
+            {'_id': 'c2', 'race_custom_race1': 'r1', 'Modified Date': 3000},
+            {'_id': 'c3', 'race_custom_race1': 'r2', 'Modified Date': 3000},
+        ])
+        since = importers.from_timestamp(2000)
+        self.assertEquals(sorted(Candidate.objects.in_race('r1').values_list('pk', flat=True)), ['c1', 'c2'])
+        self.assertEquals(sorted(Candidate.objects.modified_since(since).values_list('pk', flat=True)), ['c2', 'c3'])
+        self.assertEquals(list(Candidate.objects.in_race('r1').modified_since(since).values_list('pk', flat=True)),
+                          ['c2'])
+
+    def test_candidate_queryset_search(self):
+        importers.import_candidates([
+            {'_id': 'c1', 'first_name_text': 'Mark', 'last_name_text': 'Wallach', '_name_text': 'markwallach'},
+            {'_id': 'c2', 'first_name_text': 'Mark', 'last_name_text': 'McIntyre', '_name_text': 'markmcintyre'},
+            {'_id': 'c3', 'first_name_text': 'Bob', 'last_name_text': 'Yates', '_name_text': 'bobyates'},
+        ])
+
+        def search(query):
+            return list(Candidate.objects.search(query).values_list('pk', flat=True))
+        self.assertEquals(search('mark'), ['c2', 'c1'])
+        self.assertEquals(search('Mark Wal'), ['c1'])
+        self.assertEquals(search('markmc'), ['c2'])
+        self.assertEquals(search(' '), [])
+
+
+class FastPathTestCase(TestCase):
+
+    def test_fast_json_renderer_matches_json_renderer(self):
+        data = {
+            'candidates': datasets.registry.get('boulder_city_council').candidates,
+            'decimal': Decimal('1.50'),
+            'aware': datetime.datetime(2020, 3, 15, 2, 23, 0, 123456, tzinfo=datetime.timezone.utc),
+            'separators': 'line\u2028paragraph\u2029',
+            1: 'non-string key',
+        }
+        self.assertEquals(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEquals(FastJSONRenderer().render(None), b'')
+
+        # what orjson encodes differently or not at all
+        for data in ({'big': 2 ** 64, 'small': -2 ** 63 - 1}, {'floats': [1e16, 1e-7, 0.5]}, [[OrderedDict(x=1.0)]]):
+            self.assertEquals(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        for value in (float('nan'), float('inf')):
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render({'value': [value]})
+
+    def test_values_serializer(self):
+        s1 = Sample.objects.create(title='Title 1', description='Description 1')
+        fast = ValuesSerializer.for_serializer(SampleSerializer)
+        self.assertEquals(fast.fields, ('id', 'title', 'description'))
+        expected = [SampleSerializer(s1).data]
+        self.assertEquals(fast.to_representation(fast.values_list(Sample.objects.all())), expected)
+        self.assertEquals(fast.to_representation(fast.values(Sample.objects.all())), expected)
+
+        fast = ValuesSerializer.for_serializer(SampleSerializer, fields=('title',))
+        self.assertEquals(fast.to_representation(fast.values(Sample.objects.all(), 'id')), [{'title': 'Title 1'}])
+
+        class UpperSerializer(serializers.ModelSerializer):
+            upper = serializers.SerializerMethodField()
+
+            class Meta:
+                model = Sample
+                fields = ('id', 'upper')
+
+            def get_upper(self, obj):
+                return obj.title.upper()
+
+        self.assertIsNone(ValuesSerializer.for_serializer(UpperSerializer))
+
+
+class SampleBulkApiTestCase(TestCase):
+
+    def test_bulk_create(self):
+        url = reverse('sample-bulk')
+        data = [{'title': 'Title {}'.format(i), 'description': 'Description {}'.format(i)} for i in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, dumps(data), content_type='application/json')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(len([_ for _ in queries.captured_queries if _['sql'].startswith('INSERT')]), 1)
+        self.assertEquals([_['title'] for _ in loads(response.content)], ['Title 0', 'Title 1', 'Title 2'])
+        self.assertEquals(Sample.objects.count(), 3)
+
+        # NDJSON body
+        body = '\n'.join(dumps(_) for _ in data) + '\n'
+        response = self.client.post(url, body, content_type='application/x-ndjson')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(Sample.objects.count(), 6)
+
+    def test_bulk_create_reports_item_errors(self):
+        url = reverse('sample-bulk')
+        data = [{'title': 'Title 1', 'description': 'Description 1'}, {'title': 'Title 2'}]
+        response = self.client.post(url, dumps(data), content_type='application/json')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = loads(response.content)['errors']
+        self.assertEquals([_['index'] for _ in errors], [1])
+        self.assertIn('description', errors[0]['errors'])
+        self.assertEquals(Sample.objects.count(), 0)
+
+        response = self.client.post(url, dumps({'title': 'Title 1'}), content_type='application/json')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, '{"title": 1}\nnot json\n', content_type='application/x-ndjson')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with self.settings(API_BULK_MAX_BATCH_SIZE=1):
+            response = self.client.post(url, dumps(data), content_type='application/json')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update_and_delete(self):
+        s1 = Sample.objects.create(title='Title 1', description='Description 1')
+        s2 = Sample.objects.create(title='Title 2', description='Description 2')
+        url = reverse('sample-bulk')
+
+        data = [{'id': s1.pk, 'title': 'New 1'}, {'id': s2.pk, 'title': 'New 2'}]
+        response = self.client.patch(url, dumps(data), content_type='application/json')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(sorted(Sample.objects.values_list('title', 'description')),
+                          [('New 1', 'Description 1'), ('New 2', 'Description 2')])
+
+        # PUT requires every field
+        response = self.client.put(url, dumps(data), content_type='application/json')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        data = [{'id': s1.pk}, {'id': s1.pk}, {'id': 0}, {'title': 'No id'}]
+        response = self.client.patch(url, dumps(data), content_type='application/json')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals([_['index'] for _ in loads(response.content)['errors']], [1, 2, 3])
+
+        response = self.client.delete(url, dumps([{'id': s1.pk}, {'id': s2.pk}]), content_type='application/json')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(loads(response.content), {'deleted': 2})
+        self.assertFalse(Sample.objects.exists())
+
+
+class StreamingExportTestCase(TestCase):
+
+    def test_sample_export(self):
+        for i in range(3):
+            Sample.objects.create(title='Title {}'.format(i), description='Description, "{}"'.format(i))
+        url = reverse('sample-list')
+
+        response = self.client.get(url, {'format': 'ndjson'})
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEquals([loads(_)['title'] for _ in lines], ['Title 0', 'Title 1', 'Title 2'])
+
+        response = self.client.get(url, {'format': 'csv', 'fields': 'title,description'})
+        self.assertTrue(response.streaming)
+        self.assertIn('samples.csv', response['Content-Disposition'])
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEquals(rows[0], ['title', 'description'])
+        self.assertEquals(rows[1], ['Title 0', 'Description, "0"'])
+        self.assertEquals(len(rows), 4)
+
+        # serializers without a fast path stream through the serializer
+        with mock.patch.object(ValuesSerializer, 'for_serializer', return_value=None):
+            response = self.client.get(url, {'format': 'csv'})
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEquals(rows[0], ['id', 'title', 'description'])
+        self.assertEquals(rows[3][1:], ['Title 2', 'Description, "2"'])
+
+        # detail responses use the regular renderer path
+        url = reverse('sample-detail', kwargs={'pk': Sample.objects.first().pk})
+        response = self.client.get(url, {'format': 'ndjson'})
+        self.assertFalse(response.streaming)
+        self.assertEquals(loads(response.content)['title'], 'Title 0')
+
+    def test_candidate_export(self):
+        store = datasets.registry.get('boulder_city_council')
+        url = reverse('candidate-list')
+
+        response = self.client.get(url, {'format': 'ndjson'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEquals([loads(_)['_id'] for _ in lines], [_['_id'] for _ in store])
+        self.assertEquals(loads(lines[0])['Created Date X'], loads(JSONRenderer().render(store.candidates[0]))['Created Date X'])
+
+        response = self.client.get(url, {'format': 'csv', 'fields': '_id,last_name_text'})
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEquals(rows[0], ['_id', 'last_name_text'])
+        self.assertEquals(rows[1:], [[_['_id'], _['last_name_text']] for _ in store])
+
+
+class CachedResponseTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+
+    def test_reads_are_cached_until_a_write(self):
+        s1 = Sample.objects.create(title='Title 1', description='Description 1')
+        url = reverse('sample-list')
+        response = self.client.get(url)
+        self.assertEquals(len(loads(response.content)['results']), 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEquals(len(loads(response.content)['results']), 1)
+
+        # post_save
+        Sample.objects.create(title='Title 2', description='Description 2')
+        self.assertEquals(len(loads(self.client.get(url).content)['results']), 2)
+
+        # bulk writes send no signals
+        data = [{'title': 'Title 3', 'description': 'Description 3'}]
+        self.client.post(reverse('sample-bulk'), dumps(data), content_type='application/json')
+        self.assertEquals(len(loads(self.client.get(url).content)['results']), 3)
+
+        # detail views through the API
+        detail_url = reverse('sample-detail', kwargs={'pk': s1.pk})
+        self.assertEquals(loads(self.client.get(detail_url).content)['title'], 'Title 1')
+        self.client.patch(detail_url, dumps({'title': 'New 1'}), content_type='application/json')
+        self.assertEquals(loads(self.client.get(detail_url).content)['title'], 'New 1')
+
+        # post_delete
+        self.client.delete(detail_url)
+        self.assertEquals(self.client.get(detail_url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEquals(len(loads(self.client.get(url).content)['results']), 2)
+
+    def test_shared_cache_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            shared = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'api': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+            }
+            with override_settings(CACHES=shared):
+                Sample.objects.create(title='Title 1', description='Description 1')
+                url = reverse('sample-list')
+                self.client.get(url)
+                self.assertTrue(os.listdir(location))
+                with self.assertNumQueries(0):
+                    self.assertEquals(len(loads(self.client.get(url).content)['results']), 1)
+                Sample.objects.create(title='Title 2', description='Description 2')
+                self.assertEquals(len(loads(self.client.get(url).content)['results']), 2)
+
+    def test_waits_for_another_worker(self):
+        Sample.objects.create(title='Title 1', description='Description 1')
+        url = reverse('sample-list')
+        key = response_cache_key('sample', (Sample,), 'http://testserver' + url, 'application/json')
+        # Another worker is computing the response and stores it shortly.
+        self.assertEquals(acquire_fill_lock(key), (None, True))
+        entry = (b'{"results": ["from another worker"]}', 'application/json')
+        timer = threading.Timer(0.2, lambda: get_cache().set(key, entry))
+        timer.start()
+        try:
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+        finally:
+            timer.join()
+        self.assertEquals(response.content, entry[0])
+
+        # Once the lock is gone the response is computed here.
+        release_fill_lock(key)
+        get_cache().delete(key)
+        self.assertEquals(len(loads(self.client.get(url).content)['results']), 1)
+        self.assertEquals(acquire_fill_lock(key)[0][0], self.client.get(url).content)
+
+
+class CoalesceTestCase(TestCase):
+
+    def test_single_flight(self):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('key', compute)))
+        leader.start()
+        started.wait(5)
+        waiters = [threading.Thread(target=lambda: results.append(flight.do('key', compute))) for _ in range(4)]
+        for thread in waiters:
+            thread.start()
+        release.set()
+        for thread in [leader] + waiters:
+            thread.join()
+        self.assertEquals(len(calls), 1)
+        self.assertEquals(sorted(results), [('result', False)] + [('result', True)] * 4)
+
+        # Nothing in flight: a new call computes again.
+        self.assertEquals(flight.do('key', compute), ('result', False))
+        self.assertEquals(len(calls), 2)
+
+    def test_single_flight_error_and_timeout(self):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError('failed')
+
+        errors = []
+
+        def call():
+            try:
+                flight.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        # Gives up waiting and computes on its own.
+        self.assertEquals(flight.do('key', lambda: 'mine', timeout=0.01), ('mine', False))
+        waiter = threading.Thread(target=call)
+        waiter.start()
+        release.set()
+        leader.join()
+        waiter.join()
+        self.assertEquals(len(errors), 2)
+
+    def test_async_single_flight(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'result'
+
+        async def run():
+            return await asyncio.gather(*(flight.do('key', compute) for _ in range(5)))
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertEquals(len(calls), 1)
+        self.assertEquals(sorted(results), [('result', False)] + [('result', True)] * 4)
+
+    def test_candidate_store_builds_once(self):
+        full = datasets.registry.get('boulder_city_council')
+        store = type(full)(full.candidates)
+        built = []
+        original = SearchIndex
+
+        def slow_index(records):
+            built.append(1)
+            time.sleep(0.05)
+            return original(records)
+
+        with mock.patch('api.candidates.SearchIndex', slow_index):
+            threads = [threading.Thread(target=lambda: store.search_index) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEquals(len(built), 1)
+        self.assertIs(store.search_index, store.search_index)
+
+
+class ThrottleTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+
+    def throttle_rate(self, rate):
+        return override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={'client': rate}))
+
+    def test_token_bucket(self):
+        url = reverse('candidate-list')
+        now = [1000.0]
+        with self.throttle_rate('3/min'), mock.patch.object(TokenBucketThrottle, 'timer', lambda self: now[0]):
+            for _ in range(3):
+                self.assertEquals(self.client.get(url).status_code, status.HTTP_200_OK)
+            response = self.client.get(url)
+            self.assertEquals(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEquals(response['Retry-After'], '20')
+            # Another client has its own bucket.
+            self.assertEquals(self.client.get(url, REMOTE_ADDR='10.0.0.2').status_code, status.HTTP_200_OK)
+
+            # One token comes back every 20 seconds.
+            now[0] += 20
+            self.assertEquals(self.client.get(url).status_code, status.HTTP_200_OK)
+            self.assertEquals(self.client.get(url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            now[0] += 600
+            for _ in range(3):
+                self.assertEquals(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_forwarded_for_is_not_trusted_by_default(self):
+        url = reverse('candidate-list')
+        with self.throttle_rate('1/min'):
+            self.assertEquals(self.client.get(url).status_code, status.HTTP_200_OK)
+            response = self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.0.2')
+            self.assertEquals(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+            # Behind one proxy, only the address it adds counts.
+            with self.settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, NUM_PROXIES=1,
+                                                   DEFAULT_THROTTLE_RATES={'client': '1/min'})):
+                self.assertEquals(self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.0.3').status_code,
+                                  status.HTTP_200_OK)
+                response = self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.0.4, 10.0.0.3')
+                self.assertEquals(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_warm_up_is_not_throttled(self):
+        url = reverse('candidate-list')
+        with self.throttle_rate('1/min'):
+            self.assertEquals(warmup.warm([url, url]), {url: status.HTTP_200_OK})
+            self.assertEquals(self.client.get(url).status_code, status.HTTP_200_OK)
+            self.assertEquals(self.client.get(url, **{'HTTP_API.THROTTLE_EXEMPT': '1'}).status_code,
+                              status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_async_views_count_once(self):
+        views_by_name = {_.name: _.callback for _ in async_urlpatterns(urls.urlpatterns_v0)}
+        with self.throttle_rate('2/min'):
+            for _ in range(2):
+                # Handed over to the DRF view (?race=), counted once.
+                request = RequestFactory().get(reverse('candidate-list'), {'race': 'nope'})
+                self.assertEquals(async_to_sync(views_by_name['candidate-list'])(request).status_code,
+                                  status.HTTP_200_OK)
+            response = async_to_sync(views_by_name['candidate-list'])(RequestFactory().get(reverse('candidate-list')))
+        self.assertEquals(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}},
+)
+class HomePageTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        views.PrerenderedTemplateView._rendered.clear()
+
+    def test_prerendered_page(self):
+        response = self.client.get(reverse('home'))
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response['Content-Type'], 'text/html; charset=utf-8')
+        self.assertIn(b'Welcome to Stump.vote', response.content)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with mock.patch('api.prerender.render_to_string') as render:
+            response = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEquals(gzip.decompress(response.content).count(b'Welcome to Stump.vote'), 1)
+            response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEquals(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        render.assert_not_called()
+
+
+class AsyncViewsTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+        self.views = {_.name: _.callback for _ in async_urlpatterns(urls.urlpatterns_v0)}
+
+    def call(self, name, method='get', data=None, **kwargs):
+        url = reverse(name, kwargs=kwargs)
+        request = getattr(RequestFactory(), method)(url, data, content_type='application/json') \
+            if method != 'get' else RequestFactory().get(url, data)
+        return async_to_sync(self.views[name])(request, **kwargs)
+
+    def test_reads_match_sync_views(self):
+        s1 = Sample.objects.create(title='Title 1', description='Description 1')
+        Sample.objects.create(title='Title 2', description='Description 2')
+        for name, kwargs, data in (
+                ('somedata', {}, None),
+                ('sample-list', {}, None),
+                ('sample-list', {}, {'page_size': 1, 'fields': 'id,title'}),
+                ('sample-detail', {'pk': s1.pk}, None),
+                ('candidate-list', {}, None),
+                ('candidate-detail', {'pk': datasets.registry.get('boulder_city_council').keys[0]}, None)):
+            get_cache().clear()
+            expected = self.client.get(reverse(name, kwargs=kwargs), data)
+            get_cache().clear()
+            response = self.call(name, data=data, **kwargs)
+            self.assertEquals(response.status_code, status.HTTP_200_OK)
+            self.assertEquals(loads(response.content), loads(expected.content))
+
+    def test_reads_are_cached_and_shared_with_sync_views(self):
+        Sample.objects.create(title='Title 1', description='Description 1')
+        self.call('sample-list')
+        with self.assertNumQueries(0):
+            self.assertEquals(len(loads(self.call('sample-list').content)['results']), 1)
+            self.assertEquals(len(loads(self.client.get(reverse('sample-list')).content)['results']), 1)
+
+    def test_candidates_load_off_the_event_loop(self):
+        store = datasets.registry.get('boulder_city_council')
+        loops = []
+
+        def load_store():
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return store
+
+        with mock.patch.object(views.BoulderCandidatesViewSet, 'load_store', load_store):
+            self.assertEquals(self.call('candidate-list').status_code, status.HTTP_200_OK)
+            self.assertEquals(self.call('candidate-detail', pk=store.keys[0]).status_code, status.HTTP_200_OK)
+        self.assertEquals(loops, [None, None])
+
+    def test_other_requests_use_sync_views(self):
+        self.assertEquals(self.call('sample-detail', pk=1).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEquals(self.call('candidate-detail', pk='missing').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEquals(self.call('sample-list', data={'fields': 'nope'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.call('sample-list', 'post', dumps({'title': 'Title 1', 'description': 'Description 1'}))
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(loads(self.call('sample-list').content)['results'][0]['title'], 'Title 1')
+
+
+class MetricsTestCase(TestCase):
+
+    def test_histogram_exposition(self):
+        registry = metrics.Registry()
+        histogram = metrics.Histogram('test_seconds', 'Test histogram.', labelnames=('route',),
+                                      buckets=(0.1, 1), registry=registry)
+        counter = metrics.Counter('test_requests', 'Test counter.', registry=registry)
+        histogram.observe(0.05, route='a')
+        histogram.observe(0.5, route='a')
+        histogram.observe(5, route='a')
+        counter.inc()
+        self.assertEquals(histogram.count(route='a'), 3)
+        self.assertEquals(registry.expose(), '\n'.join([
+            '# HELP test_seconds Test histogram.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{route="a",le="0.1"} 1',
+            'test_seconds_bucket{route="a",le="1.0"} 2',
+            'test_seconds_bucket{route="a",le="+Inf"} 3',
+            'test_seconds_sum{route="a"} 5.55',
+            'test_seconds_count{route="a"} 3',
+            '# HELP test_requests Test counter.',
+            '# TYPE test_requests counter',
+            'test_requests_total 1',
+        ]) + '\n')
+        with self.assertRaises(ValueError):
+            histogram.observe(1)
+
+    def test_request_metrics(self):
+        Sample.objects.create(title='Title 1', description='Description 1')
+        requests = instrumentation.requests_total.value(route='sample-list', method='GET', status=200)
+        queries = instrumentation.request_db_queries.count(route='sample-list')
+        response = self.client.get(reverse('sample-list'))
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(instrumentation.requests_total.value(route='sample-list', method='GET', status=200),
+                          requests + 1)
+        self.assertEquals(instrumentation.request_db_queries.count(route='sample-list'), queries + 1)
+        self.assertGreater(instrumentation.request_db_queries.sum(route='sample-list'), 0)
+        self.assertGreater(instrumentation.response_size_bytes.sum(route='sample-list'), 0)
+
+        response = self.client.get('/metrics')
+        self.assertEquals(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(b'stump_http_request_duration_seconds_count{route="sample-list",method="GET"}',
+                      response.content)
+
+        # only for allowed addresses and the token
+        self.assertEquals(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code,
+                          status.HTTP_403_FORBIDDEN)
+        with self.settings(API_METRICS_ALLOWED_IPS=['10.0.0.0/8'], API_METRICS_TOKEN='secret'):
+            self.assertEquals(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, status.HTTP_200_OK)
+            for authorization, code in (('Bearer secret', status.HTTP_200_OK),
+                                        ('Bearer nope', status.HTTP_403_FORBIDDEN)):
+                response = self.client.get('/metrics', REMOTE_ADDR='192.0.2.1', HTTP_AUTHORIZATION=authorization)
+                self.assertEquals(response.status_code, code)
+
+    def test_metrics_of_every_process(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        registry = metrics.Registry()
+        counter = metrics.Counter('test_requests', 'Test counter.', labelnames=('route',), registry=registry)
+        histogram = metrics.Histogram('test_seconds', 'Test histogram.', buckets=(1,), registry=registry)
+        counter.inc(2, route='a')
+        histogram.observe(0.5)
+        # another process
+        with open(os.path.join(tmpdir.name, '1.json'), 'w') as f:
+            f.write(dumps({'test_requests': [[['a'], 3], [['b'], 1]], 'test_seconds': [[[], [[0, 1], 5.0]]]}))
+
+        exposed = registry.expose(tmpdir.name)
+        for line in ('test_requests_total{route="a"} 5', 'test_requests_total{route="b"} 1',
+                     'test_seconds_bucket{le="1.0"} 1', 'test_seconds_count 2', 'test_seconds_sum 5.5'):
+            self.assertIn(line, exposed)
+        self.assertIn('test_requests_total{route="a"} 2', registry.expose())
+
+        registry.publish(tmpdir.name)
+        with open(os.path.join(tmpdir.name, '{}.json'.format(os.getpid()))) as f:
+            self.assertEquals(loads(f.read()), registry.snapshot())
+        # at most once per interval
+        counter.inc(route='a')
+        registry.publish(tmpdir.name)
+        with open(os.path.join(tmpdir.name, '{}.json'.format(os.getpid()))) as f:
+            self.assertEquals(loads(f.read())['test_requests'][0], [['a'], 2])
+
+        # exited processes are added up in one file
+        with open(os.path.join(tmpdir.name, '2.json'), 'w') as f:
+            f.write(dumps({'test_requests': [[['a'], 1]], 'test_seconds': [[[], [[1, 1], 0.25]]]}))
+        metrics.retire(tmpdir.name, 1)
+        metrics.retire(tmpdir.name, 2)
+        metrics.retire(tmpdir.name, 3)
+        self.assertEquals(sorted(os.listdir(tmpdir.name)), ['{}.json'.format(os.getpid()), metrics.RETIRED_NAME])
+        with open(os.path.join(tmpdir.name, metrics.RETIRED_NAME)) as f:
+            self.assertEquals(loads(f.read()), {'test_requests': [[['a'], 4], [['b'], 1]],
+                                                'test_seconds': [[[], [[1, 2], 5.25]]]})
+        self.assertIn('test_requests_total{route="a"} 7', registry.expose(tmpdir.name))
+
+    def test_query_count_warning(self):
+        def view(request):
+            for _ in range(3):
+                Sample.objects.count()
+            return HttpResponse('ok')
+        request = RequestFactory().get(reverse('sample-list'))
+        request.resolver_match = resolve(request.path)
+        middleware = instrumentation.InstrumentationMiddleware(view)
+        with self.settings(API_QUERY_COUNT_WARNING=2), self.assertLogs('api.instrumentation', 'WARNING') as logs:
+            middleware(request)
+        self.assertIn('ran 3 database queries', logs.output[0])
+        with self.settings(API_QUERY_COUNT_WARNING=3), mock.patch.object(instrumentation.logger, 'warning') as warning:
+            middleware(request)
+        warning.assert_not_called()
+
+    def test_connection_setup_is_timed(self):
+        histogram = metrics.db_connection_setup_seconds
+        before = histogram.count(alias='default', vendor=connection.vendor)
+        connection.get_new_connection(connection.get_connection_params()).close()
+        self.assertEquals(histogram.count(alias='default', vendor=connection.vendor), before + 1)
+
+
+class BenchmarkApiTestCase(TestCase):
+
+    def test_in_process_run(self):
+        # Runs in a throwaway test database, this one while testing.
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.object(benchmark_api, 'setup_databases') as setup, \
+                mock.patch.object(benchmark_api, 'teardown_databases') as teardown, \
+                self.settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={'client': '1/min'})):
+            output = os.path.join(tmpdir, 'results.json')
+            call_command('benchmark_api', scale=[20], requests=3, warmup=1, output=output,
+                         stdout=StringIO(), stderr=StringIO())
+            with open(output) as f:
+                report = loads(f.read())
+        setup.assert_called_once()
+        teardown.assert_called_once_with(setup.return_value, verbosity=0)
+        self.assertEquals(report['mode'], 'in-process')
+        self.assertEquals({_['endpoint'] for _ in report['results']}, {
+            'sample-list', 'sample-detail', 'sample-create',
+            'candidate-list', 'candidate-page', 'candidate-detail', 'candidate-search'})
+        for result in report['results']:
+            self.assertEquals((result['scale'], result['requests'], result['errors']), (20, 3, 0))
+        # The seeded rows are rolled back and the synthetic dataset removed.
+        self.assertEquals(Sample.objects.count(), 0)
+        self.assertNotIn('benchmark', datasets.registry)
+        self.assertEquals(views.BoulderCandidatesViewSet.dataset, 'boulder_city_council')
+
+    def test_server_run_leaves_writes_out(self):
+        with self.assertRaisesMessage(CommandError, '--allow-writes'):
+            call_command('benchmark_api', url='http://127.0.0.1:1', endpoints=['sample-create'],
+                         stdout=StringIO(), stderr=StringIO())
+        command = benchmark_api.Command()
+        options = {'endpoints': None}
+        self.assertNotIn('sample-create', [_.name for _ in command.selected(
+            benchmark_api.endpoints((), (), ()), options, writes=False)])
+        self.assertIn('sample-create', [_.name for _ in command.selected(
+            benchmark_api.endpoints((), (), ()), options)])
+
+
+@jobs.job(name='tests.flaky', max_attempts=3)
+def flaky(fail):
+    if fail:
+        raise ValueError('flaky')
+
+
+class JobsTestCase(TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+
+    def run_worker(self):
+        stderr = StringIO()
+        call_command('run_worker', processes=0, burst=True, verbosity=0, stderr=stderr)
+        return stderr.getvalue()
+
+    def test_idempotency_key(self):
+        first = jobs.enqueue(flaky, idempotency_key='k', fail=False)
+        self.assertEquals(jobs.enqueue(flaky, idempotency_key='k', fail=False), first)
+        self.assertEquals(jobs.claim(10), [first])
+        # Once it runs, the key can be queued again.
+        second = jobs.enqueue('tests.flaky', idempotency_key='k', fail=False)
+        self.assertNotEquals(second, first)
+        self.assertEquals(Job.objects.filter(status=Job.QUEUED).count(), 1)
+        with self.assertRaises(ValueError):
+            jobs.enqueue('tests.unknown')
+
+    def test_retries_with_backoff(self):
+        job = jobs.enqueue(flaky, fail=True)
+        with self.settings(API_JOB_BACKOFF_BASE=60):
+            self.assertIn('retrying', self.run_worker())
+        job.refresh_from_db()
+        self.assertEquals((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('ValueError: flaky', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + datetime.timedelta(seconds=29))
+        # Not due yet
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEquals(job.attempts, 1)
+
+        with self.settings(API_JOB_BACKOFF_BASE=0):
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            self.assertIn('failed for good after 3 attempts', self.run_worker())
+        job.refresh_from_db()
+        self.assertEquals((job.status, job.attempts), (Job.FAILED, 3))
+
+    def test_recovers_abandoned_jobs(self):
+        job = jobs.enqueue(flaky, fail=False)
+        jobs.claim(1)
+        # Its worker died: the lease is not renewed.
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        with self.settings(API_JOB_BACKOFF_BASE=0):
+            self.assertIn('Recovered 1 abandoned job', self.run_worker())
+        job.refresh_from_db()
+        self.assertEquals((job.status, job.attempts), (Job.DONE, 2))
+        self.assertEquals(job.last_error, 'Abandoned by its worker')
+        # The dead worker's late report is ignored.
+        self.assertFalse(jobs.finish(job))
+
+    def test_prunes_finished_jobs(self):
+        old = timezone.now() - datetime.timedelta(days=8)
+        done = jobs.enqueue(flaky, fail=False)
+        failed = jobs.enqueue(flaky, fail=True)
+        recent = jobs.enqueue(flaky, fail=False)
+        queued = jobs.enqueue(flaky, fail=False)
+        Job.objects.filter(pk=done.pk).update(status=Job.DONE, finished_at=old)
+        Job.objects.filter(pk=failed.pk).update(status=Job.FAILED, finished_at=old)
+        Job.objects.filter(pk=recent.pk).update(status=Job.DONE, finished_at=timezone.now())
+        Job.objects.filter(pk=queued.pk).update(run_at=old + datetime.timedelta(days=100))
+        self.run_worker()
+        self.assertEquals(sorted(Job.objects.values_list('pk', flat=True)), sorted([recent.pk, queued.pk]))
+
+    def test_writes_warm_the_sample_list(self):
+        url = reverse('sample-list')
+        # The worker process cannot fill a cache of its own.
+        self.client.post(url, {'title': 'Title 0', 'description': 'Description'})
+        self.assertFalse(Job.objects.exists())
+        Sample.objects.all().delete()
+
+        # Here it runs in this process.
+        with mock.patch.object(views, 'is_shared', return_value=True):
+            for title in ('Title 1', 'Title 2'):
+                response = self.client.post(url, {'title': title, 'description': 'Description'})
+                self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        # Both writes share the job.
+        job = Job.objects.get()
+        self.assertEquals(job.name, tasks.warm_responses.job_name)
+
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEquals(job.status, Job.DONE)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEquals(len(loads(response.content)['results']), 2)
+
+
+class WarmupTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+        self.addCleanup(warmup._ready.set)
+
+    def test_readiness(self):
+        url = reverse('ready')
+        response = self.client.get(url)
+        self.assertEquals((response.status_code, loads(response.content)), (200, {'status': 'ready'}))
+        warmup._ready.clear()
+        response = self.client.get(url)
+        self.assertEquals((response.status_code, loads(response.content)), (503, {'status': 'warming up'}))
+
+    def test_warm_up(self):
+        Sample.objects.create(title='Title 1', description='Description 1')
+        store = views.BoulderCandidatesViewSet.load_store()
+        store._search_index = None
+        with mock.patch.object(warmup, 'warm', wraps=warmup.warm) as warm:
+            timings = warmup.warm_up(route_names=['sample-list'])
+        self.assertEquals(list(timings), ['preload', 'connect', 'responses'])
+        warm.assert_called_once_with([reverse('sample-list')])
+        self.assertIsNotNone(store._search_index)
+        self.assertTrue(warmup.is_ready())
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('sample-list'), HTTP_ACCEPT='application/json')
+        self.assertEquals(len(loads(response.content)['results']), 1)
+
+    def test_failing_step(self):
+        with mock.patch.object(warmup, 'preload', side_effect=ValueError), \
+                mock.patch.object(warmup.logger, 'exception') as exception:
+            timings = warmup.warm_up(route_names=['somedata'])
+        exception.assert_called_once_with('Warm-up step %s failed', 'preload')
+        self.assertIn('responses', timings)
+        self.assertTrue(warmup.is_ready())
+
+    def test_warm_caches_command(self):
+        stdout = StringIO()
+        call_command('warm_caches', routes=['somedata'], stdout=stdout)
+        self.assertIn('Warmed up in', stdout.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('warm_caches', routes=['sample-detail'], stdout=StringIO())
+
+
+def square(x, y, size):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+class BallotTestCase(TestCase):
+    race = '1348695171700984260__LOOKUP__1566357485075x999935322821441400'
+
+    def get_index(self):
+        def feature(id, geometry, races=()):
+            return {'type': 'Feature', 'properties': {'id': id, 'name': id.title(), 'races': races},
+                    'geometry': geometry}
+        return districts.DistrictIndex.from_geojson({'type': 'FeatureCollection', 'features': [
+            # A square with a square hole
+            feature('county', {'type': 'Polygon', 'coordinates': [square(0, 0, 10), square(4, 4, 2)]}, ['c']),
+            feature('city', {'type': 'Polygon', 'coordinates': [square(1, 1, 2)]}, ['a', 'c']),
+            feature('islands', {'type': 'MultiPolygon', 'coordinates': [
+                [square(20, 0, 1)], [square(30, 0, 1)]]}),
+        ]})
+
+    def test_lookup(self):
+        index = self.get_index()
+        cases = [
+            ((2, 2), ['county', 'city']),
+            ((8, 8), ['county']),
+            ((5, 5), []),
+            ((30.5, 0.5), ['islands']),
+            ((25, 0.5), []),
+            ((-1, 2), []),
+        ]
+        for (x, y), expected in cases:
+            self.assertEquals([_.id for _ in index.lookup(x, y)], expected)
+        points = [point for point, _ in cases]
+        self.assertEquals([[_.id for _ in found] for found in index.lookup_many(points)],
+                          [expected for _, expected in cases])
+        with mock.patch.object(districts, 'numpy', None):
+            self.assertEquals([[_.id for _ in found] for found in index.lookup_many(points)],
+                              [expected for _, expected in cases])
+        self.assertEquals(index.lookup_many([]), [])
+
+    def test_ballot(self):
+        url = reverse('ballot')
+        response = self.client.get(url, {'lat': '40.015', 'lon': '-105.2705', 'fields': '_id'})
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        data = loads(response.content)
+        self.assertEquals(data['districts'], [{'id': 'boulder', 'name': 'City of Boulder'}])
+        self.assertEquals([(_['id'], _['districts']) for _ in data['races']], [(self.race, ['boulder'])])
+        self.assertEquals(len(data['races'][0]['candidates']), 15)
+        self.assertEquals(set(data['races'][0]['candidates'][0]), {'_id'})
+
+        data = loads(self.client.get(url, {'lat': '39.7392', 'lon': '-104.9903'}).content)
+        self.assertEquals((data['districts'], data['races']), ([], []))
+
+        response = self.client.get(url, {'lat': '91', 'lon': 'x'})
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(set(loads(response.content)), {'lat', 'lon'})
+
+        # The districts must be configured.
+        with self.settings(API_DISTRICTS_FILE=''):
+            response = self.client.get(url, {'lat': '40.015', 'lon': '-105.2705'})
+            self.assertEquals(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            warmup.preload()
+
+    def test_batch(self):
+        url = reverse('ballot')
+        points = [{'lat': 40.015, 'lon': -105.2705}, {'lat': 39.7392, 'lon': -104.9903}]
+        response = self.client.post(url, dumps({'points': points}), content_type='application/json')
+        self.assertEquals(loads(response.content), {'results': [
+            {'districts': ['boulder'], 'races': [self.race]},
+            {'districts': [], 'races': []},
+        ]})
+
+        response = self.client.post(url, dumps({'points': [points[0], {'lat': 40}]}), content_type='application/json')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(loads(response.content)['errors'], [{'index': 1, 'errors': {
+            'lon': ['A number between -180 and 180 is required.']}}])
+        with self.settings(API_BULK_MAX_BATCH_SIZE=1):
+            response = self.client.post(url, dumps({'points': points}), content_type='application/json')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,75 @@
+"""
+Per-client rate limiting.
+
+``TokenBucketThrottle`` gives every client (by IP address, see DRF's
+``NUM_PROXIES`` setting) a bucket holding as many tokens as the requests its
+rate allows per period. Each request takes a token and tokens come back
+steadily over the period, so a client may burst up to the full rate and then
+continues at the average rate, instead of being locked out until a fixed
+window ends.
+
+Buckets live in the API_THROTTLE_CACHE_ALIAS cache, shared by the workers
+when it is (Redis, file). Updates are not atomic: concurrent requests from one
+client can occasionally be let through together, which is fine for shedding
+load.
+
+Requests carrying ``EXEMPT_KEY`` in their WSGI environ, which no HTTP header
+can set, are not throttled; the warm-up requests (see api.warmup) do, as they
+would otherwise use up the tokens of the address they come from.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+EXEMPT_KEY = 'api.throttle_exempt'
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Token bucket limit of ``DEFAULT_THROTTLE_RATES[scope]``, e.g. '600/min';
+    no limit if the rate is None.
+    """
+    scope = 'client'
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+    timer = time.time
+
+    @property
+    def cache(self):
+        return caches[settings.API_THROTTLE_CACHE_ALIAS]
+
+    def get_rate(self):
+        # Read at request time rather than import time, like the settings.
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        # Requests the async views have already counted (see
+        # api.async_views.throttled) are not counted again by the DRF view.
+        if self.scope in getattr(request, 'counted_throttle_scopes', ()):
+            return True
+        if request.META.get(EXEMPT_KEY):
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        capacity = self.num_requests
+        refill = self.num_requests / self.duration
+        self.now = self.timer()
+        tokens, stamp = self.cache.get(self.key) or (capacity, self.now)
+        tokens = min(capacity, tokens + (self.now - stamp) * refill)
+        if tokens < 1:
+            self.tokens_wait = (1 - tokens) / refill
+            return False
+        # Unused, the bucket is full again after one duration.
+        self.cache.set(self.key, (tokens - 1, self.now), self.duration)
+        return True
+
+    def wait(self):
+        return self.tokens_wait
@@ -0,0 +1,194 @@
+"""
+Resized variants of candidate photos.
+
+``manage.py generate_thumbnails`` fetches every candidate photo, resizes it to
+each of ``API_THUMBNAIL_SIZES`` in each of ``API_THUMBNAIL_FORMATS`` in a pool
+of worker processes, and saves the results to the thumbnail storage together
+with a manifest. Candidate records get a ``photo_thumbnails`` field for the
+photos listed in the manifest when their dataset is loaded.
+
+A thumbnail's name is derived from its source URL, which changes with every
+upload, so thumbnails never change once written and are served with
+immutable cache headers.
+"""
+import hashlib
+import io
+import json
+import os
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.module_loading import import_string
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; only generating thumbnails needs it
+    Image = ImageOps = None
+
+
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+FETCH_TIMEOUT = 30
+SAVE_OPTIONS = {
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+    'webp': {'quality': 80, 'method': 4},
+}
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+
+
+def get_storage():
+    """
+    Return the storage thumbnails are saved to and served from.
+    """
+    if settings.API_THUMBNAIL_STORAGE:
+        return import_string(settings.API_THUMBNAIL_STORAGE)()
+    return FileSystemStorage(location=settings.API_THUMBNAIL_ROOT, base_url=settings.API_THUMBNAIL_URL)
+
+
+def source_key(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:20]
+
+
+def thumbnail_name(url, size, image_format):
+    return '{}/{}.{}'.format(source_key(url), size, EXTENSIONS[image_format])
+
+
+def fetch(url, timeout=FETCH_TIMEOUT):
+    """
+    Return the bytes of the image at ``url``, an http(s) or protocol-relative
+    URL on one of ``API_THUMBNAIL_SOURCE_HOSTS`` if set. Raise ValueError for
+    any other URL, so that photo URLs from the data cannot read local files.
+    """
+    if url.startswith('//'):
+        url = 'https:' + url
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError('Not an http(s) URL: {}'.format(url))
+    hosts = settings.API_THUMBNAIL_SOURCE_HOSTS
+    if hosts and parsed.hostname not in hosts:
+        raise ValueError('Photo host not allowed: {}'.format(parsed.hostname))
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+def resize(content, sizes, formats):
+    """
+    Return {(size, format): bytes} for an image, each variant fitting in a
+    ``size`` pixel square. Images are never enlarged.
+    """
+    with Image.open(io.BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        variants = {}
+        for size in sorted(sizes, reverse=True):
+            image.thumbnail((size, size), Image.LANCZOS)
+            for image_format in formats:
+                out = io.BytesIO()
+                image.save(out, image_format.upper(), **SAVE_OPTIONS.get(image_format, {}))
+                variants[size, image_format] = out.getvalue()
+        return variants
+
+
+def render_photo(url, sizes, formats):
+    """
+    Fetch and resize one photo. Runs in a worker process.
+
+    Returns (url, variants, error), with ``error`` a message if it failed.
+    """
+    try:
+        return url, resize(fetch(url), sizes, formats), None
+    except Exception as e:
+        return url, {}, '{}: {}'.format(type(e).__name__, e)
+
+
+class Manifest:
+    """
+    The thumbnails available for each source URL.
+    """
+
+    def __init__(self, entries=None):
+        # {url: {size: {format: name}}}, sizes as strings (JSON object keys)
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, storage=None):
+        storage = storage or get_storage()
+        if not storage.exists(MANIFEST_NAME):
+            return cls()
+        with storage.open(MANIFEST_NAME) as f:
+            return cls(json.loads(f.read().decode('utf-8')))
+
+    def save(self, storage=None):
+        storage = storage or get_storage()
+        if storage.exists(MANIFEST_NAME):
+            storage.delete(MANIFEST_NAME)
+        storage.save(MANIFEST_NAME, ContentFile(json.dumps(self.entries, sort_keys=True).encode('utf-8')))
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def add(self, url, names):
+        """
+        Record the thumbnail ``names``, {(size, format): name}, of ``url``.
+        """
+        entry = {}
+        for (size, image_format), name in names.items():
+            entry.setdefault(str(size), {})[image_format] = name
+        self.entries[url] = entry
+
+    def urls(self, url, storage):
+        """
+        Return {size: {format: url}} for the thumbnails of ``url``, or None.
+        """
+        entry = self.entries.get(url)
+        if not entry:
+            return None
+        return {size: {_: storage.url(name) for _, name in formats.items()} for size, formats in entry.items()}
+
+
+def photo_thumbnails():
+    """
+    Return a function mapping a photo URL to its thumbnail URLs (or None),
+    from the current manifest.
+    """
+    storage = get_storage()
+    manifest = Manifest.load(storage)
+    return lambda url: manifest.urls(url, storage)
+
+
+def generate(urls, workers=None, force=False, storage=None, sizes=None, formats=None):
+    """
+    Generate the thumbnails of ``urls`` not in the manifest yet (all of them
+    with ``force``) in a pool of ``workers`` processes, and update the
+    manifest.
+
+    Returns {url: error} for the photos that failed.
+    """
+    if Image is None:
+        raise ImportError('Generating thumbnails requires Pillow')
+    storage = storage or get_storage()
+    sizes = tuple(sizes or settings.API_THUMBNAIL_SIZES)
+    formats = tuple(formats or settings.API_THUMBNAIL_FORMATS)
+    manifest = Manifest.load(storage)
+    pending = sorted({_ for _ in urls if _ and (force or _ not in manifest)})
+    errors = {}
+    if not pending:
+        return errors
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        results = pool.map(render_photo, pending, [sizes] * len(pending), [formats] * len(pending))
+        for url, variants, error in results:
+            if error is not None:
+                errors[url] = error
+                continue
+            names = {}
+            for (size, image_format), content in variants.items():
+                name = thumbnail_name(url, size, image_format)
+                if storage.exists(name):
+                    storage.delete(name)
+                names[size, image_format] = storage.save(name, ContentFile(content))
+            manifest.add(url, names)
+    manifest.save(storage)
+    return errors
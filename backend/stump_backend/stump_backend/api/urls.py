@@ -1,12 +1,25 @@
+import django
 from rest_framework import routers
 from api import views
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.urls import path, include
 
 router_v0 = routers.SimpleRouter()
 router_v0.register(r'samples', views.SampleViewSet, 'sample')
 router_v0.register(r'candidates', views.BoulderCandidatesViewSet, 'candidate')
 
+urlpatterns_v0 = router_v0.urls + [
+    path('somedata/', views.SomeDataView.as_view(), name='somedata'),
+    path('ballot/', views.BallotView.as_view(), name='ballot'),
+]
+
+if settings.API_ASYNC_VIEWS:
+    if django.VERSION < (3, 1):
+        raise ImproperlyConfigured('API_ASYNC_VIEWS requires Django 3.1 or later')
+    from api.async_views import async_urlpatterns
+    urlpatterns_v0 = async_urlpatterns(urlpatterns_v0)
+
 urlpatterns = [
-    path('v0/', include(router_v0.urls)),
-    path('v0/somedata/', views.SomeDataView.as_view(), name='somedata')
+    path('v0/', include(urlpatterns_v0)),
 ]
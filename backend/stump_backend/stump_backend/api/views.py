@@ -1,22 +1,257 @@
 # from django.shortcuts import render
-import datetime
+import ipaddress
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.views import View, static
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 # from rest_framework import generics
 from rest_framework.views import APIView
-from .serializers import SampleSerializer
+from .cache import CachedResponseMixin, is_shared
+from .fieldsets import SparseFieldsetMixin, project, requested_fields
+from .jobs import enqueue_on_commit
+from .pagination import IdCursorPagination, KeysetPagination
+from .parsers import NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer, StreamingRenderer
+from .serializers import SampleSerializer, ValuesSerializer
+from .signals import invalidate_on_write
 from .models import Sample
+from . import candidates, datasets, districts, metrics, prerender, search, tasks, thumbnails, warmup
 
 
 # Create your views here.
 
 
-class SampleViewSet(viewsets.ModelViewSet):
+class StreamingExportMixin:
+    """
+    Lets list() stream the whole result set when a line-oriented renderer
+    (``?format=ndjson`` or ``?format=csv``) is selected.
+    """
+    export_renderer_classes = [NDJSONRenderer, CSVRenderer]
+    export_chunk_size = 2000
+    export_filename = 'export'
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        return renderers + [_() for _ in self.export_renderer_classes]
+
+    def is_export(self, request):
+        return isinstance(getattr(request, 'accepted_renderer', None), StreamingRenderer)
+
+    def get_streaming_response(self, fields, rows):
+        """
+        Return a StreamingHttpResponse rendering ``rows``, an iterator of
+        tuples ordered like ``fields``.
+        """
+        renderer = self.request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(fields, rows),
+            content_type='{}; charset={}'.format(renderer.media_type, renderer.charset),
+        )
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(self.export_filename, renderer.format)
+        return response
+
+    def get_streaming_export(self, queryset):
+        """
+        Stream ``queryset`` through the regular serializer.
+        """
+        serializer = self.get_serializer()
+        fields = tuple(name for name, field in serializer.fields.items() if not field.write_only)
+
+        def rows():
+            for obj in queryset.iterator(chunk_size=self.export_chunk_size):
+                data = self.get_serializer(obj).data
+                yield tuple(data[_] for _ in fields)
+
+        return self.get_streaming_response(fields, rows())
+
+
+class ValuesListMixin(StreamingExportMixin):
+    """
+    Serve list() through ValuesSerializer whenever the serializer allows it,
+    falling back to the regular serializer otherwise.
+
+    Exports read the queryset through a server-side cursor in chunks of
+    ``export_chunk_size`` rows.
+    """
+
+    def get_pagination_keys(self):
+        ordering = getattr(self.paginator, 'ordering', None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        return tuple(_.lstrip('-') for _ in ordering)
+
+    def list(self, request, *args, **kwargs):
+        fields = self.get_sparse_fields() if hasattr(self, 'get_sparse_fields') else None
+        fast = ValuesSerializer.for_serializer(self.get_serializer_class(), fields)
+        if fast is None:
+            if self.is_export(request):
+                return self.get_streaming_export(self.filter_queryset(self.get_queryset()))
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.is_export(request):
+            rows = fast.values_list(queryset).iterator(chunk_size=self.export_chunk_size)
+            return self.get_streaming_response(fast.fields, rows)
+        page = self.paginate_queryset(fast.values(queryset, *self.get_pagination_keys()))
+        if page is not None:
+            return self.get_paginated_response(fast.to_representation(page))
+        return Response(fast.to_representation(fast.values_list(queryset)))
+
+
+class BulkModelMixin:
+    """
+    Adds a ``bulk`` route taking a JSON array or NDJSON body of items:
+    POST creates them, PUT and PATCH update them by ``id`` and DELETE deletes
+    them by ``id``.
+
+    A request is applied in a single transaction with one bulk query, and is
+    rejected as a whole, with the errors of each failing item listed by
+    index, if any item is invalid. Bulk queries send no model signals, so
+    cached responses are invalidated here.
+    """
+    bulk_lookup_field = 'id'
+
+    def get_bulk_max_batch_size(self):
+        return settings.API_BULK_MAX_BATCH_SIZE
+
+    def get_bulk_items(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Expected a list of items.']})
+        max_batch_size = self.get_bulk_max_batch_size()
+        if len(items) > max_batch_size:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                'Ensure this request has no more than {} items.'.format(max_batch_size)]})
+        return items
+
+    def get_bulk_error_response(self, errors):
+        # Depending on the DRF version, ListSerializer.errors is either a list
+        # aligned with the input or a dict keyed by the index of failing items.
+        items = sorted(errors.items()) if isinstance(errors, dict) else enumerate(errors)
+        return Response(
+            {'errors': [{'index': index, 'errors': error} for index, error in items if error]},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    def get_bulk_instances(self, items):
+        """
+        Return the instances ``items`` refer to, in order, and a list of
+        per-item lookup errors.
+        """
+        lookup = self.bulk_lookup_field
+        pk_field = self.get_queryset().model._meta.pk
+        errors = [{} for _ in items]
+        keys = []
+        seen = set()
+        for index, item in enumerate(items):
+            try:
+                key = pk_field.to_python(item[lookup])
+            except (KeyError, TypeError):
+                errors[index] = {lookup: ['This field is required.']}
+                key = None
+            except DjangoValidationError as exc:
+                errors[index] = {lookup: exc.messages}
+                key = None
+            if key is not None and key in seen:
+                errors[index] = {lookup: ['Duplicate item.']}
+            seen.add(key)
+            keys.append(key)
+
+        found = self.get_queryset().in_bulk([_ for _ in keys if _ is not None])
+        for index, key in enumerate(keys):
+            if key is not None and key not in found and not errors[index]:
+                errors[index] = {lookup: ['Not found.']}
+        return [found.get(_) for _ in keys], errors
+
+    @action(detail=False, methods=['post', 'put', 'patch', 'delete'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request, *args, **kwargs):
+        items = self.get_bulk_items(request)
+        with transaction.atomic():
+            if request.method == 'POST':
+                response = self.perform_bulk_create(items)
+            elif request.method == 'DELETE':
+                response = self.perform_bulk_destroy(items)
+            else:
+                response = self.perform_bulk_update(items, partial=request.method == 'PATCH')
+            if status.is_success(response.status_code):
+                invalidate_on_write(self.get_queryset().model)
+        return response
+
+    def perform_bulk_create(self, items):
+        serializer = self.get_serializer(data=items, many=True)
+        if not serializer.is_valid():
+            return self.get_bulk_error_response(serializer.errors)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def perform_bulk_update(self, items, partial=False):
+        instances, errors = self.get_bulk_instances(items)
+        if any(errors):
+            return self.get_bulk_error_response(errors)
+        serializer = self.get_serializer(instances, data=items, many=True, partial=partial)
+        if not serializer.is_valid():
+            return self.get_bulk_error_response(serializer.errors)
+        serializer.save()
+        return Response(serializer.data)
+
+    def perform_bulk_destroy(self, items):
+        instances, errors = self.get_bulk_instances(items)
+        if any(errors):
+            return self.get_bulk_error_response(errors)
+        deleted = self.get_queryset().filter(pk__in=[_.pk for _ in instances]).delete()[0]
+        return Response({'deleted': deleted})
+
+
+class WarmAfterWriteMixin:
+    """
+    Queues a background job fetching the ``warm_url_names`` routes again
+    after a successful write, so that their responses are cached before the
+    next readers ask for them rather than computed by the first of them.
+
+    Writes following each other while the job is waiting share it. The job
+    runs in the worker process, so it is only queued when the API cache is
+    shared with the web processes.
+    """
+    warm_url_names = ()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in SAFE_METHODS and status.is_success(response.status_code):
+            paths = [reverse(_) for _ in self.warm_url_names]
+            if paths and is_shared():
+                enqueue_on_commit(
+                    tasks.warm_responses, idempotency_key='warm:{}'.format(' '.join(paths)), paths=paths)
+        return response
+
+
+class SampleViewSet(WarmAfterWriteMixin, CachedResponseMixin, BulkModelMixin, ValuesListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     A sample model that is exposed using the REST API.
+
+    Lists are paginated by cursor over the primary key; ``?fields=`` limits
+    reads to the named fields. ``bulk/`` writes many samples per request.
+    ``?format=ndjson`` and ``?format=csv`` stream every sample. Reads are
+    cached until the next write, after which the first page of the list is
+    cached again in the background.
     """
     serializer_class = SampleSerializer
     queryset = Sample.objects.all()
+    pagination_class = IdCursorPagination
+    export_filename = 'samples'
+    warm_url_names = ('sample-list',)
 
 
 class SomeDataView(APIView):
@@ -24,36 +259,330 @@ class SomeDataView(APIView):
     Just some random data.
     """
 
+    @staticmethod
+    def get_data():
+        return {
+            'status': 'ok',
+            'somelist': ['foo', 'bar', 'baz', 42]
+        }
+
     def get(self, request, format=None):
         """
         Return a list of random data
         """
-        data = {
-            'status': 'ok',
-            'somelist': ['foo', 'bar', 'baz', 42]
-        }
-        return Response(data)
+        return Response(self.get_data())
 
 
-class BoulderCandidatesViewSet(viewsets.ViewSet):
+class BoulderCandidatesViewSet(StreamingExportMixin, viewsets.ViewSet):
     """
     Boulder city council candidates exposed via REST API.
+
+    The list is returned whole, in source order, unless ``?page_size=`` or
+    ``?cursor=`` asks for a page ordered by ``_id``. ``?fields=`` limits the
+    response to the named fields. ``?format=ndjson`` and ``?format=csv``
+    stream every candidate.
+
+    ``?race=`` keeps the candidates in one race and ``?modified_since=`` (a
+    millisecond timestamp or an ISO 8601 datetime) those modified at or after
+    that time.
+
+    ``search/?q=`` returns up to ``?limit=`` candidates whose names start with
+    every term of the query, tolerating typos, best matches first.
+
+    ``changes/?since=<version>`` returns the change log entries after a
+    version, for clients that keep a copy of the list.
     """
-    from .sample_data.boulder_city_council import data
-    candidates = [_['_source'] for _ in data['responses'][0]['hits']['hits']]
+    dataset = 'boulder_city_council'
+    pagination_class = KeysetPagination
+    export_filename = 'candidates'
+    search_max_limit = 100
+    changes_default_limit = 1000
+    changes_max_limit = 10000
 
-    def __init__(self, *args, **kwargs):
-        # Convert the timestamps from the Elasticsearch query
-        for candidate in self.candidates:
-            for date_attr in ('Created Date', 'Modified Date'):
-                candidate[date_attr + ' X'] = datetime.datetime.fromtimestamp(candidate[date_attr] / 1000.0)
-        super().__init__(*args, **kwargs)
+    @classmethod
+    def load_store(cls):
+        """
+        Return the store of ``dataset``, loading it on first use.
+        """
+        return datasets.registry.get(cls.dataset)
+
+    @property
+    def store(self):
+        return self.load_store()
+
+    def get_limit(self, request, default, maximum):
+        try:
+            limit = int(request.query_params.get('limit', default))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= maximum:
+            raise ValidationError({'limit': ['Ensure this value is between 1 and {}.'.format(maximum)]})
+        return limit
+
+    def get_change_log(self):
+        return self.store.change_log
+
+    def get_modified_since(self, request):
+        modified_since = request.query_params.get('modified_since')
+        if modified_since is not None:
+            modified_since = candidates.parse_timestamp(modified_since)
+            if modified_since is None:
+                raise ValidationError({'modified_since': [
+                    'Expected a millisecond timestamp or an ISO 8601 datetime.']})
+        return modified_since
+
+    def get_store(self, request):
+        """
+        Return the store of the candidates selected by the ``race`` and
+        ``modified_since`` query parameters.
+        """
+        return self.store.filter(
+            race=request.query_params.get('race'), modified_since=self.get_modified_since(request))
 
     def list(self, request):
-        return Response(self.candidates)
+        fields = requested_fields(request, self.store.fields)
+        store = self.get_store(request)
+        if self.is_export(request):
+            fields = fields or self.store.columns
+            return self.get_streaming_response(fields, (tuple(_.get(f) for f in fields) for _ in store))
+        paginator = self.pagination_class()
+        paginate = paginator.is_requested(request)
+        # Only the whole list and the per-race lists are kept pre-rendered.
+        prerendered = 'modified_since' not in request.query_params
+        if fields is None and not paginate and prerendered and request.accepted_renderer.format == 'json':
+            return store.rendered_list().response(request)
+        records = paginator.paginate_keyset(store, request) if paginate else store.candidates
+        if fields is not None:
+            records = [project(_, fields) for _ in records]
+        if paginate:
+            return paginator.get_paginated_response(records)
+        return Response(records)
 
     def retrieve(self, request, pk=None):
-        candidate = next((_ for _ in self.candidates if _['_id'] == pk), None)
+        fields = requested_fields(request, self.store.fields)
+        candidate = self.store.get(pk)
         if candidate is None:
             return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        if fields is not None:
+            return Response(project(candidate, fields))
+        if request.accepted_renderer.format == 'json':
+            return self.store.rendered(pk).response(request)
         return Response(candidate)
+
+    @action(detail=False)
+    def search(self, request):
+        fields = requested_fields(request, self.store.fields)
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': ['This query parameter is required.']})
+        limit = self.get_limit(request, search.DEFAULT_LIMIT, self.search_max_limit)
+        modified_since = self.get_modified_since(request)
+        store = self.store.filter(race=request.query_params.get('race'))
+        records = store.search(query, limit, modified_since)
+        if fields is not None:
+            records = [project(_, fields) for _ in records]
+        return Response(records)
+
+    @action(detail=False)
+    def changes(self, request):
+        """
+        Return ``{"since", "version", "more", "changes"}``: the entries after
+        version ``since``, oldest first. ``version`` is the value to pass as
+        ``since`` next time; ``more`` is true if entries were left out by
+        ``?limit=``. Versions the log does not know, e.g. from a process that
+        started with other data, get a 410, after which the client reloads
+        the whole list.
+        """
+        since = request.query_params.get('since', '0')
+        limit = self.get_limit(request, self.changes_default_limit, self.changes_max_limit)
+        log = self.get_change_log()
+        latest = log.latest
+        try:
+            seq = log.parse_version(since)
+        except ValueError:
+            raise ValidationError({'since': ['Expected a version returned by this endpoint, or 0.']})
+        if seq is None:
+            # From another copy of the log, e.g. before a restart with new data.
+            return Response({'detail': 'Unknown version; reload the full list.'}, status=status.HTTP_410_GONE)
+        entries = log.after(seq, limit)
+        if len(entries) == limit:
+            seq = entries[-1]['seq']
+        else:
+            seq = max([latest] + [_['seq'] for _ in entries[-1:]])
+        return Response(OrderedDict([
+            ('since', since),
+            ('version', log.format_version(seq)),
+            ('more', seq < latest),
+            ('changes', entries),
+        ]))
+
+
+class DistrictsUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Ballot lookups are not available.'
+    default_code = 'districts_unavailable'
+
+
+class BallotView(APIView):
+    """
+    What is on the ballot at a point.
+
+    GET ``?lat=&lon=`` returns the districts containing the point and the
+    races on their ballots, with their candidates; ``?fields=`` limits the
+    candidates to the named fields.
+
+    POST ``{"points": [{"lat": ..., "lon": ...}, ...]}`` looks many points up
+    at once and returns, for each, the ids of its districts and races.
+    """
+    candidates_view = BoulderCandidatesViewSet
+
+    def get_index(self):
+        """
+        Return the DistrictIndex; the endpoint is unavailable until
+        API_DISTRICTS_FILE is set.
+        """
+        if not settings.API_DISTRICTS_FILE:
+            raise DistrictsUnavailable()
+        return districts.get_index()
+
+    def get_point(self, data):
+        """
+        Return (lon, lat) from ``data``, or raise ValidationError.
+        """
+        point = {}
+        errors = {}
+        for name, bound in (('lat', 90), ('lon', 180)):
+            try:
+                point[name] = float(data[name])
+            except (KeyError, TypeError, ValueError):
+                point[name] = None
+            if point[name] is None or not -bound <= point[name] <= bound:
+                errors[name] = ['A number between -{0} and {0} is required.'.format(bound)]
+        if errors:
+            raise ValidationError(errors)
+        return point['lon'], point['lat']
+
+    @staticmethod
+    def get_races(found):
+        """
+        Return the races of the districts ``found``, in order, and the ids of
+        the districts each race is on the ballot of.
+        """
+        races = OrderedDict()
+        for district in found:
+            for race in district.races:
+                races.setdefault(race, []).append(district.id)
+        return races
+
+    def get(self, request, format=None):
+        lon, lat = self.get_point(request.query_params)
+        store = self.candidates_view.load_store()
+        fields = requested_fields(request, store.fields)
+        found = self.get_index().lookup(lon, lat)
+        races = []
+        for race, race_districts in self.get_races(found).items():
+            records = store.for_race(race).candidates
+            if fields is not None:
+                records = [project(_, fields) for _ in records]
+            races.append(OrderedDict([('id', race), ('districts', race_districts), ('candidates', records)]))
+        return Response(OrderedDict([
+            ('lat', lat),
+            ('lon', lon),
+            ('districts', [OrderedDict([('id', _.id), ('name', _.name)]) for _ in found]),
+            ('races', races),
+        ]))
+
+    def post(self, request, format=None):
+        points = request.data.get('points') if isinstance(request.data, dict) else None
+        if not isinstance(points, list):
+            raise ValidationError({'points': ['Expected a list of points.']})
+        if len(points) > settings.API_BULK_MAX_BATCH_SIZE:
+            raise ValidationError({'points': [
+                'Ensure this request has no more than {} points.'.format(settings.API_BULK_MAX_BATCH_SIZE)]})
+        parsed = []
+        errors = []
+        for index, point in enumerate(points):
+            try:
+                parsed.append(self.get_point(point if isinstance(point, dict) else {}))
+            except ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        results = [
+            OrderedDict([('districts', [_.id for _ in found]), ('races', list(self.get_races(found)))])
+            for found in self.get_index().lookup_many(parsed)
+        ]
+        return Response({'results': results})
+
+
+class PrerenderedTemplateView(View):
+    """
+    Serve a page that does not depend on the request, e.g. the frontend shell,
+    from bytes rendered once per process, with an ETag and precompressed
+    variants.
+
+    Browsers revalidate the page on every visit, so a deploy shows at once,
+    while the hashed assets it links to stay cached. With DEBUG the template
+    is rendered on every request.
+    """
+    template_name = None
+    _rendered = {}
+
+    def get_rendered(self):
+        if settings.DEBUG:
+            return prerender.RenderedTemplate(self.template_name)
+        rendered = self._rendered.get(self.template_name)
+        if rendered is None:
+            rendered = self._rendered[self.template_name] = prerender.RenderedTemplate(self.template_name)
+        return rendered
+
+    def get(self, request, *args, **kwargs):
+        response = self.get_rendered().response(request)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+def serve_thumbnail(request, path):
+    """
+    Serve a generated thumbnail from API_THUMBNAIL_ROOT in development, where
+    nginx does not.
+    Thumbnail names change with their source, so they can be cached forever.
+    """
+    response = static.serve(request, path, document_root=settings.API_THUMBNAIL_ROOT)
+    patch_cache_control(response, public=True, max_age=thumbnails.IMMUTABLE_MAX_AGE, immutable=True)
+    return response
+
+
+def metrics_allowed(request):
+    """
+    Whether ``request`` comes from API_METRICS_ALLOWED_IPS or carries the
+    API_METRICS_TOKEN.
+    """
+    token = settings.API_METRICS_TOKEN
+    if token and constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer ' + token):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(_, strict=False) for _ in settings.API_METRICS_ALLOWED_IPS)
+
+
+def metrics_view(request):
+    """
+    Expose the metrics in the Prometheus text format: those of every process
+    publishing to API_METRICS_DIR, or of this one.
+    """
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.REGISTRY.expose(settings.API_METRICS_DIR), content_type=metrics.CONTENT_TYPE)
+
+
+def readiness_view(request):
+    """
+    Answer 200 once this process has warmed up (see api.warmup), 503 before.
+    """
+    ready = warmup.is_ready()
+    response = JsonResponse({'status': 'ready' if ready else 'warming up'}, status=200 if ready else 503)
+    patch_cache_control(response, no_store=True)
+    return response
@@ -0,0 +1,155 @@
+"""
+Cache warming.
+
+A fresh process pays on its first requests for loading the datasets,
+building the candidate indexes, resolving URLs, connecting to the database
+and filling the response caches. ``warm_up()`` does all of that ahead of
+time, step by step:
+
+- ``preload()`` loads every dataset and the districts, if configured, and
+  builds the indexes and pre-rendered payloads of the candidate stores (done
+  in the gunicorn master before forking, see ``gunicorn.conf.py``),
+- ``connect()`` opens the database connections of this thread,
+- ``warm(paths)`` GETs the API_WARMUP_ROUTES through the whole Django stack,
+  in process, which caches their responses. They are not throttled.
+
+Cached responses are keyed by absolute URL, so the requests are made for
+API_WARMUP_ORIGIN, the scheme and host clients use. They fill the cache of
+other processes too when it is shared (see API_CACHE_BACKEND).
+
+While ``warm_up()`` runs, ``is_ready()`` is false and ``/healthz/ready``
+answers 503, so load balancers keep traffic away from the process.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from . import districts
+from .candidates import CandidateStore
+from .datasets import registry
+from .throttling import EXEMPT_KEY
+
+
+logger = logging.getLogger(__name__)
+
+# Cleared while warming up
+_ready = threading.Event()
+_ready.set()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def warmup_origin():
+    """
+    Return (scheme, host) of the requests made by ``warm``.
+    """
+    if settings.API_WARMUP_ORIGIN:
+        origin = urlsplit(settings.API_WARMUP_ORIGIN)
+        return origin.scheme, origin.netloc
+    hosts = [_.lstrip('.') for _ in settings.ALLOWED_HOSTS if _ != '*']
+    return 'http', hosts[0] if hosts else 'localhost'
+
+
+def warm(paths):
+    """
+    GET every path in ``paths``; return {path: status code}.
+    """
+    scheme, host = warmup_origin()
+    client = Client(raise_request_exception=False, HTTP_HOST=host, HTTP_ACCEPT='application/json',
+                    **{EXEMPT_KEY: True})
+    statuses = {}
+    for path in paths:
+        response = client.get(path, secure=scheme == 'https')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        statuses[path] = response.status_code
+    return statuses
+
+
+def preload():
+    """
+    Load every dataset and the districts, and build what the candidate
+    stores build on first use.
+    """
+    if settings.API_DISTRICTS_FILE:
+        districts.get_index()
+    for name in registry.names():
+        store = registry.get(name)
+        if isinstance(store, CandidateStore):
+            store.search_index
+            store.change_log
+            store.rendered_list()
+
+
+def connect():
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def warm_routes(route_names=None):
+    """
+    Warm the responses of ``route_names`` (default: API_WARMUP_ROUTES); log
+    the failing ones.
+    """
+    if route_names is None:
+        route_names = settings.API_WARMUP_ROUTES
+    statuses = warm([reverse(_) for _ in route_names])
+    for path, code in statuses.items():
+        if code != 200:
+            logger.warning('Warming %s returned %d', path, code)
+    return statuses
+
+
+def warm_up(connect_db=True, route_names=None):
+    """
+    Run every warm-up step in this thread; return {step: seconds}.
+
+    A failing step is logged and the others still run: a process that could
+    not warm up entirely is better than one that never reports ready.
+    """
+    steps = [('preload', preload)]
+    if connect_db:
+        steps.append(('connect', connect))
+    steps.append(('responses', lambda: warm_routes(route_names)))
+
+    _ready.clear()
+    timings = OrderedDict()
+    try:
+        for name, step in steps:
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception:
+                logger.exception('Warm-up step %s failed', name)
+            timings[name] = time.perf_counter() - start
+    finally:
+        _ready.set()
+    logger.info('Warmed up in %.2fs', sum(timings.values()))
+    return timings
+
+
+def warm_up_in_background():
+    """
+    Warm up in a thread, reporting not ready until it is done.
+    """
+    def run():
+        # Started from AppConfig.ready(), before every app is.
+        while not apps.ready:
+            time.sleep(0.01)
+        try:
+            # Connections belong to threads, opening this one's is useless.
+            warm_up(connect_db=False)
+        finally:
+            connections.close_all()
+    _ready.clear()
+    threading.Thread(target=run, name='warm-up', daemon=True).start()
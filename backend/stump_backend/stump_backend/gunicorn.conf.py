@@ -0,0 +1,65 @@
+"""
+Gunicorn settings, read from the directory gunicorn runs in.
+
+The application and every dataset in api.datasets are loaded once in the
+master process, before the workers are forked, so workers start quickly and
+share that memory copy-on-write. Set GUNICORN_PRELOAD=0 to load the
+application in each worker instead, e.g. to reload code with --reload.
+
+Each worker then warms up (see api.warmup) before it accepts requests, so
+that after a deploy no request hits a cold worker. Warming up must finish
+within the worker --timeout.
+
+Workers publish their metrics to API_METRICS_DIR (a temporary directory
+unless set), so that /metrics reports the totals of every worker. When a
+worker exits, the master adds its metrics to those of the workers that exited
+before and removes its file.
+"""
+import gc
+import os
+import tempfile
+
+preload_app = bool(int(os.environ.get('GUNICORN_PRELOAD', 1)))
+
+# Warm up in post_worker_init rather than in a thread of each worker.
+os.environ['API_WARMUP_ON_START'] = '0'
+
+if not os.environ.get('API_METRICS_DIR'):
+    os.environ['API_METRICS_DIR'] = tempfile.mkdtemp(prefix='stump-metrics-')
+
+
+def on_starting(server):
+    # Metrics start over with the server.
+    directory = os.environ['API_METRICS_DIR']
+    for name in os.listdir(directory):
+        if name.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directory, name))
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from api import warmup
+    warmup.preload()
+    # Move everything allocated so far out of the collector's reach, so that
+    # garbage collection in the workers does not write to (and so copy) the
+    # shared pages. gc.freeze() is new in Python 3.7.
+    if hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    from api import warmup
+    warmup.warm_up()
+
+
+def worker_exit(server, worker):
+    from api import metrics
+    metrics.REGISTRY.publish(os.environ['API_METRICS_DIR'], interval=0)
+
+
+def child_exit(server, worker):
+    # In the master, once the worker is gone, even if it was killed.
+    from api import metrics
+    metrics.retire(os.environ['API_METRICS_DIR'], worker.pid)
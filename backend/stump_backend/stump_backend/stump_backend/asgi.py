@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stump_backend.settings')
+# Serve the read endpoints with the async views (see api.async_views).
+os.environ.setdefault('API_ASYNC_VIEWS', '1')
+# Warm up before reporting ready (see api.warmup).
+os.environ.setdefault('API_WARMUP_ON_START', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,25 @@
+"""
+Database backends that wrap Django's own to record how long it takes to
+obtain a connection (see ``api.metrics.db_connection_setup_seconds``).
+
+Use them through ``ENGINE``, e.g. ``stump_backend.db_backends.postgresql``.
+"""
+import time
+
+from api.metrics import db_connection_setup_seconds
+
+
+class TimedConnectionMixin:
+    """
+    DatabaseWrapper mixin timing get_new_connection().
+
+    With persistent connections this only runs when a connection is opened or
+    replaced; with a connection pool it measures the pool checkout.
+    """
+
+    def get_new_connection(self, conn_params):
+        start = time.perf_counter()
+        try:
+            return super().get_new_connection(conn_params)
+        finally:
+            db_connection_setup_seconds.observe(time.perf_counter() - start, alias=self.alias, vendor=self.vendor)
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 
+import django
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -42,13 +44,14 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'corsheaders',
     'rest_framework',
-    'api',
+    'api.apps.ApiConfig',
 ]
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.instrumentation.InstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,21 +82,151 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'stump_backend.wsgi.application'
 
+# Serve the read endpoints with async views (see api.async_views). Turned on by
+# stump_backend.asgi; needs Django >= 3.1, and >= 4.1 for the async ORM.
+API_ASYNC_VIEWS = bool(int(os.environ.get('API_ASYNC_VIEWS', 0)))
+
+# Request metrics (see api.instrumentation), exposed at /metrics. Requests
+# running more than API_QUERY_COUNT_WARNING database queries are logged as a
+# warning (0 turns the warning off).
+API_QUERY_COUNT_WARNING = int(os.environ.get('API_QUERY_COUNT_WARNING', 20))
+# Directory where each process publishes its metrics for /metrics to add up
+# (see api.metrics); gunicorn.conf.py sets up one for the workers. Empty keeps
+# the metrics of each process to itself.
+API_METRICS_DIR = os.environ.get('API_METRICS_DIR', '')
+# /metrics answers the addresses or networks in API_METRICS_ALLOWED_IPS, and
+# requests with an "Authorization: Bearer <API_METRICS_TOKEN>" header.
+API_METRICS_ALLOWED_IPS = os.environ.get('API_METRICS_ALLOWED_IPS', '127.0.0.1 ::1').split()
+API_METRICS_TOKEN = os.environ.get('API_METRICS_TOKEN', '')
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.TokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        # Requests per client IP address, as a burst and a sustained rate
+        # (see api.throttling). Off unless API_THROTTLE_RATE is set: clients
+        # are only told apart with API_NUM_PROXIES right for the deployment
+        # (behind Heroku's router they all share its address), and only share
+        # their buckets across workers with a shared API cache.
+        'client': os.environ.get('API_THROTTLE_RATE') or None,
+    },
+    # Proxies in front of the app (nginx) whose X-Forwarded-For is trusted;
+    # 0 identifies clients by their address, which they cannot spoof
+    'NUM_PROXIES': int(os.environ.get('API_NUM_PROXIES', 0)),
+}
+
+# Maximum number of items accepted by one request to a bulk endpoint
+API_BULK_MAX_BATCH_SIZE = int(os.environ.get('API_BULK_MAX_BATCH_SIZE', 1000))
+# GeoJSON of the districts the ballot endpoint looks points up in (see
+# api.districts); the endpoint answers 503 until it is set.
+# api/sample_data/districts/boulder.json is an approximate outline for trying
+# it out, not for production.
+API_DISTRICTS_FILE = os.environ.get('API_DISTRICTS_FILE', '')
+
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# Connections are kept open for DB_CONN_MAX_AGE seconds (0 closes them after
+# every request) and, with DB_CONN_HEALTH_CHECKS=1, checked before being reused
+# by a new request (Django >= 4.1).
+#
+# DB_POOL_MAX_SIZE > 0 switches to an in-process connection pool instead, which
+# suits the ASGI deployment where requests do not own a thread (Django >= 5.1
+# with psycopg 3; persistent connections are turned off, the pool keeps them).
+
 DATABASES = {
     'default': {
-        'ENGINE': os.environ.get('DB_ENGINE', 'django.db.backends.postgresql'),
+        'ENGINE': os.environ.get('DB_ENGINE', 'stump_backend.db_backends.postgresql'),
         'NAME': os.environ.get('DB_NAME', 'stump_dev'),
         'USER': os.environ.get('DB_USER', 'stump_dev'),
         'PASSWORD': os.environ.get('DB_PASSWORD', 'stump_dev'),
         'HOST': os.environ.get('DB_HOST', 'postgres'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': bool(int(os.environ.get('DB_CONN_HEALTH_CHECKS', 1))),
     }
 }
 
+# The type of implicit primary keys on Django >= 3.2, as in the migrations
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+if DB_POOL_MAX_SIZE > 0:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        },
+    }
+
+
+# Caches
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# API responses are cached in the 'api' cache. The default local-memory cache
+# is a per-process LRU; to share entries (and invalidations) between gunicorn
+# workers set API_CACHE_BACKEND to 'file' (API_CACHE_LOCATION is a directory)
+# or 'redis' (API_CACHE_LOCATION is a redis:// URL, Django >= 4.0), or to the
+# dotted path of any other cache backend.
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+
+API_CACHE_ALIAS = 'api'
+API_CACHE_BACKEND = CACHE_BACKENDS.get(os.environ.get('API_CACHE_BACKEND', 'locmem'),
+                                       os.environ.get('API_CACHE_BACKEND'))
+API_CACHE_TIMEOUT = int(os.environ.get('API_CACHE_TIMEOUT', 300))
+# Seconds a request waits for a concurrent one computing the same response
+API_CACHE_FILL_TIMEOUT = int(os.environ.get('API_CACHE_FILL_TIMEOUT', 10))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    API_CACHE_ALIAS: {
+        'BACKEND': API_CACHE_BACKEND,
+        'LOCATION': os.environ.get('API_CACHE_LOCATION', 'stump-api'),
+        'TIMEOUT': API_CACHE_TIMEOUT,
+    },
+}
+if API_CACHE_BACKEND != CACHE_BACKENDS['redis']:
+    # Redis evicts on its own (maxmemory-policy); the other backends cull
+    # once they hold this many entries.
+    CACHES[API_CACHE_ALIAS]['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.environ.get('API_CACHE_MAX_ENTRIES', 10000)),
+    }
+
+# The throttles' token buckets are kept in the API cache, so the workers share
+# them unless it is the local-memory one.
+API_THROTTLE_CACHE_ALIAS = API_CACHE_ALIAS
+
+# Warm-up (see api.warmup)
+# With API_WARMUP_ON_START=1 (the default of stump_backend.wsgi and .asgi) a
+# process loads the datasets, builds the indexes and caches the responses of
+# the API_WARMUP_ROUTES when it starts, and reports ready at /healthz/ready
+# once done. Under gunicorn, gunicorn.conf.py does this before each worker
+# accepts requests instead. API_WARMUP_ORIGIN is the scheme and host (e.g.
+# https://example.org) clients request the API at, so the warmed responses are
+# cached under the keys their requests look up; it defaults to http:// and
+# the first of ALLOWED_HOSTS.
+API_WARMUP_ON_START = bool(int(os.environ.get('API_WARMUP_ON_START', 0)))
+API_WARMUP_ROUTES = os.environ.get('API_WARMUP_ROUTES', 'home sample-list candidate-list somedata').split()
+API_WARMUP_ORIGIN = os.environ.get('API_WARMUP_ORIGIN', '')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -149,6 +282,43 @@ STATICFILES_DIRS = (
 # Whitenoise configuration
 # Simplified static file serving.
 # https://warehouse.python.org/project/whitenoise/
+# collectstatic adds a content hash to file names and writes .gz and .br
+# copies next to them. Hashed files are served with immutable, year-long cache
+# headers (by nginx in production); the rest, e.g. robots.txt, are cached for
+# WHITENOISE_MAX_AGE seconds.
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+if django.VERSION >= (4, 2):
+    # Replaced by STORAGES, which may not be set together with it.
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': STATICFILES_STORAGE},
+    }
+    del STATICFILES_STORAGE
 WHITENOISE_ROOT = os.path.join(BASE_DIR, "static", "public")
-WHITENOISE_MAX_AGE = 60  # http://whitenoise.evans.io/en/stable/django.html#WHITENOISE_MAX_AGE
+# http://whitenoise.evans.io/en/stable/django.html#WHITENOISE_MAX_AGE
+WHITENOISE_MAX_AGE = int(os.environ.get('WHITENOISE_MAX_AGE', 60))
+
+# Candidate photo thumbnails
+# manage.py generate_thumbnails writes them to API_THUMBNAIL_ROOT, served at
+# API_THUMBNAIL_URL by nginx (or by Django when DEBUG is on) with immutable
+# cache headers. API_THUMBNAIL_STORAGE may name another storage class to use
+# instead. Photos are only fetched over http(s), from API_THUMBNAIL_SOURCE_HOSTS
+# if set.
+API_THUMBNAIL_ROOT = os.environ.get('API_THUMBNAIL_ROOT', os.path.join(BASE_DIR, os.path.pardir, 'thumbnails'))
+API_THUMBNAIL_URL = os.environ.get('API_THUMBNAIL_URL', '/thumbnails/')
+API_THUMBNAIL_STORAGE = os.environ.get('API_THUMBNAIL_STORAGE', '')
+API_THUMBNAIL_SOURCE_HOSTS = [_ for _ in os.environ.get('API_THUMBNAIL_SOURCE_HOSTS', '').split(',') if _]
+API_THUMBNAIL_SIZES = (96, 192, 384)
+API_THUMBNAIL_FORMATS = ('webp', 'jpeg')
+
+# Background jobs
+# Run by manage.py run_worker (see api.jobs). A failing job is retried after
+# API_JOB_BACKOFF_BASE seconds, doubling up to API_JOB_BACKOFF_MAX, until it
+# has been tried API_JOB_MAX_ATTEMPTS times. A running job whose worker has not
+# renewed its lease for API_JOB_LEASE seconds is considered abandoned. Finished
+# jobs are deleted after API_JOB_RETENTION seconds.
+API_JOB_MAX_ATTEMPTS = int(os.environ.get('API_JOB_MAX_ATTEMPTS', 5))
+API_JOB_BACKOFF_BASE = int(os.environ.get('API_JOB_BACKOFF_BASE', 10))
+API_JOB_BACKOFF_MAX = int(os.environ.get('API_JOB_BACKOFF_MAX', 3600))
+API_JOB_LEASE = int(os.environ.get('API_JOB_LEASE', 300))
+API_JOB_RETENTION = int(os.environ.get('API_JOB_RETENTION', 7 * 24 * 3600))
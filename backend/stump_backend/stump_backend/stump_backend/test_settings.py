@@ -4,7 +4,7 @@ DEBUG = True
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'stump_backend.db_backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     }
 }
@@ -32,3 +32,8 @@ else:
         # '--cover-package=api',
         # '--with-coverage',
     ]
+
+API_DISTRICTS_FILE = os.path.join(BASE_DIR, 'api', 'sample_data', 'districts', 'boulder.json')
+
+# Tests that throttle set their own rate
+REST_FRAMEWORK = dict(REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={'client': None})
@@ -13,12 +13,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from api.views import PrerenderedTemplateView, metrics_view, readiness_view, serve_thumbnail
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
-from django.views.generic import TemplateView
+from django.urls import path, include, re_path
 
 urlpatterns = [
-    path('', TemplateView.as_view(template_name='index.html'), name='home'),
+    path('', PrerenderedTemplateView.as_view(template_name='index.html'), name='home'),
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('healthz/ready', readiness_view, name='ready'),
 ]
+
+if settings.DEBUG:
+    # nginx serves them in production
+    urlpatterns.append(re_path(r'^thumbnails/(?P<path>.+)$', serve_thumbnail, name='thumbnail'))
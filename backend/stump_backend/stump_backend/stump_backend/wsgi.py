@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stump_backend.settings')
+# Warm up before reporting ready (see api.warmup).
+os.environ.setdefault('API_WARMUP_ON_START', '1')
 
 application = get_wsgi_application()